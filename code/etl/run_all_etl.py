@@ -6,6 +6,7 @@ Inputs:
 
 Outputs:
 - a database filled with cleaned tables in common schema
+- static feature tables in features schema
 '''
 
 import etl.uploaders.create_schemas as create_schemas
@@ -13,6 +14,7 @@ import etl.uploaders.load_lookuptables as load_lookuptables
 import etl.uploaders.load_noble as load_noble
 import etl.uploaders.load_kippnj as load_kippnj
 import etl.uploaders.combine_common as combine_common
+import etl.uploaders.materialize_features as materialize_features
 
 def main():
 
@@ -29,5 +31,8 @@ def main():
 	# Step 3: Combine all partners' data in common schema
 	combine_common.main()
 
+	# Step 4: Materialize the unbounded features into the features schema
+	materialize_features.main()
+
 if __name__ == '__main__':
 	main()
\ No newline at end of file
@@ -0,0 +1,121 @@
+''' Export every table of the common and features schemas to columnar (Parquet) files, so that modeling runs
+can use the in-process analytical engine of util/embedded_engine.py instead of a Postgres server.
+Requires the optional duckdb package (0.2.9 is the last release for Python 2.7).
+
+Outputs:
+- [DATA_PATH]/columnar/<schema>/<table>.parquet for every table
+- [DATA_PATH]/columnar/manifest.json, which lists the exported tables with their row counts and column types, and the export time.
+  FeatureCache uses it to tell exports apart (see EmbeddedConnection.data_version).
+'''
+
+import os
+import json
+import time
+import pandas as pd
+from config import DATA_PATH
+from util import cred # load SQL credentials
+from util.SQL_helpers import connect_to_db, read_sql_copy
+from util.embedded_engine import MANIFEST, table_path
+
+EXPORT_FOLDER = os.path.join(DATA_PATH, 'columnar')
+EXPORT_SCHEMAS = ['common', 'features']
+
+# Postgres data type (as in information_schema.columns) -> DuckDB type of the exported column
+DUCKDB_TYPES = {
+	'smallint': 'SMALLINT',
+	'integer': 'INTEGER',
+	'bigint': 'BIGINT',
+	'boolean': 'BOOLEAN',
+	'real': 'DOUBLE',
+	'double precision': 'DOUBLE',
+	'numeric': 'DOUBLE',
+	'date': 'DATE',
+	'timestamp without time zone': 'TIMESTAMP',
+	'timestamp with time zone': 'TIMESTAMP',
+	'character': 'VARCHAR',
+	'character varying': 'VARCHAR',
+	'text': 'VARCHAR',
+	'json': 'VARCHAR',
+	'interval': 'VARCHAR',
+	'time without time zone': 'VARCHAR',
+}
+
+def schema_tables(cur, schema):
+	''' Returns the names of all tables in schema '''
+
+	cur.execute('''select table_name from information_schema.tables
+				   where table_schema = %s and table_type = 'BASE TABLE'
+				   order by table_name;''', (schema,))
+	return [row[0] for row in cur.fetchall()]
+
+def table_columns(cur, schema, table):
+	''' Returns the (name, DuckDB type) of every column of schema.table, in order '''
+
+	cur.execute('''select column_name, data_type from information_schema.columns
+				   where table_schema = %s and table_name = %s
+				   order by ordinal_position;''', (schema, table))
+	columns = cur.fetchall()
+	for name, data_type in columns:
+		if data_type not in DUCKDB_TYPES:
+			raise ValueError("Column %s of %s.%s has the type %s, which has no DuckDB type in DUCKDB_TYPES" %(
+							 name, schema, table, data_type))
+	return [(name, DUCKDB_TYPES[data_type]) for name, data_type in columns]
+
+def exportable(rows, columns):
+	''' The rows as read by read_sql_copy, with every column in a dtype that DuckDB reads as its type:
+		nullable booleans become floats, dates timestamps and everything of VARCHAR type strings '''
+
+	rows = rows.copy()
+	for name, duckdb_type in columns:
+		values = rows[name]
+		if duckdb_type == 'BOOLEAN' and values.dtype == object:
+			rows[name] = values.map({True: 1.0, False: 0.0})
+		elif duckdb_type == 'DATE':
+			rows[name] = pd.to_datetime(values)
+		elif duckdb_type == 'VARCHAR':
+			# DuckDB takes the UTF-8 encoded strings of Python 2, not unicode objects
+			rows[name] = values.map(lambda v: v.encode('utf-8') if isinstance(v, unicode) else str(v), na_action='ignore')
+	return rows
+
+def write_parquet(engine, rows, columns, path):
+	''' Write rows (as read by read_sql_copy) to a Parquet file at path with DuckDB, every column cast to
+		its type in columns (a list of (name, DuckDB type), see table_columns) '''
+
+	engine.register('export_rows', exportable(rows, columns))
+	try:
+		engine.execute("copy (select %s from export_rows) to '%s' (format parquet)" %(
+					   ', '.join('cast("%s" as %s) as "%s"' %(name, duckdb_type, name) for name, duckdb_type in columns), path))
+	finally:
+		engine.unregister('export_rows')
+
+def main(folder=EXPORT_FOLDER):
+
+	import duckdb # optional dependency, only needed for the embedded engine
+
+	# the tables are read from Postgres with read_sql_copy, and written by DuckDB with the types of DUCKDB_TYPES,
+	# so that e.g. nullable integers and booleans stay typed in the Parquet files
+	engine = duckdb.connect()
+	manifest = {'exported_at': time.strftime('%Y-%m-%d %H:%M:%S'), 'schemas': {}}
+
+	with connect_to_db(cred.host, cred.user, cred.pw, cred.dbname) as conn: # use context managed db connection
+		with conn.cursor() as cur:
+
+			for schema in EXPORT_SCHEMAS:
+				manifest['schemas'][schema] = {}
+				if not os.path.isdir(os.path.join(folder, schema)):
+					os.makedirs(os.path.join(folder, schema))
+
+				for table in schema_tables(cur, schema):
+					columns = table_columns(cur, schema, table)
+					rows = read_sql_copy('select * from %s.%s' %(schema, table), conn)
+					write_parquet(engine, rows, columns, table_path(folder, schema, table))
+
+					manifest['schemas'][schema][table] = {'rows': len(rows), 'columns': columns}
+					print 'Exported table: %s.%s (%d rows)' %(schema, table, len(rows))
+
+	with open(os.path.join(folder, MANIFEST), 'w') as f:
+		json.dump(manifest, f, indent=2)
+	engine.close()
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,91 @@
+''' Materialize every feature in all_features.py that has no date bound into wide tables of the features schema,
+one column per feature, so that modeling runs can read them with a single indexed join per table.
+
+Outputs:
+- features.student_static, features.college_static and features.enrollment_static, indexed on their id
+- features.static_columns, which records the table, column and query hash of every materialized feature.
+  A dataloader with static_features only reads columns whose feature query has not changed since.
+'''
+
+import inspect
+from collections import OrderedDict
+from util import cred # load SQL credentials
+from util.SQL_helpers import connect_to_db, create_temp_tables
+import modeling.features.all_features as all_features
+from modeling.featurepipeline.abstractfeature import AbstractFeature, sql_column
+from modeling.featurepipeline.abstractboundedfeature import AbstractBoundedFeature
+from modeling.featurepipeline.dataloader import shared_tables
+
+# index level -> static table
+STATIC_TABLES = OrderedDict([('studentid', 'features.student_static'),
+							 ('collegeid', 'features.college_static'),
+							 ('enrollid', 'features.enrollment_static')])
+
+def static_features():
+	''' Returns instances of all unbounded (non-pandas) features in all_features.py, by index level '''
+
+	features = OrderedDict((level, []) for level in STATIC_TABLES)
+	for name, cls in inspect.getmembers(all_features, inspect.isclass):
+		if cls.__module__ != all_features.__name__ or not issubclass(cls, AbstractFeature) or issubclass(cls, AbstractBoundedFeature):
+			continue
+
+		feature = cls()
+		# the static tables are indexed by the index level, so the feature needs to be indexed by it as well
+		if feature.index_level not in features or feature.index_col != feature.index_level:
+			print 'Not materializing %s: it is not indexed by its index level' %(name)
+		elif feature.feature_col in [f.feature_col for f in features[feature.index_level]]:
+			print 'Not materializing %s: another feature already has the column %s' %(name, feature.feature_col)
+		else:
+			features[feature.index_level].append(feature)
+
+	return features
+
+def static_table_query(level, features):
+	''' Returns the select statement for the static table of one index level: the ids of all features,
+		with every feature's column left joined on '''
+
+	ids = '\n\t\tunion\n\t\t'.join('select %s from (%s) as i%d' %(level, f.generate_query(), i) for i,f in enumerate(features))
+
+	query = 'select ids.%s, %s\nfrom (\n\t\t%s\n\t) as ids\n' %(level, ', '.join('f%d.%s' %(i, sql_column(f.feature_col)) for i,f in enumerate(features)), ids)
+	for i, feature in enumerate(features):
+		query += 'left join (%s) as f%d\n\ton ids.%s = f%d.%s\n' %(feature.generate_query(), i, level, i, level)
+
+	return query
+
+def main():
+
+	features = static_features()
+
+	with connect_to_db(cred.host, cred.user, cred.pw, cred.dbname) as conn: # use context managed db connection
+
+		conn.cursor().execute('set search_path to common')
+		create_temp_tables(conn, shared_tables([f for level in features for f in features[level]]))
+
+		with conn.cursor() as cur:
+
+			cur.execute('''
+				CREATE SCHEMA IF NOT EXISTS features;
+				DROP TABLE IF EXISTS features.static_columns;
+				CREATE TABLE features.static_columns (
+					table_name text,
+					column_name text,
+					feature text,
+					query_hash text
+				);''')
+
+			for level, table in STATIC_TABLES.items():
+				cur.execute('DROP TABLE IF EXISTS %s;' %(table))
+				if len(features[level]) == 0:
+					continue
+
+				cur.execute('CREATE TABLE %s AS %s;' %(table, static_table_query(level, features[level])))
+				cur.execute('CREATE INDEX on %s(%s);' %(table, level))
+				cur.executemany('INSERT INTO features.static_columns VALUES (%s, %s, %s, %s);',
+								[(table, f.feature_col, f.__class__.__name__, f.query_hash()) for f in features[level]])
+
+				print 'Created and populated table: %s (%d features)' %(table, len(features[level]))
+
+			cur.connection.commit()
+
+if __name__ == '__main__':
+	main()
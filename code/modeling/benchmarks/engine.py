@@ -0,0 +1,78 @@
+'''
+Benchmarks the in-process analytical engine of util/embedded_engine.py against Postgres.
+Both run the feature subqueries of the first window of a config file that scan courses or attendance
+(the wide aggregate scans of the megaquery), and the train megaquery itself. The embedded engine reads
+the columnar export written by etl/uploaders/export_columnar.py.
+The script accepts a path to a YAML configuration file as a command line argument;
+it defaults to [..]/code/modeling/configs/default.yaml
+'''
+
+import os
+import re
+import argparse
+import yaml
+import pandas as pd
+
+from config import PERSISTENCE_PATH
+from util import cred
+from util.SQL_helpers import connect_to_db, create_temp_tables
+from util.embedded_engine import connect_embedded
+from modeling.featurepipeline.dataloader import DataLoader, get_feature_object, shared_tables
+from modeling.benchmarks.fetch import best_time
+
+SCANNED_TABLES = ['courses', 'attendance']
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Compare Postgres and the embedded engine on the feature queries of a config.')
+	parser.add_argument('configFile',metavar='code/modeling/configs/default.yaml',
+					    help='Path to YAML config relative to project directory.',
+					    const='code/modeling/configs/default.yaml',nargs='?',
+					    default='code/modeling/configs/default.yaml')
+	parser.add_argument('--export', default='data/columnar', help='Folder of the columnar export, relative to project directory.')
+	parser.add_argument('--repeats', type=int, default=3, help='Number of runs per engine; the fastest counts.')
+	args = parser.parse_args()
+
+	with open(os.path.join(PERSISTENCE_PATH, args.configFile), 'r') as f:
+	        cfg = yaml.load(f)
+
+	allfeatures = list(set([f for l in cfg['features'] for f in l]))
+
+	train_start = pd.Timestamp(cfg['earliest_train_start'])
+	split_date = train_start + pd.DateOffset(months=cfg['train_period_months'])
+	test_end = split_date + pd.DateOffset(months=cfg['test_period_months'])
+
+	# the dataloader is only needed for its queries
+	dload = DataLoader(target=cfg['target'], feature_list=allfeatures,
+					  restrictors=cfg['sample'],
+					  split_date=str(split_date.date()),
+					  train_start=str(train_start.date()),
+					  test_end=str(test_end.date()),
+					  schema='common')
+
+	ofeatures = list(get_feature_object(x,'train') for x in dload.features)
+	subqueries, aliases = dload.fuse_features(ofeatures)
+	queries = [(', '.join(t for t in SCANNED_TABLES if re.search(r'\b%s\b' %(t), subquery)) + ' (%s)' %(alias), subquery)
+			   for alias, subquery, index_level, index_col in subqueries
+			   if any(re.search(r'\b%s\b' %(t), subquery) for t in SCANNED_TABLES)]
+	queries.append(('train megaquery', dload.generate_megaquery('train')))
+
+	times = {}
+	with connect_to_db(cred.host, cred.user, cred.pw, cred.dbname) as postgres, \
+		 connect_embedded(os.path.join(PERSISTENCE_PATH, args.export)) as embedded:
+
+		for engine, connection in [('postgres', postgres), ('embedded', embedded)]:
+			connection.cursor().execute('set search_path to common')
+			create_temp_tables(connection, shared_tables(ofeatures))
+
+			for label, query in queries:
+				times[(engine, label)] = best_time(lambda: pd.read_sql(query, connection), args.repeats)
+
+	print '\n| Query | Rows | Postgres (s) | Embedded (s) | Speedup |'
+	print '| -- | -- | -- | -- | -- |'
+	for label, query in queries:
+		postgres_time, rows = times[('postgres', label)]
+		embedded_time, _ = times[('embedded', label)]
+		print '| %s | %d | %.2f | %.2f | %.1fx |' %(label, rows.shape[0], postgres_time, embedded_time,
+												   postgres_time / max(embedded_time, 1e-9))
@@ -0,0 +1,79 @@
+'''
+Benchmarks the two ways the dataloader can transfer query results from Postgres:
+pd.read_sql, and COPY (...) TO STDOUT parsed with read_sql_copy.
+Both are timed on the train and test megaqueries of the first window of a config file.
+The script accepts a path to a YAML configuration file as a command line argument;
+it defaults to [..]/code/modeling/configs/default.yaml
+'''
+
+import os
+import time
+import argparse
+import yaml
+import pandas as pd
+
+from config import PERSISTENCE_PATH
+from util import cred
+from util.SQL_helpers import connect_to_db, read_sql_copy, create_temp_tables
+from modeling.featurepipeline.dataloader import DataLoader, get_feature_object, shared_tables
+
+
+def best_time(fetch, repeats):
+	'''Run fetch repeats times; return the fastest time and the fetched rows'''
+
+	times = []
+	for _ in range(repeats):
+		start = time.time()
+		rows = fetch()
+		times.append(time.time() - start)
+
+	return min(times), rows
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Compare pd.read_sql and COPY on the megaqueries of a config.')
+	parser.add_argument('configFile',metavar='code/modeling/configs/default.yaml',
+					    help='Path to YAML config relative to project directory.',
+					    const='code/modeling/configs/default.yaml',nargs='?',
+					    default='code/modeling/configs/default.yaml')
+	parser.add_argument('--repeats', type=int, default=3, help='Number of runs per method; the fastest counts.')
+	args = parser.parse_args()
+
+	with open(os.path.join(PERSISTENCE_PATH, args.configFile), 'r') as f:
+	        cfg = yaml.load(f)
+
+	allfeatures = list(set([f for l in cfg['features'] for f in l]))
+
+	train_start = pd.Timestamp(cfg['earliest_train_start'])
+	split_date = train_start + pd.DateOffset(months=cfg['train_period_months'])
+	test_end = split_date + pd.DateOffset(months=cfg['test_period_months'])
+
+	# the dataloader is only needed for its megaqueries and column types
+	dload = DataLoader(target=cfg['target'], feature_list=allfeatures,
+					  restrictors=cfg['sample'],
+					  split_date=str(split_date.date()),
+					  train_start=str(train_start.date()),
+					  test_end=str(test_end.date()),
+					  schema='common')
+
+	results = []
+	with connect_to_db(cred.host, cred.user, cred.pw, cred.dbname) as connection:
+
+		connection.cursor().execute('set search_path to common')
+
+		for split in ['train','test']:
+			query = dload.generate_megaquery(split)
+			types = dload.column_types(split)
+			create_temp_tables(connection, shared_tables(get_feature_object(x,split) for x in dload.features))
+
+			read_sql_time, rows = best_time(lambda: pd.read_sql(query, connection), args.repeats)
+			copy_time, _ = best_time(lambda: read_sql_copy(query, connection, types), args.repeats)
+
+			results.append((split, rows.shape[0], rows.shape[1], read_sql_time, copy_time))
+
+	print '\n| Split | Rows | Columns | read_sql (s) | COPY (s) | Speedup |'
+	print '| -- | -- | -- | -- | -- | -- |'
+	for split, nrows, ncols, read_sql_time, copy_time in results:
+		print '| %s | %d | %d | %.2f | %.2f | %.1fx |' %(split, nrows, ncols, read_sql_time, copy_time,
+													   read_sql_time / max(copy_time, 1e-9))
@@ -0,0 +1,95 @@
+'''
+Benchmarks how the megaquery applies its restrictors: as EXISTS semi-joins on the target subquery
+(what generate_megaquery does), against left joining every restrictor and filtering in a trailing WHERE.
+Both are timed on the semester transition models of visualizations/parameters_vs_semester.py,
+whose restrictor chains grow from the sample alone to the sample and PersistSevenSemesters=True.
+The script accepts a path to a YAML configuration file as a command line argument;
+it defaults to [..]/code/visualizations/configs/semesters.yaml
+'''
+
+import os
+import argparse
+import yaml
+import pandas as pd
+
+from config import PERSISTENCE_PATH
+from util import cred
+from util.SQL_helpers import connect_to_db, create_temp_tables
+from modeling.featurepipeline.dataloader import DataLoader, get_feature_object, shared_tables
+from modeling.benchmarks.fetch import best_time
+
+# (restrictor, target, label) of every semester transition model, as in parameters_vs_semester.py
+SEMESTER_PAIRS = [(None, 'PersistOneSemester','0->1'),
+				  ({'PersistOneSemester': '=True'}, 'PersistTwoSemesters','1->2'),
+				  ({'PersistTwoSemesters': '=True'}, 'PersistThreeSemesters','2->3'),
+				  ({'PersistThreeSemesters': '=True'}, 'PersistFourSemesters','3->4'),
+				  ({'PersistFourSemesters': '=True'}, 'PersistFiveSemesters','4->5'),
+				  ({'PersistFiveSemesters': '=True'}, 'PersistSixSemesters','5->6'),
+				  ({'PersistSixSemesters': '=True'}, 'PersistSevenSemesters','6->7'),
+				  ({'PersistSevenSemesters': '=True'}, 'PersistEightSemesters','7->8')]
+
+
+def left_join_megaquery(dload, split):
+	'''The megaquery of split with every restrictor left joined onto it and filtered in a trailing WHERE'''
+
+	restrictors = dload.restrictors
+	dload.restrictors = []
+	megaquery = dload.generate_megaquery(split).strip().rstrip(';') + '\n'
+	dload.restrictors = restrictors
+
+	orestrictors = list(get_feature_object(x,split) for x in restrictors)
+	for i in range(0,len(orestrictors)):
+		megaquery += 'left join (%s) as r%s\n' %(orestrictors[i].generate_query(), str(i))
+		megaquery += '   on t.%s = r%s.%s\n' %(orestrictors[i].index_level, str(i), orestrictors[i].index_col)
+	megaquery += ' WHERE \n' if len(restrictors) > 0 else ''
+	megaquery += ' AND '.join('r'+str(i)+'.'+r.feature_col+restrictors[i]['restriction'] for i,r in enumerate(orestrictors))
+
+	return megaquery + ';'
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Compare semi-join and left join restrictors on the semester models.')
+	parser.add_argument('configFile',metavar='code/visualizations/configs/semesters.yaml',
+					    help='Path to YAML config relative to project directory.',
+					    const='code/visualizations/configs/semesters.yaml',nargs='?',
+					    default='code/visualizations/configs/semesters.yaml')
+	parser.add_argument('--repeats', type=int, default=3, help='Number of runs per method; the fastest counts.')
+	args = parser.parse_args()
+
+	with open(os.path.join(PERSISTENCE_PATH, args.configFile), 'r') as f:
+	        cfg = yaml.load(f)
+
+	# the rows of one dataloader are enough; for every transition, only its target and restrictors are swapped
+	dload = DataLoader(target=SEMESTER_PAIRS[0][1], feature_list=cfg['features'],
+					  restrictors=cfg['sample'],
+					  train_start=str(cfg['start_date']),
+					  split_date=str(cfg['end_date']),
+					  test_end=None,
+					  schema=cfg['schema'])
+
+	results = []
+	with connect_to_db(cred.host, cred.user, cred.pw, cred.dbname) as connection:
+
+		connection.cursor().execute('set search_path to %s' %(cfg['schema']))
+		create_temp_tables(connection, shared_tables(get_feature_object(x,'train') for x in dload.features))
+
+		for restrictor, target, label in SEMESTER_PAIRS:
+			dload.target, _ = dload._generateFeatureDict(target, 'target')
+			dload.restrictors = dload._generateRestrictorDict(cfg['sample'] + ([restrictor] if restrictor != None else []))
+
+			semi_join_query = dload.generate_megaquery('train')
+			left_join_query = left_join_megaquery(dload, 'train')
+
+			semi_join_time, semi_join_rows = best_time(lambda: pd.read_sql(semi_join_query, connection), args.repeats)
+			left_join_time, left_join_rows = best_time(lambda: pd.read_sql(left_join_query, connection), args.repeats)
+
+			results.append((label, len(dload.restrictors), semi_join_rows.shape[0], left_join_rows.shape[0],
+							left_join_time, semi_join_time))
+
+	print '\n| Transition | Restrictors | Rows (semi-join) | Rows (left join) | Left join (s) | Semi-join (s) | Speedup |'
+	print '| -- | -- | -- | -- | -- | -- | -- |'
+	for label, nrestrictors, semi_join_rows, left_join_rows, left_join_time, semi_join_time in results:
+		print '| %s | %d | %d | %d | %.2f | %.2f | %.1fx |' %(label, nrestrictors, semi_join_rows, left_join_rows,
+															 left_join_time, semi_join_time,
+															 left_join_time / max(semi_join_time, 1e-9))
@@ -0,0 +1,53 @@
+'''
+Benchmarks the startup time of the modeling entry points: the time it takes a fresh interpreter to
+import each of MODULES, and which of the heavy optional modules (plotting, markdown, scikit estimators)
+that import pulled in. Every import runs in its own process, so nothing is imported twice.
+Unlike the other benchmarks, the script takes no config file.
+'''
+
+import sys
+import json
+import argparse
+import subprocess
+
+# what loopmodels.py and its workers import (loopmodels.py itself runs on import)
+MODULES = ['modeling.featurepipeline.dataloader',
+		   'modeling.featurepipeline.experiment',
+		   'modeling.models.all_models']
+
+# modules that only runs drawing plots or fitting a particular estimator need
+HEAVY_MODULES = ['matplotlib.pyplot', 'seaborn', 'markdown',
+				 'sklearn.ensemble', 'sklearn.svm', 'sklearn.neighbors', 'sklearn.linear_model']
+
+TIMED_IMPORT = '''
+import sys, time, json
+start = time.time()
+import %s
+print json.dumps([time.time() - start, [m for m in %r if m in sys.modules], len(sys.modules)])
+'''
+
+
+def time_import(module):
+	'''Import module in a fresh interpreter; return its import time, the heavy modules it loaded
+	   and the total number of loaded modules'''
+
+	output = subprocess.check_output([sys.executable, '-c', TIMED_IMPORT %(module, HEAVY_MODULES)])
+	return json.loads(output.strip().split('\n')[-1])
+
+
+if __name__ == '__main__':
+
+	parser = argparse.ArgumentParser(description='Time the imports of the modeling entry points.')
+	parser.add_argument('--repeats', type=int, default=3, help='Number of imports per module; the fastest counts.')
+	args = parser.parse_args()
+
+	results = []
+	for module in MODULES:
+		runs = [time_import(module) for _ in range(args.repeats)]
+		seconds = min(r[0] for r in runs)
+		results.append((module, seconds, runs[0][2], runs[0][1]))
+
+	print '\n| Module | Import (s) | Modules loaded | Heavy modules loaded |'
+	print '| -- | -- | -- | -- |'
+	for module, seconds, nmodules, heavy in results:
+		print '| %s | %.2f | %d | %s |' %(module, seconds, nmodules, ', '.join(heavy) if len(heavy) > 0 else '-')
@@ -0,0 +1,94 @@
+__author__ = 'College Persistence Team'
+
+from abstractboundedfeature import *
+
+class AbstractAggregateFeature(AbstractBoundedFeature):
+    '''
+    A bounded feature that aggregates the rows of a source table per value of its index column,
+    e.g. the number of AP courses per student. Instead of a sql_query, subclasses declare
+        source: select statement returning the rows to aggregate (including index_col and bound_col)
+        aggregate: aggregate expression over these rows, with a {filter} after every aggregate call,
+                   e.g. "sum(was_ap::int){filter}"
+        condition: which rows of the source are aggregated, e.g. "yearsbeforegrad=0"
+    Features with the same source, bound column, bounds and index can be compiled into one
+    grouped scan of the source with fused_aggregate_query, where each of them becomes a
+    FILTER (WHERE condition) aggregate.
+    Subclasses whose aggregate is a running aggregate over the dated rows can also declare
+        cumulative: list of (kind, expression) tuples, see AsOfIndex
+    and override combine_cumulative if there is more than one. Such features can be evaluated
+    for any upper bound from an AsOfIndex over their events (see event_query).
+    '''
+
+    condition = 'true'
+    cumulative = None
+
+    @property
+    def sql_query(self):
+        return '''
+        select {index_col}, {aggregate} as {feature_col}
+        from ({source}) as src
+        where {condition} {{}}
+        group by {index_col}
+        '''.format(index_col=self.index_col, aggregate=self.aggregate.format(filter=''),
+                   feature_col=sql_column(self.feature_col), source=self.source, condition=self.condition)
+
+    def fusion_key(self):
+        '''Aggregate features with equal keys can be fused into one query'''
+        return (' '.join(self.source.split()), self.bound_col, self.lower_bound, self.upper_bound,
+                self.index_col, self.index_level)
+
+    def event_query(self):
+        '''The unbounded rows this feature aggregates, with the expression of every cumulative part as c0, c1, ...'''
+        columns = ''.join(', %s as c%d' %(expression if expression != None else 'null', i)
+                          for i, (kind, expression) in enumerate(self.cumulative))
+        return '''
+        select {index_col}, {bound_col}{columns}
+        from ({source}) as src
+        where {condition}
+        '''.format(index_col=self.index_col, bound_col=self.bound_col, columns=columns,
+                   source=self.source, condition=self.condition)
+
+    def combine_cumulative(self, values):
+        '''The feature value from the values of the cumulative parts (a list of arrays); by default the first part'''
+        return values[0]
+
+    @property
+    def source(self):
+        raise NotImplementedError
+    @property
+    def aggregate(self):
+        raise NotImplementedError
+
+
+def fused_aggregate_query(features):
+    '''
+    Compile aggregate features with the same fusion_key into a single grouped scan of their source,
+    returning one column per feature. A feature's column is null wherever none of the rows of an
+    index value meet its condition, just like when the feature is queried on its own.
+    '''
+
+    first = features[0]
+
+    columns = []
+    conditions = []
+    selected = set()
+    for feature in features:
+        if feature.feature_col in selected:
+            continue
+        selected.add(feature.feature_col)
+        filter_clause = ' filter (where %s)' %(feature.condition)
+        columns.append('case when count(*)%s > 0 then %s end as %s' %(filter_clause,
+                       feature.aggregate.format(filter=filter_clause), sql_column(feature.feature_col)))
+        if '(%s)' %(feature.condition) not in conditions:
+            conditions.append('(%s)' %(feature.condition))
+
+    bounds = first.bound_clause()
+
+    return '''
+        select {index_col},
+            {columns}
+        from ({source}) as src
+        where ({conditions}){bounds}
+        group by {index_col}
+        '''.format(index_col=first.index_col, columns=',\n            '.join(columns), source=first.source,
+                   conditions=' or '.join(conditions), bounds=' and '+bounds if bounds != '' else '')
@@ -17,13 +17,13 @@ class AbstractBoundedFeature(AbstractFeature):
         if not '{}' in self.sql_query:
             raise NotImplementedError('Bad bounded feature class definition; SQL query does not have a {} in which to place a bounding where clause.')
 
-    def load_rows(self,connection,read_from_cache=False,write_to_cache=False):
+    def load_rows(self,connection,read_from_cache=False,write_to_cache=False,cache=None,use_copy=False):
         '''Overwritten version of this function that handles
         the presence/expectation of bounds on a column'''
 
         #Format sql query to accommodate bounds
         f_query = self.generate_query()
-        self.read_sql_into_rows(f_query,connection)
+        self.read_sql_into_rows(f_query,connection,read_from_cache,write_to_cache,cache,use_copy)
         print self.rows.head()
 
     def generate_query(self):
@@ -35,18 +35,25 @@ class AbstractBoundedFeature(AbstractFeature):
             else:
                 add = 'where '
 
-            if self.lower_bound != None:
-                add += self.bound_col +' >= \''+self.lower_bound+'\''
-
-            if self.upper_bound != None:
-                if self.lower_bound != None:
-                    add += ' and '
-                add += self.bound_col +' < \''+self.upper_bound+'\''
+            add += self.bound_clause()
 
             f_query = self.sql_query.format(add)
 
         return f_query
 
+    def bound_clause(self):
+        '''The condition on bound_col for the bounds of this feature, '' if it is unbounded'''
+        clause = ''
+        if self.lower_bound != None:
+            clause += self.bound_col +' >= \''+self.lower_bound+'\''
+
+        if self.upper_bound != None:
+            if self.lower_bound != None:
+                clause += ' and '
+            clause += self.bound_col +' < \''+self.upper_bound+'\''
+
+        return clause
+
 
     @property
     def bound_col(self):
@@ -17,13 +17,13 @@ class AbstractBoundedPandasFeature(AbstractPandasFeature):
         if not '{}' in self.sql_query:
             raise NotImplementedError('Bad bounded feature class definition; SQL query does not have a {} in which to place a bounding where clause.')
 
-    def load_rows(self,connection,read_from_cache=False,write_to_cache=False):
+    def load_rows(self,connection,restrictors=None,split=None,use_copy=False):
         '''Overwritten version of this function that handles
         the presence/expectation of bounds on a column'''
 
         #Format sql query to accommodate bounds
         f_query = self.generate_query()
-        self.read_sql_into_rows(f_query,connection)
+        self.read_sql_into_rows(f_query,connection,use_copy)
         print self.rows.head()
 
     def generate_query(self):
@@ -1,8 +1,19 @@
 __author__ = 'College Persistence Team'
 
 from abstractpipeline import *
+from util.SQL_helpers import read_sql_copy, create_temp_tables
 import pandas as pd
 import postprocessors as pp
+import time
+import re
+import hashlib
+
+# "select <index column>, <column> [as <name>] from <table>", see AbstractFeature.simple_projection
+SIMPLE_PROJECTION = re.compile(r'^select ([\w\.]+) ?, ?([\w\.]+(?: as \w+)?) from ([\w\.]+)$', re.IGNORECASE)
+
+def sql_column(name):
+    '''The column name as it has to be written in SQL: quoted if it has upper case letters, which postgres lowercases otherwise'''
+    return '"%s"' %(name) if name != name.lower() else name
 
 class AbstractFeature(AbstractPipelineConfig):
     '''
@@ -10,6 +21,15 @@ class AbstractFeature(AbstractPipelineConfig):
     individual features, not instantiated.
     '''
 
+    # sub-expressions that the query of this feature shares with other features, as a dictionary of
+    # table name -> (select statement, index column). They are materialized as temp tables once per
+    # database session before the query runs, and the query reads from them by name.
+    shared_tables = {}
+
+    # if set, the feature is read from this column of a static feature table written by the ETL
+    # (see etl/uploaders/materialize_features.py) instead of running its query
+    static_table = None
+
     def __init__(self):
 
         #test to make sure subclass overwrote fields
@@ -43,27 +63,77 @@ class AbstractFeature(AbstractPipelineConfig):
 
         return summary
 
-    def load_rows(self,connection,read_from_cache=False,write_to_cache=False):
+    def load_rows(self,connection,read_from_cache=False,write_to_cache=False,cache=None,use_copy=False):
         '''
         Load the database rows that comprise this field either from the database or from the local
         cache if told to do so. If instructed, write to the cache if it's not already there.
         :param read_from_cache: whether to look for an read from a local cache if it is there
         :param write_to_cache: whether to write loaded results to local cache if it isn't there
+        :param cache: the FeatureCache to read from and write to
+        :param use_copy: whether to fetch the rows through COPY instead of pd.read_sql
         :return: nothing. Loads rows into rows instance variable
         '''
 
-        self.read_sql_into_rows(self.sql_query,connection)
+        self.read_sql_into_rows(self.generate_query(),connection,read_from_cache,write_to_cache,cache,use_copy)
 
-    def read_sql_into_rows(self,query,connection):
+    def read_sql_into_rows(self,query,connection,read_from_cache=False,write_to_cache=False,cache=None,use_copy=False,
+                           column_types=None):
         print query
-        self.rows = pd.read_sql(query,connection)
+        key = cache.key(query) if cache != None else None
+
+        # whether the rows came from the cache, for the query cost table of the experiment log
+        self.cached = False
+        if read_from_cache and key != None:
+            self.rows = cache.get(key)
+            if self.rows is not None:
+                self.cached = True
+                return
+
+        if self.static_table == None:
+            create_temp_tables(connection, self.shared_tables)
+
+        start = time.time()
+        if use_copy:
+            if column_types == None:
+                column_types = {self.feature_col: self.feature_type}
+            self.rows = read_sql_copy(query,connection,column_types)
+        else:
+            self.rows = pd.read_sql(query,connection)
         self.rows.set_index(self.index_col,inplace=True)
+
+        if write_to_cache and key != None:
+            cache.put(key, self.rows, time.time() - start)
         # self.rows.sort(inplace=True)
         # print self.rows.head(50)
 
     def generate_query(self):
+        if self.static_table != None:
+            return 'select %s, %s from %s' %(self.index_col, sql_column(self.feature_col), self.static_table)
         return self.sql_query
 
+    def query_hash(self):
+        '''Hash of the whitespace normalized sql_query, which tells whether a static table column is up to date'''
+        return hashlib.sha1(' '.join(self.sql_query.split())).hexdigest()
+
+    def simple_projection(self):
+        '''
+        If the generated query of this feature just selects its index column and one other column
+        of a single table (e.g. "select collegeid, isprivate from colleges"), returns a tuple of
+        (table, index column expression, feature column expression). Otherwise returns None.
+        The dataloader fuses such features on the same table into a single subquery.
+        '''
+
+        match = SIMPLE_PROJECTION.match(' '.join(self.generate_query().split()).rstrip(';').strip())
+        if match == None:
+            return None
+
+        index_expr, feature_expr, table = match.groups()
+        output_name = re.split(' as ', feature_expr, flags=re.IGNORECASE)[-1].split('.')[-1]
+        if index_expr.split('.')[-1] != self.index_col or output_name != self.feature_col:
+            return None
+
+        return table, index_expr, feature_expr
+
     # A subclass must override these class fields
     # to be instantiated without an error
     @property
@@ -1,9 +1,10 @@
 __author__ = 'Masha'
 
 from abstractpipeline import *
+from util.SQL_helpers import read_sql_copy, create_temp_tables
 import pandas as pd
 import postprocessors as pp
-from dataloader import get_feature_object
+from dataloader import get_feature_object, restrictor_semi_join
 
 class AbstractPandasFeature(AbstractPipelineConfig):
     '''
@@ -13,6 +14,11 @@ class AbstractPandasFeature(AbstractPipelineConfig):
     how to join it in after processing
     '''
 
+    # sub-expressions that the query of this feature shares with other features, as a dictionary of
+    # table name -> (select statement, index column). They are materialized as temp tables once per
+    # database session before the query runs, and the query reads from them by name.
+    shared_tables = {}
+
     def __init__(self):
 
         #test to make sure subclass overwrote fields
@@ -49,19 +55,25 @@ class AbstractPandasFeature(AbstractPipelineConfig):
 
         return summary
 
-    def load_rows(self,connection,restrictors, split):
+    def load_rows(self,connection,restrictors, split, use_copy=False):
         '''
         Load the database rows that comprise this field either from the database
+        :param use_copy: whether to fetch the rows through COPY instead of pd.read_sql
         :return: nothing. Loads rows into rows instance variable
         '''
 
         restricted_query = self.generate_restricted_query(restrictors, split)
 
-        self.read_sql_into_rows(restricted_query,connection)
+        self.read_sql_into_rows(restricted_query,connection,use_copy)
+
+    def read_sql_into_rows(self,query,connection,use_copy=False):
 
-    def read_sql_into_rows(self,query,connection):
+        create_temp_tables(connection, self.shared_tables)
 
-        self.rows = pd.read_sql(query,connection)
+        if use_copy:
+            self.rows = read_sql_copy(query,connection)
+        else:
+            self.rows = pd.read_sql(query,connection)
         self.rows.reindex(copy=False)
 
 
@@ -70,15 +82,19 @@ class AbstractPandasFeature(AbstractPipelineConfig):
         return self.sql_query
 
     def generate_restricted_query(self, restrictors, split):
+        '''
+        The query of this feature, restricted to the rows that meet the restrictors. Not to the eligible
+        enrollments of a window (see DataLoader.create_eligible_table): the columns that process() derives
+        from the rows would then differ between the train and the test split, and between windows.
+        '''
 
         # example target query
 
-        # select enrollid, t.studentid, contact_medium from
-        # (select studentid, contact_medium from contacts where contact_date < '2013-06-01') as t
-        # left join (select id as enrollid, studentid, collegeid, persist_1_halfyear
+        # select f.studentid, f.contact_medium from
+        # (select studentid, contact_medium from contacts where contact_date < '2013-06-01') as f
+        # WHERE exists (select 1 from (select id as enrollid, studentid, collegeid, persist_1_halfyear
         # from features.enrollment_dummies where persist_1_halfyear is not null ) as r0
-        # on t.studentid = r0.studentid 
-        # WHERE r0.persist_1_halfyear=True;
+        # where r0.studentid = f.studentid and r0.persist_1_halfyear=True);
         
         # get restrictor objects
 
@@ -96,6 +112,7 @@ class AbstractPandasFeature(AbstractPipelineConfig):
         #     query += ', r%s.%s' %(str(i), orestrictors[i].index_col)
         query += '\nfrom \n  (%s) as f\n' %(self.generate_query())
 
+        conditions = []
         for i in range(0,len(orestrictors)):
 
             # we need to know what column we can join the restrictors on
@@ -106,11 +123,12 @@ class AbstractPandasFeature(AbstractPipelineConfig):
             elif self.index_level=='collegeid':
                 r_index = orestrictors[i].collegeid_col
 
-            query += 'left join (%s) as r%s\n' %(orestrictors[i].generate_query(), str(i))
-            query += '   on f.%s = r%s.%s\n' %(self.index_col, str(i), r_index)
+            # a semi-join keeps each row of the feature once, however many restrictor rows match it
+            conditions.append(restrictor_semi_join(orestrictors[i], restrictstrings[i], 'r'+str(i),
+                                                   'f.'+self.index_col, r_index))
 
         query += ' WHERE \n' if len(restrictors) > 0 else ''
-        query += ' AND '.join('r'+str(i)+'.'+r.feature_col+restrictstrings[i] for i,r in enumerate(orestrictors))
+        query += '\n AND '.join(conditions)
         query += ';'
 
         return query
@@ -0,0 +1,89 @@
+__author__ = 'College Persistence Team'
+
+import numpy as np
+import pandas as pd
+
+
+class AsOfIndex(object):
+    '''
+    Cumulative per-id index over dated events, e.g. the contacts of every student.
+
+    The events are sorted by id and date once. For every id, the number of its events before
+    any date is then the result of a binary search, and so are running aggregates over them:
+        count: the number of events
+        distinct: the number of different non-null values of a column
+        max: the maximum of the non-null values of a column
+        last: the value of a column at the latest event
+    lookup() evaluates them as of a date for all ids at once with a single searchsorted, so that
+    a feature bounded by many different dates only needs its events to be queried once.
+    '''
+
+    KINDS = ['count', 'distinct', 'max', 'last']
+
+    def __init__(self, events, index_col, bound_col, parts):
+        '''
+        :param events: dataframe with the columns index_col, bound_col and c0, c1, ... (one per part)
+        :param parts: list of (kind, expression) tuples; the expression is only used to name column ci
+        '''
+
+        for kind, expression in parts:
+            if kind not in self.KINDS:
+                raise ValueError("The kind of a cumulative aggregate must be one of %s" %(self.KINDS))
+
+        self.index_col = index_col
+        self.parts = parts
+
+        events = events[events[bound_col].notnull()]
+        days = pd.to_datetime(events[bound_col]).values.astype('datetime64[D]').astype(np.int64)
+        codes, self.ids = pd.factorize(events[index_col].values, sort=True)
+
+        order = np.lexsort((days, codes))
+        codes = codes[order]
+        days = days[order]
+
+        # one sorted key per event: the position of its id, then its day
+        self.first_day = days.min() if len(days) > 0 else 0
+        self.span = (days.max() - self.first_day + 2) if len(days) > 0 else 1
+        self.keys = codes.astype(np.int64) * self.span + (days - self.first_day)
+        self.starts = np.searchsorted(codes, np.arange(len(self.ids)), 'left')
+
+        self.columns = []
+        for i, (kind, expression) in enumerate(parts):
+            values = events['c%d' %(i)].values[order] if kind != 'count' else None
+            if kind == 'distinct':
+                # cumulative number of values that occur for the first time within their id
+                first = ~pd.DataFrame({'id': codes, 'value': values}).duplicated().values & pd.notnull(values)
+                self.columns.append(np.concatenate([[0], np.cumsum(first)]))
+            elif kind == 'max':
+                running = pd.Series(values.astype(float)).fillna(-np.inf).groupby(codes).cummax().values
+                self.columns.append(np.where(running == -np.inf, np.nan, running))
+            else:
+                self.columns.append(values)
+
+    def lookup(self, as_of):
+        '''
+        Evaluate every part over the events before (not on) the date as_of.
+        :return: dataframe indexed by index_col, with a column c0, c1, ... per part and a row for every
+                 id with at least one event before as_of, like the grouped query the events come from
+        '''
+
+        day = np.datetime64(pd.Timestamp(as_of).date(), 'D').astype(np.int64)
+        offset = min(max(day - self.first_day, 0), self.span - 1)
+        ends = np.searchsorted(self.keys, np.arange(len(self.ids), dtype=np.int64) * self.span + offset, 'left')
+
+        has_events = ends > self.starts
+        starts = self.starts[has_events]
+        ends = ends[has_events]
+
+        columns = {}
+        for i, (kind, expression) in enumerate(self.parts):
+            if kind == 'count':
+                columns['c%d' %(i)] = ends - starts
+            elif kind == 'distinct':
+                columns['c%d' %(i)] = self.columns[i][ends] - self.columns[i][starts]
+            else:
+                columns['c%d' %(i)] = self.columns[i][ends - 1]
+
+        rows = pd.DataFrame(columns, index=pd.Index(self.ids[has_events], name=self.index_col),
+                            columns=['c%d' %(i) for i in range(len(self.parts))])
+        return rows
@@ -0,0 +1,89 @@
+__author__ = 'College Persistence Team'
+
+import numpy as np
+import pandas as pd
+
+# fractions of the population at which top_k_table evaluates by default: every percent
+TOP_K = [i / 100.0 for i in range(1, 101)]
+
+
+def top_k_table(y_true, y_score, ks=TOP_K):
+    '''
+    Precision, recall and lift of the top k of the population, for every fraction k in ks at once.
+
+    The rows are ordered by score only once: argpartition picks the rows of the largest k, and only
+    these are sorted. Cumulative hit counts over them then give every k with a lookup, instead of a
+    full sort per k.
+    :param y_true: labels (True for the class the scores are for)
+    :param y_score: scores, higher means more likely to be True
+    :param ks: fractions of the population between 0 and 1; the top k are the int(k * n) highest scores
+    :return: dataframe indexed by k with the columns n (number of rows in the top k), precision, recall
+             (of all True labels) and lift (precision over the share of True labels in the population)
+    '''
+
+    y_true = np.asarray(y_true).astype(bool)
+    y_score = np.asarray(y_score, dtype=float)
+    ks = np.asarray(ks, dtype=float)
+    if ((ks < 0) | (ks > 1)).any():
+        raise ValueError("The fractions of the population must be between 0 and 1")
+
+    ns = (ks * len(y_score)).astype(int)
+    n_max = ns.max() if len(ns) > 0 else 0
+
+    if n_max < len(y_score):
+        top = np.argpartition(-y_score, n_max)[:n_max]
+        top = top[np.argsort(-y_score[top], kind='mergesort')]
+    else:
+        top = np.argsort(-y_score, kind='mergesort')
+    hits = np.concatenate([[0], np.cumsum(y_true[top])])[ns]
+
+    positives = y_true.sum()
+    precision = np.where(ns > 0, hits / np.maximum(ns, 1).astype(float), 0.0)
+    recall = hits / float(positives) if positives > 0 else np.zeros(len(ns))
+    lift = precision / (positives / float(len(y_true))) if positives > 0 else np.zeros(len(ns))
+
+    return pd.DataFrame({'n': ns, 'precision': precision, 'recall': recall, 'lift': lift},
+                        index=pd.Index(ks, name='k'), columns=['n', 'precision', 'recall', 'lift'])
+
+
+def precision_recall_population(y_true, y_score, points=200):
+    '''
+    Precision and recall of flagging every row with a score of at least t, against the fraction of the
+    population that is flagged, for every distinct score t: the curves of the precision-recall plots.
+
+    The rows are sorted by score once; the rows flagged at each threshold are then the rows up to the
+    last one with that score, and cumulative hit counts over the sorted rows give their precision and
+    recall. Unlike metrics.precision_recall_curve, the curve continues to the full population.
+    :param y_true: labels (True for the class the scores are for)
+    :param y_score: scores, higher means more likely to be True
+    :param points: number of points to downsample the curve to, evenly spread over the population
+                   (for plotting); None keeps one point per distinct score
+    :return: dataframe with the columns threshold, population, precision and recall, by increasing population
+    '''
+
+    y_true = np.asarray(y_true).astype(bool)
+    y_score = np.asarray(y_score, dtype=float)
+    if len(y_score) == 0:
+        return pd.DataFrame(columns=['threshold', 'population', 'precision', 'recall'])
+
+    order = np.argsort(-y_score, kind='mergesort')
+    sorted_score = y_score[order]
+    hits = np.cumsum(y_true[order])
+
+    # the last row of every run of equal scores
+    last = np.concatenate([np.nonzero(np.diff(sorted_score))[0], [len(sorted_score) - 1]])
+    flagged = last + 1
+
+    curve = pd.DataFrame({'threshold': sorted_score[last],
+                          'population': flagged / float(len(y_score)),
+                          'precision': hits[last] / flagged.astype(float),
+                          'recall': hits[last] / float(hits[-1]) if hits[-1] > 0 else np.zeros(len(last))},
+                         columns=['threshold', 'population', 'precision', 'recall'])
+
+    if points != None and len(curve) > points:
+        # the first point at or beyond each of the evenly spaced fractions of the population
+        population = curve['population'].values
+        keep = np.searchsorted(population, np.linspace(population[0], 1.0, points))
+        curve = curve.iloc[np.unique(np.minimum(keep, len(curve) - 1))].reset_index(drop=True)
+
+    return curve
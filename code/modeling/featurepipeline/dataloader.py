@@ -3,13 +3,27 @@ __author__ = 'Team'
 
 from abstractpipeline import *
 from abstracttargetfeature import *
+from abstractaggregatefeature import *
+from asofindex import AsOfIndex
+from featurematrix import FeatureMatrix
+import postprocessors as pp
 from datetime import date, datetime
 from dateutil.relativedelta import relativedelta
 from util import cred # import credentials
-from util.SQL_helpers import connect_to_db
+from util.SQL_helpers import connect_to_db, open_connection_pool, read_sql_copy, create_temp_tables
 from sklearn import metrics
+from multiprocessing.pool import ThreadPool
+from collections import OrderedDict
 import pandas as pd
+import numpy as np
 import importlib
+import time
+import hashlib
+import re
+import sys
+import warnings
+# a select of columns of a single table, without any function call, filter, join or grouping (see plain_projection)
+PLAIN_PROJECTION = re.compile(r'^select (?!distinct )[^()]* from [\w\.]+$', re.IGNORECASE)
 
 class DataLoader(AbstractPipelineConfig):
 
@@ -18,9 +32,54 @@ class DataLoader(AbstractPipelineConfig):
 		NOTE: can only handle pandas features, not pandas targets or restrictors
 	'''
 
-	def __init__(self, target, feature_list,restrictors,split_date, train_start, test_end, schema = 'common'):
+	def __init__(self, target, feature_list,restrictors,split_date, train_start, test_end, schema = 'common', cache = None,
+				 sweep = None, workers = 1, fetch = 'read_sql', static_features = False, profile = False, explain = False, broadcast = False,
+				 compact = False, snapshot = None):
 
 		self.schema = schema
+		# optional FeatureCache; if set, features are loaded one by one through the cache
+		# instead of as part of the megaquery
+		self.cache = cache
+		# number of database connections to run feature queries on concurrently; if more than one,
+		# features are loaded one by one instead of as part of the megaquery
+		self.workers = workers
+		# pool of self.workers connections the feature queries run on, opened by query_pool()
+		self.pool = None
+		# instrumentation: with profile, every query is run and timed on its own, and query_costs
+		# gets one entry per query (see query_costs()); with explain, explain_plans gets the
+		# EXPLAIN (ANALYZE, BUFFERS) output of the megaquery of each split
+		self.profile = profile
+		self.explain = explain
+		self.query_costs = []
+		self.explain_plans = {}
+		# temp tables of the restricted target rows per split, see create_eligible_table
+		self.eligible = {}
+		# feature subqueries that are the same in both splits, and the temp tables / rows they are read from
+		self.shared_subqueries = {}
+		self.shared_rows = {}
+		# FeatureMatrix of the rows of each split, built on the first subset_data call
+		self.matrices = {}
+		# postprocessors of each column fit on the train rows, and the rows of each split they transformed (see postprocessed_columns)
+		self.fitted_postprocessors = {}
+		self.postprocessed = {}
+		# with compact, the columns get the smallest dtype their feature type allows (see compact_dtypes),
+		# and memory_report gets the bytes of every column before and after
+		self.compact = compact
+		self.memory_report = []
+		# with broadcast, features are fetched once per id of their index level and spread over the
+		# enrollments in memory (see broadcast_feature_rows), instead of being joined in the megaquery
+		self.broadcast = broadcast
+		self.load_by_feature = self.cache != None or self.workers > 1 or self.profile or self.broadcast
+		# how query results are transferred: 'read_sql' (pd.read_sql) or 'copy' (COPY ... TO STDOUT)
+		if fetch not in ['read_sql','copy']:
+			raise ValueError("fetch must be either 'read_sql' or 'copy'")
+		self.fetch = fetch
+		# optional SweepDataLoader that already holds the rows for this window
+		self.sweep = sweep
+		# whether unbounded features are read from the static feature tables written by the ETL
+		self.static_features = static_features
+		# optional path of a snapshot (see save_snapshot) to load the rows from, instead of the database
+		self.snapshot = snapshot
 
 		if split_date == None or train_start == None:
 			raise ValueError("dataloader requires a split_date and a train_start!")
@@ -31,6 +90,9 @@ class DataLoader(AbstractPipelineConfig):
 		self.test_start = self.split_date
 		self.test_end = test_end
 
+		self.target_list = target
+		self.feature_list = feature_list
+		self.restrictor_list = restrictors
 		self.target, _ = self._generateFeatureDict(target, 'target') # assume the target isn't a pandas feature
 		self.features, self.pandas_features = self._generateFeatureDict(feature_list, 'feature')
 		self.restrictors = self._generateRestrictorDict(restrictors)
@@ -41,11 +103,23 @@ class DataLoader(AbstractPipelineConfig):
 		# only load test data if a test window is defined. otherwise, just go for the training set
 		print "\nDataLoader is fetching its data..."
 		if self.test_end == None and self.train_start != None:
-			self.load_rows(split=['train'])
+			split = ['train']
 		elif self.test_end != None and self.train_end != None:
-			self.load_rows(split=['train','test'])
+			split = ['train','test']
 		else:
 			raise ValueError("dataloader requires a train_start and split_date")
+
+		if self.snapshot != None:
+			self.load_snapshot(split)
+		elif self.sweep != None:
+			self.load_rows_from_sweep(split)
+			# the sweep holds the rows of all windows; don't keep (or pickle, see Experiment.write_log) them with this window
+			self.sweep = None
+		else:
+			try:
+				self.load_rows(split)
+			finally:
+				self.close_pool()
 		print "\tDone fetching."
 
 	def _generateRestrictorDict(self,list_to_load):
@@ -155,42 +229,66 @@ class DataLoader(AbstractPipelineConfig):
 		return list_of_non_pandas_dicts, list_of_pandas_dicts
 
 				
-	def generate_megaquery(self, split):
+	def generate_megaquery(self, split, features=None, eligible=None, shared=None):
 		'''
 		Load all the rows for this experiment by combining the queries for the individual features
 		into a big join statement with an optional where clause at the end'
 		:param connection:
 		:param split: 'train' or 'test'; the key of the feature dictionary to use
 		bsplit: 'feature'; the split that the function accepts if it can't find split
+		:param features: list of feature dictionaries to join in; defaults to all non-pandas features.
+						 Pass an empty list to only get the (restricted) target rows.
+		:param eligible: optional name of the temp table holding the restricted target rows of split
+						 (see create_eligible_table); if given, the features are joined onto it and the
+						 target and restrictors are not evaluated again
+		:param shared: optional dictionary of feature subquery -> name of a temp table holding its result
+					   (see share_subqueries); such subqueries are read from their table
 		:return:
 		'''
 
+		if features == None:
+			features = self.features
+
 		#Get the actual feature objects
 
 		otarget = list(get_feature_object(x,split) for x in self.target)[0] # only ever one target feature in list
-		ofeatures = list(get_feature_object(x,split) for x in self.features) 
+		ofeatures = list(get_feature_object(x,split) for x in features) 
 		orestrictors = list(get_feature_object(x,split) for x in self.restrictors)
 		restrictstrings = list(x['restriction'] for x in self.restrictors)
 
 
 		#CREATE THE MEGAQUERY FOR NON PANDAS FEATURES
 
+		# features that only project a column of the same table, or aggregate the same source, share one subquery
+		subqueries, aliases = self.fuse_features(ofeatures)
+		if shared != None:
+			subqueries = [(alias, 'select * from %s' %(shared[subquery]) if subquery in shared else subquery, index_level, index_col)
+						  for alias, subquery, index_level, index_col in subqueries]
 		
-		megaquery = 'select t.%s as enrollid, t.%s as studentid, t.%s as collegeid, t.%s' %(otarget.index_col, otarget.studentid_col, otarget.collegeid_col, otarget.feature_col)
+		if eligible != None:
+			megaquery = 'select t.enrollid, t.studentid, t.collegeid, t.%s' %(sql_column(otarget.feature_col))
+			for i in range(0,len(ofeatures)):
+				megaquery += ', %s.%s' %(aliases[i], sql_column(ofeatures[i].feature_col))
+			megaquery += '\nfrom %s as t\n' %(eligible)
+			for alias, subquery, index_level, index_col in subqueries:
+				megaquery += 'left join (%s) as %s\n' %(subquery, alias)
+				megaquery += '   on t.%s = %s.%s\n' %(index_level, alias, index_col)
+			return megaquery + ';'
+
+		megaquery = 'select t.%s as enrollid, t.%s as studentid, t.%s as collegeid, t.%s' %(otarget.index_col, otarget.studentid_col, otarget.collegeid_col, sql_column(otarget.feature_col))
 		for i in range(0,len(ofeatures)):
-			megaquery += ', f%s.%s' %(str(i), ofeatures[i].feature_col)
-		megaquery += '\nfrom \n  (%s) as t\n' %(otarget.generate_query())
-		for i in range(0,len(ofeatures)):
-			megaquery += 'left join (%s) as f%s\n' %(ofeatures[i].generate_query(), str(i))
-			megaquery += '   on t.%s = f%s.%s\n' %(ofeatures[i].index_level, str(i), ofeatures[i].index_col)
-		for i in range(0,len(orestrictors)):
-			megaquery += 'left join (%s) as r%s\n' %(orestrictors[i].generate_query(), str(i))
-			megaquery += '   on t.%s = r%s.%s\n' %(orestrictors[i].index_level, str(i), orestrictors[i].index_col)
-
-
-		# TODO: instead of using r['restriction'], generate fully qualified restriction here
-		megaquery += ' WHERE \n' if len(self.restrictors) > 0 else ''
-		megaquery += ' AND '.join('r'+str(i)+'.'+r.feature_col+restrictstrings[i] for i,r in enumerate(orestrictors))
+			megaquery += ', %s.%s' %(aliases[i], sql_column(ofeatures[i].feature_col))
+		# the restrictors are semi-joins on the target subquery, so that the target rows they eliminate
+		# never reach the feature joins
+		targetquery = otarget.generate_query()
+		if len(orestrictors) > 0:
+			targetquery = 'select * from (%s) as t0\n  WHERE ' %(targetquery)
+			targetquery += '\n  AND '.join(restrictor_semi_join(r, restrictstrings[i], 'r'+str(i), 't0.'+r.index_level, r.index_col)
+											for i,r in enumerate(orestrictors))
+		megaquery += '\nfrom \n  (%s) as t\n' %(targetquery)
+		for alias, subquery, index_level, index_col in subqueries:
+			megaquery += 'left join (%s) as %s\n' %(subquery, alias)
+			megaquery += '   on t.%s = %s.%s\n' %(index_level, alias, index_col)
 		megaquery += ';'
 
 		return megaquery
@@ -206,15 +304,64 @@ class DataLoader(AbstractPipelineConfig):
 		#         on t.studentid = f1.id
 		#     left join (select count(*) as alum_count, collegeid from enrollments where status not in ('Matriculating', 'Did not matriculate')   and start_date < '2011-12-31' group by collegeid) as f2
 		#         on t.collegeid = f2.collegeid
-		#     left join (select id, persist_2_halfyear from enrollment_dummies) as r
-		#         on r.id=t.id
-		# WHERE r.persist_2_halfyear is TRUE
+		# with the restrictor persist_2_halfyear=True, t is
+		#     (select * from (select id, studentid, collegeid, persist_3_halfyear from ...) as t0
+		#      WHERE exists (select 1 from (select id, persist_2_halfyear from enrollment_dummies) as r0
+		#                    where r0.id = t0.id and r0.persist_2_halfyear=True))
 		# ;
 
 		# print 'Megaquery for split ' +split+':\n'+megaquery+'\n'
 
 		# return megaquery
 
+	def fuse_features(self, ofeatures):
+		'''
+		Groups the features whose query is a simple projection of a table (see AbstractFeature.simple_projection)
+		by table and index, and the aggregate features by their fusion_key (see AbstractAggregateFeature).
+		Every group of two or more becomes a single subquery returning all of their columns: one select
+		of all projected columns of the table, or one grouped scan of the aggregated source.
+		The megaquery then needs one join per group instead of one per feature.
+		:param ofeatures: list of feature objects
+		:return: list of (alias, subquery, index_level, index_col) to join onto the target,
+				 and a dictionary mapping each feature's position in ofeatures to the alias it is selected from
+		'''
+
+		groups = OrderedDict()
+		for i, feature in enumerate(ofeatures):
+			if isinstance(feature, AbstractAggregateFeature):
+				groups.setdefault(('aggregate',) + feature.fusion_key(), []).append((i, None))
+			else:
+				projection = feature.simple_projection()
+				if projection != None:
+					table, index_expr, feature_expr = projection
+					groups.setdefault(('projection', table, feature.index_col, feature.index_level), []).append((i, feature_expr))
+
+		subqueries = []
+		aliases = {}
+		fused = [(key, members) for key, members in groups.items() if len(members) > 1]
+		for g, (key, members) in enumerate(fused):
+			alias = 'g%s' %str(g)
+			for i, feature_expr in members:
+				aliases[i] = alias
+			first = ofeatures[members[0][0]]
+			if key[0] == 'aggregate':
+				subquery = fused_aggregate_query([ofeatures[i] for i, feature_expr in members])
+			else:
+				columns = []
+				for i, feature_expr in members:
+					if feature_expr not in columns:
+						columns.append(feature_expr)
+				subquery = 'select %s, %s from %s' %(first.index_col, ', '.join(columns), key[1])
+			subqueries.append((alias, subquery, first.index_level, first.index_col))
+
+		# all other features are joined in on their own
+		for i, feature in enumerate(ofeatures):
+			if i not in aliases:
+				aliases[i] = 'f%s' %str(i)
+				subqueries.append((aliases[i], feature.generate_query(), feature.index_level, feature.index_col))
+
+		return subqueries, aliases
+
 	def load_rows(self,split=['test','train']):
 
 		# check that only legit splits are being passed
@@ -235,15 +382,35 @@ class DataLoader(AbstractPipelineConfig):
 
 			connection.cursor().execute(search_path_string) #specify which schema to search
 
+			if self.cache != None:
+				self.cache.stamp_from_db(connection, self.schema)
+
+			if self.static_features:
+				use_static_tables([get_feature_object(x,s) for x in self.features for s in split],
+								  read_static_columns(connection))
+
+			# the restricted target rows of each split, which all queries below start from
+			for s in split:
+				self.create_eligible_table(connection, s)
+			self.share_subqueries(connection, split)
+
 			if 'train' in split:
-				self.train_megaquery = self.generate_megaquery('train')
-				self.train_rows = pd.read_sql(self.train_megaquery,connection)
-				self.train_rows.set_index(self.target[0]['train'].index_col,inplace=True)
+				if self.load_by_feature:
+					self.train_megaquery, self.train_rows = self.load_rows_by_feature(connection, 'train')
+				else:
+					self.train_megaquery = self.generate_megaquery('train', eligible=self.eligible['train'][0], shared=self.shared_subqueries)
+					self.train_rows = self.read_rows(self.train_megaquery,connection,'train')
+					self.train_rows.set_index('enrollid',inplace=True)
+				self.train_megaquery = self.eligible_log('train') + self.train_megaquery
 
 			if 'test' in split:
-				self.test_megaquery = self.generate_megaquery('test')
-				self.test_rows = pd.read_sql(self.test_megaquery,connection)
-				self.test_rows.set_index(self.target[0]['test'].index_col,inplace=True)
+				if self.load_by_feature:
+					self.test_megaquery, self.test_rows = self.load_rows_by_feature(connection, 'test')
+				else:
+					self.test_megaquery = self.generate_megaquery('test', eligible=self.eligible['test'][0], shared=self.shared_subqueries)
+					self.test_rows = self.read_rows(self.test_megaquery,connection,'test')
+					self.test_rows.set_index('enrollid',inplace=True)
+				self.test_megaquery = self.eligible_log('test') + self.test_megaquery
 
 			# then handle pandas features
 			
@@ -257,34 +424,359 @@ class DataLoader(AbstractPipelineConfig):
 				self.pandas_testfeatures = list(get_feature_object(x, 'test') for x in self.pandas_features)
 				self.get_pandas_rows(connection, self.pandas_testfeatures, 'test')
 
+			if self.explain:
+				for s in split:
+					self.explain_plans[s] = self.explain_megaquery(connection, s)
+
+	def query_pool(self):
+		'''
+		The connection pool that run_queries runs the feature queries on with several workers
+		(None with a single worker). It is opened on first use and kept until close_pool(), so it
+		is shared by both splits: the temp tables a query creates on one of its connections (eligible
+		rows, shared tables) are reused by every later query on that connection.
+		'''
+
+		if self.workers > 1 and self.pool == None:
+			self.pool = open_connection_pool(cred.host, cred.user, cred.pw, cred.dbname, self.workers)
+		return self.pool
+
+	def close_pool(self):
+		'''Close the connections of the pool opened by query_pool(), if any'''
 
+		if self.pool != None:
+			self.pool.closeall()
+			self.pool = None
 
+	def create_eligible_table(self, connection, split):
+		'''
+		Materialize the restricted target rows of split (enrollid, studentid, collegeid and the target column)
+		as a temp table of the session, indexed on the ids, and store its name and definition in self.eligible.
+		The megaquery joins the features onto it, and features loaded on their own and pandas features
+		semi-join against it, so the target and restrictors are evaluated once per split instead of in
+		every query. The name is derived from the target query, so that it differs between windows and
+		restrictions (it ends up in the feature cache keys).
+		With several workers, the queries run on the connections of query_pool() instead, and each of
+		them creates the table the first time it needs it.
+		'''
+
+		targetquery = self.generate_megaquery(split, features=[]).strip().rstrip(';')
+		name = 'eligible_' + hashlib.sha1(' '.join(targetquery.split())).hexdigest()[:16]
+		self.eligible[split] = (name, {name: (targetquery, ['enrollid', 'studentid', 'collegeid'])})
+		if self.workers <= 1:
+			create_temp_tables(connection, self.eligible[split][1])
+
+	def share_subqueries(self, connection, split):
+		'''
+		Finds the feature subqueries (see fuse_features) that are identical in the train and the test split.
+		Bounded features get the same upper bound (train_end) in both splits, so most feature queries are.
+		For the megaquery, each of them is materialized once as a temp table (named after its SQL) that both
+		megaqueries read from, unless it is a plain projection of a table (see plain_projection), which is
+		read as cheaply from the table itself; features loaded on their own are fetched once for both splits.
+		Stores a dictionary of subquery -> table name in self.shared_subqueries.
+		'''
+
+		self.shared_subqueries = {}
+		self.shared_rows = {}
+		if len(split) < 2:
+			return
+
+		train = self.fuse_features(list(get_feature_object(x,'train') for x in self.features))[0]
+		test = set(subquery for alias, subquery, index_level, index_col in
+				   self.fuse_features(list(get_feature_object(x,'test') for x in self.features))[0])
+
+		tables = {}
+		for alias, subquery, index_level, index_col in train:
+			if subquery in test:
+				if not self.load_by_feature and plain_projection(subquery):
+					continue
+				name = 'split_' + hashlib.sha1(' '.join(subquery.split())).hexdigest()[:16]
+				self.shared_subqueries[subquery] = name
+				tables[name] = (subquery, index_col)
+		print 'Feature queries shared by train and test: %d of %d' %(len(tables), len(train))
+
+		if not self.load_by_feature:
+			create_temp_tables(connection, shared_tables(get_feature_object(x,'train') for x in self.features))
+			create_temp_tables(connection, tables)
+
+	def eligible_log(self, split):
+		'''The definition of the eligible table of split, for the queries in the experiment log,
+		   and (before the train megaquery) those of the tables shared by both splits'''
+
+		name, tables = self.eligible[split]
+		log = 'create temp table %s as\n%s;\n\n' %(name, tables[name][0])
+		if split == 'train' and not self.load_by_feature:
+			for subquery, table in sorted(self.shared_subqueries.items(), key=lambda x: x[1]):
+				log += 'create temp table %s as\n%s;\n\n' %(table, subquery.strip())
+		return log
+
+	def explain_megaquery(self, connection, split):
+		'''Runs the megaquery of split under EXPLAIN (ANALYZE, BUFFERS) and returns the plan as text'''
+
+		create_temp_tables(connection, self.eligible[split][1])
+		create_temp_tables(connection, shared_tables(get_feature_object(x,split) for x in self.target + self.features))
+		cur = connection.cursor()
+		cur.execute('EXPLAIN (ANALYZE, BUFFERS) ' + self.generate_megaquery(split, eligible=self.eligible[split][0],
+																		shared=None if self.load_by_feature else self.shared_subqueries))
+		# the plan is the last column (the only one on Postgres, the second on the embedded engine)
+		plan = '\n'.join(row[-1] for row in cur.fetchall())
+		cur.close()
+		return plan
+
+
+
+
+	def read_rows(self, query, connection, split, features=None):
+		'''
+		Run a megaquery-style query (target plus features, defaulting to all non-pandas features)
+		and return its result, transferred the way self.fetch says
+		'''
+
+		if features == None:
+			features = self.features
+		create_temp_tables(connection, shared_tables(get_feature_object(x,split) for x in self.target + features))
+
+		if self.fetch == 'copy':
+			return read_sql_copy(query, connection, self.column_types(split, features))
+		else:
+			return pd.read_sql(query, connection)
+
+	def column_types(self, split, features=None):
+		'''Returns a dictionary of column name -> feature type for the target and the given (non-pandas) features'''
+
+		if features == None:
+			features = self.features
+
+		ofeatures = list(get_feature_object(x,split) for x in self.target + features)
+		return dict((f.feature_col, f.feature_type) for f in ofeatures)
+
+	def load_rows_by_feature(self, connection, split):
+		'''
+		Alternative to the megaquery, used when the dataloader has a feature cache or several workers:
+		the restricted target rows are queried as one statement, every feature is loaded
+		on its own (from the cache if possible) and the results are joined onto the target rows in pandas.
+		With several workers, the target query and the feature queries run concurrently.
+		:return: the queries that were run (for the experiment log), and the rows indexed by enrollid
+		'''
+
+		targetquery = self.generate_megaquery(split, features=[], eligible=self.eligible[split][0])
+		ofeatures = list(get_feature_object(x,split) for x in self.features)
+
+		def load_target(connection):
+			create_temp_tables(connection, self.eligible[split][1])
+			rows = self.read_rows(targetquery, connection, split, features=[])
+			rows.set_index('enrollid', inplace=True)
+			return rows
+
+		# without a cache, feature rows are restricted to the eligible ids in the database; cached rows
+		# are kept unrestricted, so that they are reused across split dates and restrictions
+		eligible = self.eligible[split] if self.cache == None else None
+
+		# subqueries shared with the other split are restricted to the eligible ids of both splits,
+		# so that their rows can be reused by it
+		both = None
+		if eligible != None and len(self.shared_subqueries) > 0:
+			both = ([self.eligible[s][0] for s in sorted(self.eligible)],
+					dict(item for s in self.eligible for item in self.eligible[s][1].items()))
+
+		# fused features are loaded with their shared subquery
+		subqueries, aliases = self.fuse_features(ofeatures)
+		jobs = [load_target]
+		groups = []
+		queries = [targetquery]
+		for alias, subquery, index_level, index_col in subqueries:
+			members = [ofeatures[i] for i in sorted(aliases) if aliases[i] == alias]
+			if subquery in self.shared_rows:
+				# already fetched for the other split
+				for feature in members:
+					feature.rows = self.shared_rows[subquery]
+				continue
+			restrict = both if subquery in self.shared_subqueries and both != None else eligible
+			groups.append((subquery, members))
+			if len(members) == 1:
+				jobs.append(feature_loader(members[0], self.cache, self.fetch, restrict))
+			else:
+				jobs.append(fused_loader(members, subquery, self.cache, self.fetch, restrict))
+			queries.append(subquery if restrict == None else semi_join(subquery, index_col, index_level, restrict[0]))
+		timings = [None]*len(jobs) if self.profile else None
+		rows = run_queries(jobs, connection, self.query_pool(), self.schema, timings)[0]
+
+		for subquery, members in groups:
+			if subquery in self.shared_subqueries:
+				self.shared_rows[subquery] = members[0].rows
+
+		if self.profile:
+			self.query_costs += query_costs(split, ['target'] + [', '.join(f.__class__.__name__ for f in members) for subquery, members in groups],
+											queries, timings, [(rows, False)] + [(members[0].rows, members[0].cached) for subquery, members in groups])
+		rows = broadcast_feature_rows(rows, [(feature, feature.rows) for feature in ofeatures])
+
+		return '\n\n'.join(queries), rows
+
+	def load_rows_from_sweep(self, split):
+		'''
+		Cut this dataloader's window out of the rows held by its SweepDataLoader: the target rows
+		are selected with a date mask, and features are joined from the rows the sweep has
+		already fetched. Only feature queries the sweep has not run before hit the database,
+		i.e. bounded features whose bound differs from every earlier window.
+		'''
+
+		for s in split:
+			otarget = list(get_feature_object(x,s) for x in self.target)[0]
+			ofeatures = list(get_feature_object(x,s) for x in self.features)
+			pfeatures = list(get_feature_object(x,s) for x in self.pandas_features)
+
+			self.sweep.fetch_features(ofeatures, pfeatures, self.restrictors, s,
+									  costs=self.query_costs if self.profile else None)
+
+			rows = self.sweep.window_target_rows(otarget)
+			queries = [self.sweep.targetquery]
+			rows = broadcast_feature_rows(rows, [(feature, self.sweep.rows_by_query[feature.generate_query()]) for feature in ofeatures])
+			queries += [feature.generate_query() for feature in ofeatures]
+
+			if s == 'train':
+				self.train_megaquery, self.train_rows = '\n\n'.join(queries), rows
+				self.pandas_trainfeatures = pfeatures
+			elif s == 'test':
+				self.test_megaquery, self.test_rows = '\n\n'.join(queries), rows
+				self.pandas_testfeatures = pfeatures
+
+			self.merge_pandas_rows(pfeatures, s)
+			if self.compact:
+				self.compact_rows(pfeatures, s)
 
 	def get_pandas_rows(self, connection, pandas_features, split):
 
+		#checkout the rows
+		timings = [None]*len(pandas_features) if self.profile else None
+		run_queries([pandas_feature_loader(p, self.restrictors, split, self.fetch) for p in pandas_features],
+					connection, self.query_pool(), self.schema, timings)
+		if self.profile:
+			self.query_costs += query_costs(split, [p.__class__.__name__ for p in pandas_features],
+											[p.generate_restricted_query(self.restrictors, split) for p in pandas_features],
+											timings, [(p.rows, False) for p in pandas_features])
+
 		for p_feature in pandas_features:
 
-			#checkout the rows
-			p_feature.load_rows(connection, self.restrictors, split)
 			#process
 			p_feature.process()
 			#update the column names for subsetting
 			p_feature.update_cols()
-			#merge into current rows based on split
 
-			if split == 'train':
-				self.train_rows.reset_index(inplace=True)
-				self.train_rows = pd.merge(self.train_rows, p_feature.rows, how = 'left', left_on = p_feature.index_level, right_on = p_feature.index_col)
-				self.train_rows.set_index('enrollid',inplace=True)
-			elif split == 'test':
-				self.test_rows.reset_index(inplace=True)
-				self.test_rows = pd.merge(self.test_rows, p_feature.rows, how = 'left', left_on = p_feature.index_level, right_on = p_feature.index_col)
-				self.test_rows.set_index('enrollid',inplace=True)
+		#merge into current rows based on split
+		self.merge_pandas_rows(pandas_features, split)
+		if self.compact:
+			self.compact_rows(pandas_features, split)
+
+	def merge_pandas_rows(self, pandas_features, split):
+
+		if split == 'train':
+			self.train_rows = join_pandas_rows(self.train_rows, pandas_features)
+		elif split == 'test':
+			self.test_rows = join_pandas_rows(self.test_rows, pandas_features)
 
 
 
+	def save_snapshot(self, path):
+		'''
+		Write everything an experiment needs from this dataloader into one compressed .npz file at path:
+		the train and test rows column by column, the megaqueries, query costs and plans, and the feature
+		metadata (feature queries, the columns of the pandas features and the postprocessors of every column).
+		A dataloader created with snapshot=path then runs without a database connection.
+		'''
+
+		splits = [s for s in ['train', 'test'] if getattr(self, s + '_rows', None) is not None]
+		arrays = {}
+		for s in splits:
+			arrays.update(frame_to_arrays(getattr(self, s + '_rows'), s + '_'))
+
+		ofeatures = list(get_feature_object(x,'train') for x in self.target + self.features)
+		postprocessors = self.get_postprocessors([f.__class__.__name__ for f in ofeatures] +
+												 [get_feature_object(x,'train').__class__.__name__ for x in self.pandas_features])
+		meta = {'splits': splits,
+				'target': self.target_list, 'features': self.feature_list, 'restrictors': self.restrictor_list,
+				'train_start': self.train_start, 'split_date': self.split_date, 'test_end': self.test_end,
+				'schema': self.schema,
+				'megaqueries': dict((s, getattr(self, s + '_megaquery')) for s in splits),
+				'query_costs': self.query_costs, 'explain_plans': self.explain_plans,
+				'feature_queries': dict((f.__class__.__name__, f.generate_query()) for f in ofeatures),
+				'pandas_columns': dict((s, dict((p.__class__.__name__, p.feature_col) for p in getattr(self, 'pandas_%sfeatures' %(s))))
+									   for s in splits),
+				'postprocessors': dict((c, sorted(f.__name__ for f in pps)) for c, pps in postprocessors.items())}
+		arrays['__meta__'] = np.array([meta], dtype=object)
+
+		np.savez_compressed(path, **arrays)
+		print 'Saved dataloader snapshot to %s' %(path)
+
+	def load_snapshot(self, split):
+		'''
+		Load the rows of split (a list of 'train' and/or 'test') and the metadata from the snapshot file
+		self.snapshot (see save_snapshot) instead of the database. The snapshot must be of the same window
+		and contain every feature of this dataloader; features whose query changed since the snapshot
+		was saved are only warned about.
+		'''
+
+		with np.load(self.snapshot, allow_pickle=True) as stored:
+			meta = stored['__meta__'][0]
+
+			window = (self.train_start, self.split_date, self.test_end)
+			if (meta['train_start'], meta['split_date'], meta['test_end']) != window:
+				raise ValueError("The snapshot %s is of the window %s, not %s" %(self.snapshot,
+								 (meta['train_start'], meta['split_date'], meta['test_end']), window))
+			for s in split:
+				if s not in meta['splits']:
+					raise ValueError("The snapshot %s has no %s rows" %(self.snapshot, s))
+
+			for feature in list(get_feature_object(x,'train') for x in self.target + self.features):
+				name = feature.__class__.__name__
+				if name not in meta['feature_queries']:
+					raise ValueError("The snapshot %s does not contain the feature %s" %(self.snapshot, name))
+				if ' '.join(meta['feature_queries'][name].split()) != ' '.join(feature.generate_query().split()):
+					warnings.warn("The query of %s changed since the snapshot %s was saved" %(name, self.snapshot))
+
+			for s in split:
+				rows = arrays_to_frame(stored, s + '_')
+				pfeatures = list(get_feature_object(x, s) for x in self.pandas_features)
+				for p_feature in pfeatures:
+					if p_feature.__class__.__name__ not in meta['pandas_columns'][s]:
+						raise ValueError("The snapshot %s does not contain the feature %s" %(self.snapshot, p_feature.__class__.__name__))
+					p_feature.feature_col = meta['pandas_columns'][s][p_feature.__class__.__name__]
+
+				setattr(self, s + '_rows', rows)
+				setattr(self, s + '_megaquery', meta['megaqueries'][s])
+				setattr(self, 'pandas_%sfeatures' %(s), pfeatures)
+
+		self.query_costs = meta['query_costs']
+		self.explain_plans = meta['explain_plans']
+		print 'Loaded dataloader snapshot %s' %(self.snapshot)
+
+	def compact_rows(self, pandas_features, split):
+		'''Apply the dtype plan of compact_dtypes to the rows of split, and print how much memory it saved'''
+
+		column_types = self.column_types(split)
+		for p_feature in pandas_features:
+			columns = p_feature.feature_col if type(p_feature.feature_col) is list else [p_feature.feature_col]
+			column_types.update((c, p_feature.feature_type) for c in columns)
+
+		if split == 'train':
+			self.train_rows, report = compact_dtypes(self.train_rows, column_types)
+		elif split == 'test':
+			self.test_rows, report = compact_dtypes(self.test_rows, column_types)
+
+		for entry in report:
+			entry['split'] = split
+		self.memory_report += report
+
+		print 'Memory of the %s rows: %.1f MB before, %.1f MB after compacting dtypes' %(split,
+			sum(e['bytes_before'] for e in report) / 1024.0**2, sum(e['bytes_after'] for e in report) / 1024.0**2)
+		print '\n| Column | Feature type | Before | After | MB before | MB after |'
+		print '| -- | -- | -- | -- | -- | -- |'
+		for e in sorted(report, key=lambda e: -e['bytes_before']):
+			print '| %s | %s | %s | %s | %.2f | %.2f |' %(e['column'], e['feature_type'], e['dtype_before'], e['dtype_after'],
+														   e['bytes_before'] / 1024.0**2, e['bytes_after'] / 1024.0**2)
+
 	def subset_data(self, feature_list, split):
-		'''Takes a list of features from experiment and returns a dataframe containing only the features relevant to the particular experiment'''
+		'''Takes a list of features from experiment and returns a dataframe containing only the features relevant to the particular experiment.
+		   The columns are taken from the read-only FeatureMatrix of the split, as views where possible: copy the
+		   dataframe before writing into it.'''
 
 		# get all the relevant objects
 
@@ -314,10 +806,51 @@ class DataLoader(AbstractPipelineConfig):
 
 		# then subset the dataframe by only those columns 
 
-		if split == 'train':
-			return self.train_rows[subset_columns].copy(deep=True)
-		elif split =='test':
-			return self.test_rows[subset_columns].copy(deep=True)
+		if split not in self.matrices:
+			if split == 'train':
+				self.matrices[split] = FeatureMatrix(self.train_rows)
+			elif split == 'test':
+				self.matrices[split] = FeatureMatrix(self.test_rows)
+
+		return self.matrices[split].frame(subset_columns)
+
+	def share_matrices(self):
+		'''Builds the feature matrices of both splits in shared memory (see FeatureMatrix), so that the experiment
+		   worker processes forked afterwards read their subsets from the same pages instead of each building their own.'''
+
+		self.matrices['train'] = FeatureMatrix(self.train_rows, shared=True)
+		self.matrices['test'] = FeatureMatrix(self.test_rows, shared=True)
+
+	def postprocessed_columns(self, postprocessors, split):
+		'''
+		Returns the rows of split of the columns of postprocessors (a dictionary as returned by get_postprocessors),
+		as transformed by their postprocessors. These are fit on the train rows of each column (see
+		postprocessors.Postprocessor), so that both splits are transformed with what was learned from the train rows.
+		Each column is fit and transformed once per split and dataloader, and shared by all experiments.
+		'''
+
+		parts = []
+		for column in sorted(postprocessors):
+			if column not in self.fitted_postprocessors:
+				fitted, train_rows = pp.fit_postprocessors(self.train_rows[column], postprocessors[column])
+				self.fitted_postprocessors[column] = fitted
+				self.postprocessed[(column, 'train')] = train_rows
+			if (column, split) not in self.postprocessed:
+				rows = self.train_rows if split == 'train' else self.test_rows
+				self.postprocessed[(column, split)] = pp.apply_postprocessors(rows[column], self.fitted_postprocessors[column])
+			parts.append(self.postprocessed[(column, split)])
+
+		if len(parts) == 0:
+			return pd.DataFrame(index=(self.train_rows if split == 'train' else self.test_rows).index)
+		return pd.concat(parts, axis=1)
+
+	def transform_rows(self, rows):
+		'''Applies the fitted postprocessors (see postprocessed_columns) to the columns of new rows,
+		   e.g. to score them with a model trained on the rows of this dataloader'''
+
+		columns = [c for c in rows.columns if c in self.fitted_postprocessors]
+		return pd.concat([rows.drop(columns, axis=1)] +
+						 [pp.apply_postprocessors(rows[c], self.fitted_postprocessors[c]) for c in columns], axis=1)
 
 
 	def get_postprocessors(self, feature_list):
@@ -346,6 +879,564 @@ class DataLoader(AbstractPipelineConfig):
 		return postprocessors
 
 
+class SweepDataLoader(DataLoader):
+
+	'''Loads the data for a whole sweep of train/test windows at once.
+		The target (with its restrictors and the enrollment start date) is queried a single time
+		across the union of all windows, and unbounded features are fetched once.
+		window() then hands out an ordinary DataLoader per window, whose train and test rows are
+		selected from the wide target rows by date masks. Bounded features are only queried
+		again for windows in which their generated query actually changes.
+	'''
+
+	def __init__(self, target, feature_list, restrictors, windows, schema = 'common', cache = None, workers = 1,
+				 fetch = 'read_sql', static_features = False, profile = False, asof = False, compact = False):
+		'''
+		:param windows: list of (train_start, split_date, test_end) tuples of date strings
+		:param asof: if True, aggregate features with cumulative parts are evaluated for every upper bound from
+					 an AsOfIndex over their events, which are queried once for the whole sweep
+		'''
+
+		self.schema = schema
+		self.cache = cache
+		self.workers = workers
+		# kept open for all windows, see close_pool()
+		self.pool = None
+		self.fetch = fetch
+		self.static_features = static_features
+		self.profile = profile
+		self.asof = asof
+		self.compact = compact
+		self.windows = windows
+		self.target_list = target
+		self.feature_list = feature_list
+		self.restrictor_list = restrictors
+
+		# the wide window: from the earliest train start to the latest test end
+		self.train_start = min(w[0] for w in windows)
+		self.train_end = max(w[2] if w[2] != None else w[1] for w in windows)
+		self.test_start = self.train_start
+		self.test_end = self.train_end
+
+		self.target, _ = self._generateFeatureDict(target, 'target')
+		self.restrictors = self._generateRestrictorDict(restrictors)
+
+		# the window masks are computed on the enrollment start date, which all persistence targets are bounded on
+		if get_feature_object(self.target[0], 'train').bound_col != 'start_date':
+			raise ValueError("SweepDataLoader requires a target that is bounded on the enrollment start_date")
+		m = importlib.import_module('.all_features', 'modeling.features')
+		startdate = {'feature': getattr(m, 'EnrollmentStartDate')()}
+
+		# query results by their SQL, shared by all windows
+		self.rows_by_query = {}
+		# AsOfIndex by whitespace normalized event query
+		self.asof_indexes = {}
+
+		print "\nSweepDataLoader is fetching the target for all %d windows..." %len(windows)
+		with connect_to_db(cred.host, cred.user, cred.pw,cred.dbname) as connection:
+
+			connection.cursor().execute('set search_path to %s' %(self.schema))
+
+			# catalog of the static feature tables, applied to the features of each window in fetch_features
+			self.static_columns = read_static_columns(connection) if self.static_features else {}
+
+			self.targetquery = self.generate_megaquery('train', features=[startdate])
+			self.target_rows = self.read_rows(self.targetquery, connection, 'train', features=[startdate])
+			self.target_rows.set_index(self.target[0]['train'].index_col, inplace=True)
+			self.target_rows['start_date'] = pd.to_datetime(self.target_rows['start_date'])
+
+		print "\tDone fetching."
+
+	def window(self, train_start, split_date, test_end):
+		'''Returns a DataLoader for one window, built from the rows of this sweep'''
+
+		return DataLoader(target=self.target_list, feature_list=self.feature_list,
+						  restrictors=self.restrictor_list,
+						  split_date=split_date, train_start=train_start, test_end=test_end,
+						  schema=self.schema, cache=self.cache, sweep=self, workers=self.workers,
+						  fetch=self.fetch, static_features=self.static_features, profile=self.profile,
+						  compact=self.compact)
+
+	def window_target_rows(self, otarget):
+		'''Select the target rows that fall within the bounds of otarget'''
+
+		start_date = self.target_rows['start_date']
+		mask = start_date.notnull()
+		if otarget.lower_bound != None:
+			mask &= start_date >= pd.Timestamp(otarget.lower_bound)
+		if otarget.upper_bound != None:
+			mask &= start_date < pd.Timestamp(otarget.upper_bound)
+
+		return self.target_rows.loc[mask.values, [c for c in self.target_rows.columns if c != 'start_date']]
+
+	def fetch_features(self, features, pandas_features, restrictors, split, costs=None):
+		'''
+		Make sure the rows of all given features are in rows_by_query, querying only those whose
+		generated query has not been run yet (each of them once). Pandas features are
+		processed once per restricted query, and get their rows and columns set from the stored result.
+		If costs is a list, an entry for every query that is run is added to it (see query_costs()).
+		'''
+
+		use_static_tables(features, self.static_columns)
+		if self.asof:
+			self.fetch_asof_features(features, split, costs)
+
+		missing = dict((f.generate_query(), f) for f in features
+					   if f.generate_query() not in self.rows_by_query).values()
+		# the restricted query of every pandas feature, built before process() turns its feature_col into a list
+		pandas_queries = [p.generate_restricted_query(restrictors, split) for p in pandas_features]
+		missing_pandas = dict((query, p) for p, query in zip(pandas_features, pandas_queries)
+							  if query not in self.rows_by_query).items()
+
+		if len(missing) > 0 or len(missing_pandas) > 0:
+			with connect_to_db(cred.host, cred.user, cred.pw,cred.dbname) as connection:
+
+				connection.cursor().execute('set search_path to %s' %(self.schema))
+				if self.cache != None:
+					self.cache.stamp_from_db(connection, self.schema)
+
+				jobs = [feature_loader(f, self.cache, self.fetch) for f in missing]
+				jobs += [pandas_feature_loader(p, restrictors, split, self.fetch) for query, p in missing_pandas]
+				timings = [None]*len(jobs) if costs != None else None
+				run_queries(jobs, connection, self.query_pool(), self.schema, timings)
+
+				if costs != None:
+					costs += query_costs(split, [f.__class__.__name__ for f in missing] + [p.__class__.__name__ for query, p in missing_pandas],
+										 [f.generate_query() for f in missing] + [query for query, p in missing_pandas],
+										 timings, [(f.rows, f.cached) for f in missing] + [(p.rows, False) for query, p in missing_pandas])
+
+				for feature in missing:
+					self.rows_by_query[feature.generate_query()] = feature.rows
+
+				for query, p_feature in missing_pandas:
+					p_feature.process()
+					p_feature.update_cols()
+					self.rows_by_query[query] = (p_feature.rows, p_feature.feature_col)
+
+		for p_feature, query in zip(pandas_features, pandas_queries):
+			p_feature.rows, p_feature.feature_col = self.rows_by_query[query]
+
+	def fetch_asof_features(self, features, split, costs=None):
+		'''
+		Put the rows of all features that can be evaluated from an AsOfIndex (see uses_asof_index) into
+		rows_by_query, querying the events of each index the first time it is needed. Looking a
+		feature up for another upper bound is then a binary search per id instead of a query.
+		'''
+
+		asof_features = [f for f in features if uses_asof_index(f) and f.generate_query() not in self.rows_by_query]
+		missing = dict((' '.join(f.event_query().split()), f) for f in asof_features
+					   if ' '.join(f.event_query().split()) not in self.asof_indexes)
+
+		if len(missing) > 0:
+			with connect_to_db(cred.host, cred.user, cred.pw,cred.dbname) as connection:
+
+				connection.cursor().execute('set search_path to %s' %(self.schema))
+				keys = sorted(missing)
+				jobs = [asof_loader(missing[key], self.fetch) for key in keys]
+				timings = [None]*len(jobs) if costs != None else None
+				events = run_queries(jobs, connection, self.query_pool(), self.schema, timings)
+
+				if costs != None:
+					costs += query_costs(split, ['events of ' + missing[key].__class__.__name__ for key in keys],
+										 [missing[key].event_query() for key in keys], timings,
+										 [(rows, False) for rows in events])
+
+				for key, rows in zip(keys, events):
+					feature = missing[key]
+					self.asof_indexes[key] = AsOfIndex(rows, feature.index_col, feature.bound_col, feature.cumulative)
+
+		for feature in asof_features:
+			values = self.asof_indexes[' '.join(feature.event_query().split())].lookup(feature.upper_bound)
+			column = feature.combine_cumulative([values['c%d' %(i)].values for i in range(len(feature.cumulative))])
+			self.rows_by_query[feature.generate_query()] = pd.DataFrame({feature.feature_col: column}, index=values.index)
+
+
+def feature_loader(feature, cache, fetch, eligible=None):
+	'''
+	Returns a job for run_queries that loads the rows of a (non-pandas) feature.
+	:param eligible: optional (name, definition) of an eligible table (see DataLoader.create_eligible_table);
+					 if given, only the rows of eligible ids are loaded
+	'''
+
+	def load(connection):
+		if eligible == None:
+			feature.load_rows(connection, read_from_cache=True, write_to_cache=True, cache=cache, use_copy=fetch=='copy')
+		else:
+			create_temp_tables(connection, eligible[1])
+			query = semi_join(feature.generate_query(), feature.index_col, feature.index_level, eligible[0])
+			feature.read_sql_into_rows(query, connection, read_from_cache=True, write_to_cache=True, cache=cache,
+									   use_copy=fetch=='copy')
+
+	return load
+
+
+def fused_loader(features, query, cache, fetch, eligible=None):
+	'''Returns a job for run_queries that loads the rows of several fused features with their
+	   shared query; every feature gets the whole result as its rows'''
+
+	def load(connection):
+		create_temp_tables(connection, shared_tables(features))
+		column_types = dict((f.feature_col, f.feature_type) for f in features)
+		fused_query = query
+		if eligible != None:
+			create_temp_tables(connection, eligible[1])
+			fused_query = semi_join(query, features[0].index_col, features[0].index_level, eligible[0])
+		features[0].read_sql_into_rows(fused_query, connection, read_from_cache=True, write_to_cache=True, cache=cache,
+									   use_copy=fetch=='copy', column_types=column_types)
+		for feature in features[1:]:
+			feature.rows = features[0].rows
+
+	return load
+
+
+def uses_asof_index(feature):
+	'''Whether the rows of a feature can be looked up in an AsOfIndex: it has cumulative parts,
+	   and only an upper bound (the lower bound of an as-of lookup is the first event)'''
+
+	return isinstance(feature, AbstractAggregateFeature) and feature.cumulative != None and \
+		feature.lower_bound == None and feature.upper_bound != None
+
+
+def asof_loader(feature, fetch):
+	'''Returns a job for run_queries that queries the events of an aggregate feature for its AsOfIndex'''
+
+	def load(connection):
+		query = feature.event_query()
+		create_temp_tables(connection, feature.shared_tables)
+		if fetch == 'copy':
+			# distinct values only need to be told apart, the others have the type of the feature
+			column_types = dict(('c%d' %(i), 'categorical' if kind == 'distinct' else feature.feature_type)
+								for i, (kind, expression) in enumerate(feature.cumulative) if kind != 'count')
+			column_types[feature.bound_col] = 'date'
+			return read_sql_copy(query, connection, column_types)
+		return pd.read_sql(query, connection)
+
+	return load
+
+
+def pandas_feature_loader(p_feature, restrictors, split, fetch):
+	'''Returns a job for run_queries that loads the (unprocessed) rows of a pandas feature'''
+
+	def load(connection):
+		p_feature.load_rows(connection, restrictors, split, use_copy=fetch=='copy')
+
+	return load
+
+
+def plain_projection(query):
+	'''Whether query only selects columns of a single table, e.g. "select collegeid, isprivate from colleges"
+	   (also the subquery of fused projections, see DataLoader.fuse_features)'''
+
+	return PLAIN_PROJECTION.match(' '.join(query.split()).rstrip(';').strip()) != None
+
+
+def restrictor_semi_join(restrictor, restriction, alias, outer_col, inner_col):
+	'''
+	Returns an EXISTS condition that holds if a row of the restrictor's query meets the restriction
+	(e.g. '=True') and matches outer_col on its column inner_col
+	'''
+
+	return 'exists (select 1 from (%s) as %s where %s.%s = %s and %s.%s%s)' %(restrictor.generate_query(), alias,
+		alias, inner_col, outer_col, alias, restrictor.feature_col, restriction)
+
+
+def semi_join(query, index_col, index_level, eligible):
+	'''Restrict the rows of query to those whose index_col is one of the index_level ids in the eligible table
+	   (or, given a list of eligible tables, in any of them)'''
+
+	if isinstance(eligible, list):
+		ids = ' union '.join('select %s from %s' %(index_level, table) for table in eligible)
+	else:
+		ids = 'select %s from %s' %(index_level, eligible)
+	return 'select * from (%s) as s\nwhere s.%s in (%s)' %(query.strip().rstrip(';'), index_col, ids)
+
+
+def run_queries(jobs, connection, pool, schema, timings=None):
+	'''
+	Run jobs (functions that take a database connection) and return their results in order.
+	Without a pool, the jobs run one after the other on connection. Otherwise they run
+	concurrently in a thread pool, each on a connection of pool (see DataLoader.query_pool),
+	so that Postgres executes them on several backends at once.
+	If timings is a list of the same length as jobs, the wall time of each job is stored in it.
+	'''
+
+	if timings != None:
+		jobs = [timed(job, timings, k) for k, job in enumerate(jobs)]
+
+	if pool == None:
+		return [job(connection) for job in jobs]
+
+	def run(job):
+		conn = pool.getconn()
+		try:
+			conn.cursor().execute('set search_path to %s' %(schema))
+			return job(conn)
+		finally:
+			pool.putconn(conn)
+
+	threads = ThreadPool(pool.maxconn)
+	try:
+		return threads.map(run, jobs)
+	finally:
+		threads.close()
+		threads.join()
+
+
+def shared_tables(features):
+	'''Merge the shared tables declared by feature objects (see AbstractFeature.shared_tables) into one dictionary'''
+
+	tables = {}
+	for feature in features:
+		if getattr(feature, 'static_table', None) == None: # static features don't run their own query
+			tables.update(feature.shared_tables)
+	return tables
+
+
+def read_static_columns(connection):
+	'''
+	Read the catalog of the static feature tables written by etl/uploaders/materialize_features.py.
+	:return: dictionary of feature class name -> (static table, hash of the feature's query when it was materialized);
+			 empty if the static tables have not been created
+	'''
+
+	cur = connection.cursor()
+	cur.execute("select exists (select 1 from information_schema.tables where table_schema = 'features' and table_name = 'static_columns')")
+	if not cur.fetchone()[0]:
+		print "WARNING: there are no static feature tables; run etl/uploaders/materialize_features.py. Running the feature queries instead."
+		cur.close()
+		return {}
+
+	cur.execute('select feature, table_name, query_hash from features.static_columns')
+	static_columns = dict((feature, (table, query_hash)) for feature, table, query_hash in cur.fetchall())
+	cur.close()
+	return static_columns
+
+
+def use_static_tables(features, static_columns):
+	'''Point every feature object whose column in the static tables is up to date (its query has not changed
+	   since the ETL materialized it) at that table, so that generate_query reads the column from there'''
+
+	for feature in features:
+		name = feature.__class__.__name__
+		if name in static_columns and static_columns[name][1] == feature.query_hash():
+			feature.static_table = static_columns[name][0]
+
+
+def timed(job, timings, k):
+	'''Wraps job so that it stores its wall time in timings[k]'''
+
+	def run(connection):
+		start = time.time()
+		try:
+			return job(connection)
+		finally:
+			timings[k] = time.time() - start
+	return run
+
+
+def query_costs(split, names, queries, timings, results):
+	'''
+	Returns one cost entry per query, for the query cost table of the experiment log.
+	:param names: what each query loads, e.g. the names of its feature classes
+	:param queries: the SQL of each query
+	:param timings: seconds each query took (including the transfer and parsing of its result)
+	:param results: (rows, whether they came from the feature cache) of each query
+	:return: list of dictionaries with split, query, seconds, rows, bytes (in-memory size of the result) and cached
+	'''
+
+	return [{'split': split, 'query': name, 'sql': query, 'seconds': seconds, 'rows': rows.shape[0],
+			 'bytes': int(rows.memory_usage(index=True).sum()), 'cached': cached}
+			for name, query, seconds, (rows, cached) in zip(names, queries, timings, results)]
+
+
+def frame_to_arrays(rows, prefix):
+	'''The columns and index of rows as a dictionary of numpy arrays, for np.savez; see arrays_to_frame'''
+
+	arrays = {}
+	for i, c in enumerate(rows.columns):
+		if str(rows[c].dtype) == 'category':
+			arrays['%sc%d' %(prefix, i)] = rows[c].cat.codes.values
+			arrays['%scategories%d' %(prefix, i)] = np.asarray(rows[c].cat.categories)
+		else:
+			arrays['%sc%d' %(prefix, i)] = rows[c].values
+	arrays[prefix + '__columns__'] = np.array(list(rows.columns), dtype=object)
+	arrays[prefix + '__index__'] = rows.index.values
+	arrays[prefix + '__index_name__'] = np.array([rows.index.name], dtype=object)
+
+	return arrays
+
+
+def arrays_to_frame(stored, prefix):
+	'''Rebuild the dataframe that frame_to_arrays stored with prefix'''
+
+	columns = list(stored[prefix + '__columns__'])
+	data = OrderedDict()
+	for i, c in enumerate(columns):
+		if '%scategories%d' %(prefix, i) in stored.files:
+			data[c] = pd.Categorical.from_codes(stored['%sc%d' %(prefix, i)], stored['%scategories%d' %(prefix, i)])
+		else:
+			data[c] = stored['%sc%d' %(prefix, i)]
+
+	return pd.DataFrame(data, index=pd.Index(stored[prefix + '__index__'], name=stored[prefix + '__index_name__'][0]),
+						columns=columns)
+
+
+def compact_dtypes(rows, column_types):
+	'''
+	Give every column of rows the most compact dtype its feature type allows:
+		boolean: bool if the column has no missing values, float32 (with NaN) otherwise
+		categorical: pandas Categorical
+		numerical: float32, if the column is numeric
+		the id columns (enrollid, studentid, collegeid): int32, if they are integers without missing values
+	Other columns (e.g. dates) are left alone.
+	:param column_types: dictionary of column name -> feature type
+	:return: the rows, and a list with the dtype and bytes of every column before and after
+	'''
+
+	report = []
+	for column in list(rows.columns):
+		before = rows[column]
+		after = compact_column(before, 'id' if column in ['enrollid', 'studentid', 'collegeid'] else column_types.get(column))
+		if after is not before:
+			rows[column] = after
+		report.append({'column': column, 'feature_type': column_types.get(column),
+					   'dtype_before': str(before.dtype), 'bytes_before': column_bytes(before),
+					   'dtype_after': str(after.dtype), 'bytes_after': column_bytes(after)})
+
+	if rows.index.name == 'enrollid':
+		index = compact_column(pd.Series(rows.index.values), 'id')
+		if index.dtype != rows.index.dtype:
+			rows.index = pd.Index(index.values, name='enrollid')
+
+	return rows, report
+
+
+def compact_column(column, feature_type):
+	'''Returns column in the compact dtype of feature_type (see compact_dtypes), or column itself if there is none'''
+
+	kind = column.dtype.kind
+	if feature_type == 'boolean':
+		if column.isnull().any():
+			if kind == 'O':
+				column = column.map({True: 1.0, False: 0.0})
+			return column.astype(np.float32)
+		if kind != 'b':
+			return column.astype(bool)
+	elif feature_type == 'categorical':
+		if str(column.dtype) != 'category':
+			return column.astype('category')
+	elif feature_type == 'numerical':
+		if kind in 'iuf' and column.dtype != np.float32:
+			return column.astype(np.float32)
+	elif feature_type == 'id':
+		values = column.values
+		if kind in 'iuf' and not column.isnull().any() and (kind != 'f' or (values == values.round()).all()) \
+			and len(values) > 0 and values.min() >= np.iinfo(np.int32).min and values.max() <= np.iinfo(np.int32).max:
+			return column.astype(np.int32)
+
+	return column
+
+
+def column_bytes(column):
+	'''Memory of a column in bytes, including the python objects of object columns'''
+
+	if column.dtype.kind == 'O':
+		return column.values.nbytes + sum(sys.getsizeof(v) for v in column.values)
+	if str(column.dtype) == 'category':
+		return column.cat.codes.values.nbytes + column_bytes(pd.Series(column.cat.categories))
+	return column.values.nbytes
+
+
+def join_feature_rows(rows, feature, feature_rows):
+	'''Left-join the column of a (non-pandas) feature onto rows that are indexed by enrollid,
+	   matching on the feature's index level'''
+
+	if feature.index_level == 'enrollid':
+		return rows.join(feature_rows[[feature.feature_col]])
+	else:
+		return rows.join(feature_rows[[feature.feature_col]], on=feature.index_level)
+
+
+def broadcast_feature_rows(rows, features):
+	'''
+	Attach the columns of (non-pandas) features to rows that are indexed by enrollid. Every feature's
+	rows hold one row per id of its index level (e.g. one per student), and are spread over the
+	enrollments with integer takes: the positions of the enrollments' ids in a feature's index are
+	looked up once per distinct feature rows (fused features share theirs), then every column is a
+	vectorized take at those positions. All columns are attached with a single concat.
+	Features whose rows have more than one row per id fall back to join_feature_rows.
+	:param features: list of (feature, rows of the feature indexed by its index column)
+	'''
+
+	columns = OrderedDict()
+	positions = {}
+	duplicated = []
+	for feature, feature_rows in features:
+		if not feature_rows.index.is_unique:
+			duplicated.append((feature, feature_rows))
+			continue
+
+		key = (id(feature_rows), feature.index_level)
+		if key not in positions:
+			ids = rows.index.values if feature.index_level == 'enrollid' else rows[feature.index_level].values
+			positions[key] = feature_rows.index.get_indexer(ids)
+		columns[feature.feature_col] = take_with_missing(feature_rows[feature.feature_col].values, positions[key])
+
+	if len(columns) > 0:
+		rows = pd.concat([rows, pd.DataFrame(columns, index=rows.index)], axis=1)
+	for feature, feature_rows in duplicated:
+		rows = join_feature_rows(rows, feature, feature_rows)
+
+	return rows
+
+
+def take_with_missing(values, positions):
+	'''values.take(positions), where the positions -1 (ids a feature has no row for) become missing values;
+	   integer columns with missing values become float and boolean ones object, as in a pandas join'''
+
+	missing = positions < 0
+	if not missing.any():
+		return values.take(positions)
+
+	if values.dtype.kind in 'iu':
+		values = values.astype(float)
+	elif values.dtype.kind == 'b':
+		values = values.astype(object)
+	if len(values) == 0:
+		taken = np.empty(len(positions), dtype=values.dtype)
+	else:
+		taken = values.take(positions)
+	taken[missing] = np.datetime64('NaT') if values.dtype.kind == 'M' else np.nan
+	return taken
+
+
+def join_pandas_rows(rows, pandas_features):
+	'''
+	Left-join the processed rows of all pandas features onto rows (indexed by enrollid) in one go:
+	the features are put side by side per index level, aligned with rows by reindexing on the level's
+	ids, and everything is attached with a single concat instead of one merge (and copy of rows) per feature.
+	'''
+
+	by_level = OrderedDict()
+	for p_feature in pandas_features:
+		p_rows = p_feature.rows.set_index(p_feature.index_col)
+		if not p_rows.index.is_unique:
+			raise ValueError("pandas feature %s has more than one row per %s" %(p_feature.__class__.__name__, p_feature.index_col))
+		by_level.setdefault(p_feature.index_level, []).append(p_rows)
+
+	aligned = []
+	for level, frames in by_level.items():
+		level_rows = pd.concat(frames, axis=1) if len(frames) > 1 else frames[0]
+		keys = rows.index.values if level == 'enrollid' else rows[level].values
+		level_rows = level_rows.reindex(keys)
+		level_rows.index = rows.index
+		aligned.append(level_rows)
+
+	if len(aligned) == 0:
+		return rows
+	return pd.concat([rows] + aligned, axis=1)
+
+
 def get_feature_object(feature_dict, split):
 	'''
 	Gets the actual feature object out of a feature dictionary specified in the class definition
@@ -14,9 +14,8 @@ import time, datetime
 import config
 import warnings
 import os
-import matplotlib.pyplot as plt
-import pickle
-import markdown
+import fcntl
+import json
 
 
 class Experiment(AbstractPipelineConfig):
@@ -36,31 +35,35 @@ class Experiment(AbstractPipelineConfig):
         self.logFolder = logFolder
         self.summary_only = summary_only
 
-        #copy the dataframe from the dataloader, subset by the columns
+        #get the dataframe from the dataloader, subset by the columns; it is read-only until copied
         self.train_rows = dloader.subset_data(feature_list, 'train')
         self.test_rows = dloader.subset_data(feature_list, 'test')
         self.target_col = dloader.target[0]['test'].feature_col
 
 
     def apply_postprocessors(self):
-        ''' Gets the dataframe, applies all the relevant postprocessors to the features and returns the dataframe
-            Asks the dataloader for the relevant postprocessors, does logic to see which postprocessors to apply
-            TODO: implement the logic
-            then applies them  
+        ''' Replaces the columns of the experiment's features by their postprocessed columns.
+            The postprocessors are fit on the train rows and transform both splits (so that e.g. fillNullWithMedian
+            fills the test rows with the train median); the dataloader does this once per column and caches the
+            result for all experiments (see DataLoader.postprocessed_columns).
             Note: under the current system only features get postprocessed. We'll need to add the target if it
             needs to be postprocessed as well
         '''
 
         pps = self.dloader.get_postprocessors(self.feature_list)
+        pps = dict((column, postprocessors) for column, postprocessors in pps.items()
+                   if len(postprocessors) > 0 and column in self.train_rows.columns)
+        if len(pps) == 0:
+            # the rows are still views of the dataloader's read-only feature matrices (see DataLoader.subset_data);
+            # copy them, so that handle_NAs and anything else after this can write into them
+            self.train_rows = self.train_rows.copy()
+            self.test_rows = self.test_rows.copy()
+            return
 
-        # iterate through every column in the dictionary and apply the postprocessors
-
-        for key in pps.keys():
-            # TODO IMPLEMENT LOGIC HERE
-            # For now, just run these
-            for postprocessor, kwargs in pps[key].items():
-                self.train_rows = postprocessor(self.train_rows, columns = [key], **kwargs)
-                self.test_rows = postprocessor(self.test_rows,columns = [key], **kwargs)      
+        self.train_rows = pd.concat([self.train_rows.drop(pps.keys(), axis=1),
+                                     self.dloader.postprocessed_columns(pps, 'train')], axis=1)
+        self.test_rows = pd.concat([self.test_rows.drop(pps.keys(), axis=1),
+                                    self.dloader.postprocessed_columns(pps, 'test')], axis=1)
 
 
     def handle_NAs(self):
@@ -127,24 +130,28 @@ class Experiment(AbstractPipelineConfig):
         self.model.fit(X_train=self.train_rows[predictor_cols],
                         y_train=self.train_rows[self.target_col])
 
-        y_pred = self.model.predict(self.test_rows[predictor_cols])
+        # score both splits once; all evaluations below are computed from these scores and predictions
+        y_test = self.test_rows[self.target_col]
+        y_train = self.train_rows[self.target_col]
+        y_probs, y_pred = self.model.scores(self.test_rows[predictor_cols])
+        y_probs_train, y_pred_train = self.model.scores(self.train_rows[predictor_cols])
+
         # evaluations
-        cm = self.model.cm(y_test=self.test_rows[self.target_col], y_predicted=y_pred)
+        cm = self.model.cm(y_test=y_test, y_predicted=y_pred)
         coefs = self.model.coefs()
-        clf_report = self.model.clf_report(y_test=self.test_rows[self.target_col], y_predicted=y_pred)
-        auc = self.model.auc(y_test=self.test_rows[self.target_col], X_test = self.test_rows[predictor_cols])
-        pr0_precision_top_10 = self.model.precision_top_k_percent(0.1, X_test = self.test_rows[predictor_cols], y_test = self.test_rows[self.target_col], y_predicted = y_pred, pos_label = 0)
-        pr0_precision_top_25 = self.model.precision_top_k_percent(0.25, X_test = self.test_rows[predictor_cols], y_test = self.test_rows[self.target_col], y_predicted = y_pred, pos_label = 0)
-        aupr0 = self.model.aupr(y_test=self.train_rows[self.target_col], X_test = self.train_rows[predictor_cols], pos_label=0)
-
-
+        clf_report = self.model.clf_report(y_test=y_test, y_predicted=y_pred)
+        auc = self.model.auc(y_test=y_test, y_probs=y_probs)
+        # precision, recall and lift of predicting y=0 for the top k% of the test rows, for every percent
+        self.top_k = self.model.top_k_table(y_test=y_test, y_probs=y_probs, pos_label=0)
+        pr0_precision_top_10 = self.top_k.loc[0.1, 'precision']
+        pr0_precision_top_25 = self.top_k.loc[0.25, 'precision']
+        aupr0 = self.model.aupr(y_test=y_train, y_probs=y_probs_train, pos_label=0)
 
         # get the within-training set ROC, AUC, precision-recall curves
-        y_pred_train = self.model.predict(self.train_rows[predictor_cols])
         # evaluations
-        cm_train = self.model.cm(y_test=self.train_rows[self.target_col], y_predicted=y_pred_train)
-        clf_report_train = self.model.clf_report(y_test=self.train_rows[self.target_col], y_predicted=y_pred_train)
-        auc_train = self.model.auc(y_test=self.train_rows[self.target_col], X_test = self.train_rows[predictor_cols])
+        cm_train = self.model.cm(y_test=y_train, y_predicted=y_pred_train)
+        clf_report_train = self.model.clf_report(y_test=y_train, y_predicted=y_pred_train)
+        auc_train = self.model.auc(y_test=y_train, y_probs=y_probs_train)
 
         # TODO just for debugging
         self.auc_train = auc_train
@@ -152,13 +159,13 @@ class Experiment(AbstractPipelineConfig):
         
         if not self.summary_only:
             cm_plt = self.model.plot_cm(cm=cm)
-            roc_plt = self.model.plot_roc(y_test=self.test_rows[self.target_col], X_test = self.test_rows[predictor_cols])
-            pr1_plt = self.model.plot_precision_recall(y_test=self.test_rows[self.target_col], X_test = self.test_rows[predictor_cols], pos_label=1)
-            pr0_plt = self.model.plot_precision_recall(y_test=self.test_rows[self.target_col], X_test = self.test_rows[predictor_cols], pos_label=0)
+            roc_plt = self.model.plot_roc(y_test=y_test, y_probs=y_probs)
+            pr1_plt = self.model.plot_precision_recall(y_test=y_test, y_probs=y_probs, pos_label=1)
+            pr0_plt = self.model.plot_precision_recall(y_test=y_test, y_probs=y_probs, pos_label=0)
             cm_plt_train = self.model.plot_cm(cm=cm_train)
-            roc_plt_train = self.model.plot_roc(y_test=self.train_rows[self.target_col], X_test = self.train_rows[predictor_cols])
-            pr1_plt_train = self.model.plot_precision_recall(y_test=self.train_rows[self.target_col], X_test = self.train_rows[predictor_cols], pos_label=1)
-            pr0_plt_train = self.model.plot_precision_recall(y_test=self.train_rows[self.target_col], X_test = self.train_rows[predictor_cols], pos_label=0)
+            roc_plt_train = self.model.plot_roc(y_test=y_train, y_probs=y_probs_train)
+            pr1_plt_train = self.model.plot_precision_recall(y_test=y_train, y_probs=y_probs_train, pos_label=1)
+            pr0_plt_train = self.model.plot_precision_recall(y_test=y_train, y_probs=y_probs_train, pos_label=0)
         else:
             cm_plt = None
             roc_plt = None
@@ -184,35 +191,66 @@ class Experiment(AbstractPipelineConfig):
         # plt.close(roc_plt_train)
         # plt.close(pr1_plt)
         # plt.close(pr1_plt_train)
-        plt.close('all')
+        if not self.summary_only:
+            pyplot().close('all')
+
+    def query_cost_log(self):
+        '''Markdown section with the per-query cost table (slowest first) and the EXPLAIN output of the
+           dataloader, if it was profiling; an empty string otherwise'''
+
+        log = ''
+        if len(self.dloader.query_costs) > 0:
+            log += '\nQuery costs (each query timed on its own, bytes are the in-memory size of the result):\n\n'
+            log += '| Split | Query | Seconds | Rows | Bytes | Cached |\n| -- | -- | --: | --: | --: | -- |\n'
+            for cost in sorted(self.dloader.query_costs, key=lambda c: -c['seconds']):
+                log += '| %s | %s | %.2f | %d | %d | %s |\n' %(cost['split'], cost['query'], cost['seconds'],
+                                                              cost['rows'], cost['bytes'], cost['cached'])
+
+        for split, plan in sorted(self.dloader.explain_plans.items()):
+            log += '\nEXPLAIN (ANALYZE, BUFFERS) of the megaquery for %s split:\n```\n%s\n```\n' %(split, plan)
+
+        return log
 
     def write_log(self, cm, cm_plt, roc_plt, clf_report, coefs, auc, pr0_precision_top_10, pr0_precision_top_25,aupr0,pr1_plt, pr0_plt,
                     roc_plt_train, cm_train, cm_plt_train, clf_report_train, auc_train, pr1_plt_train, pr0_plt_train):
        
-        if not os.path.isdir(os.path.join(config.PERSISTENCE_PATH, self.logFolder)):
+        try:
             os.makedirs(os.path.join(config.PERSISTENCE_PATH, self.logFolder))
+        except OSError:
+            # it exists already (possibly created by a parallel worker just now)
+            if not os.path.isdir(os.path.join(config.PERSISTENCE_PATH, self.logFolder)):
+                raise
 
         if not self.summary_only:
 
             # String with common folder name
             logsubfoldername = '_'+datetime.datetime.fromtimestamp(self.starttime).strftime('%Y-%m-%d_%H-%M-%S')
-            logpath = os.path.join(config.PERSISTENCE_PATH, self.logFolder,logsubfoldername)
-
-            # Check that folder does not already exist (an experiment took <1 sec)
-            if os.path.isdir(logpath):
-                i=1
-                logpathstub = logpath
-                while os.path.isdir(logpath):
+            logsubfolderstub = logsubfoldername
+
+            # Make log folder; if it already exists (an experiment took <1 sec, or a parallel worker
+            # started at the same second), number it. mkdir fails if another process made it first.
+            i=1
+            while True:
+                logpath = os.path.join(config.PERSISTENCE_PATH, self.logFolder,logsubfoldername)
+                try:
+                    os.mkdir(logpath)
+                    break
+                except OSError:
+                    if not os.path.isdir(logpath):
+                        raise
                     i += 1
-                    logpath = logpathstub + '_' + str(i)
-
-            # Make log folder
+                    logsubfoldername = logsubfolderstub + '_' + str(i)
             logpath += '/'
-            os.makedirs(logpath)
 
             # Write pickle
+            import pickle
             pickle.dump(self, open(logpath + 'experiment.p', "wb" ) )
 
+            # Write the query costs of a profiling dataloader
+            if len(self.dloader.query_costs) > 0 or len(self.dloader.explain_plans) > 0:
+                with open(logpath + 'query_costs.json', 'w') as f:
+                    json.dump({'queries': self.dloader.query_costs, 'explain': self.dloader.explain_plans}, f, indent=2)
+
         # Write figures to a folder
         if cm_plt!= None: cm_plt.savefig(logpath+'cm_plt.png', pad_inches=1)
         if roc_plt!= None: roc_plt.savefig(logpath+'roc_plt.png')
@@ -270,7 +308,7 @@ Megaquery for test split:
 ```sql
 {test_megaquery}
 ```
-
+{query_costs}
 **Dropped rows with NaNs:**
 Training data: Dropped {train_nans} out of {train_rows} rows.
 Test data: Dropped {test_nans} out of {test_rows} rows.
@@ -351,6 +389,7 @@ Precision-Recall curves for **persisting**:
                         params='\n'.join(['* '+param+': '+str(val)   for param,val in self.model.scikit_params.items()]),
                         train_megaquery=self.dloader.train_megaquery,
                         test_megaquery=self.dloader.test_megaquery,
+                        query_costs=self.query_cost_log(),
                         train_nans=self.train_rows_dropped,
                         train_rows=self.train_rows.shape[0],
                         test_nans=self.test_rows_dropped,
@@ -390,17 +429,25 @@ Precision-Recall curves for **persisting**:
                 outcome = self.target_col + '<br>WHERE<br>' + '<br>AND '.join([r['test'].feature_col + r['restriction'] for r in self.dloader.restrictors])
 
 
-            # If looplog file does not exist, create empty looplog with headers
-            if os.path.isfile(looplogpath)==False:
-                with open(looplogpath, 'w') as f:
-                    f.write(
-'''| Run time | Outcome | Train Start | Split Date | Test End | Classifier | Features | AUC | AUC (Train) | Precision Top 10% | Precision Top 25% | AUPR | Log |
-| -- | -- | -- | --- | --- | --- | --- | --- | --- | --- | --- | --- | --- |''')
+            # Parallel workers (loopmodels.py --workers) share the looplog: hold an exclusive lock on it
+            # while checking for the headers and appending the row, so that rows are never interleaved
+            f = open(looplogpath, 'a+')
+            fcntl.flock(f, fcntl.LOCK_EX)
+
+            looplog_header = '''| Run time | Outcome | Train Start | Split Date | Test End | Classifier | Features | AUC | AUC (Train) | Precision Top 10% | Precision Top 25% | Recall Top 10% | Lift Top 10% | AUPR | Log |
+| -- | -- | -- | --- | --- | --- | --- | --- | --- | --- | --- | --- | --- | --- | --- |'''
+
+            # If looplog file is empty, write the headers first. A looplog whose last table has other
+            # columns (e.g. from before the recall and lift columns) gets a new table below it.
+            f.seek(0)
+            headers = [line.strip() for line in f if line.startswith('| Run time')]
+            if len(headers) == 0 or headers[-1] != looplog_header.split('\n')[0]:
+                f.write(('\n\n' if len(headers) > 0 else '') + looplog_header)
 
-            # Add new row to looplog
-            with open(looplogpath, "a") as f:
+            # Add new row to looplog; closing the file flushes it and releases the lock
+            with f:
                 looplog_row_template='''
-| {starttime} | {outcome} | {trainstart} | {splitdate} | {testend} | {clf} | {listoffeatures} | {auc} | {auc_train} | {pr0_precision_top_10}| {pr0_precision_top_25}| {aupr0} | [Link]({logpath}) |'''
+| {starttime} | {outcome} | {trainstart} | {splitdate} | {testend} | {clf} | {listoffeatures} | {auc} | {auc_train} | {pr0_precision_top_10}| {pr0_precision_top_25}| {pr0_recall_top_10} | {pr0_lift_top_10} | {aupr0} | [Link]({logpath}) |'''
 
                 f.write(
                     looplog_row_template.format(
@@ -415,12 +462,24 @@ Precision-Recall curves for **persisting**:
                         auc_train=round(auc_train,3),
                         pr0_precision_top_10 = round(pr0_precision_top_10,3),
                         pr0_precision_top_25 = round(pr0_precision_top_25,3),
+                        pr0_recall_top_10 = round(self.top_k.loc[0.1, 'recall'],3),
+                        pr0_lift_top_10 = round(self.top_k.loc[0.1, 'lift'],3),
                         aupr0 = round(aupr0, 3),
                         logpath='' if self.summary_only else logsubfoldername+'/log.md'
                     )
                 )
 
-            # # Render looplog Markdown to HTML
+            # Add the precision, recall and lift at every k to the results file next to the looplog, one line per k
+            top_k = self.top_k.reset_index()
+            top_k.insert(0, 'run_time', datetime.datetime.fromtimestamp(self.starttime).strftime('%Y-%m-%d %H:%M:%S'))
+            top_k.insert(1, 'classifier', self.model.scikit_class.__name__)
+            top_k.insert(2, 'features', ' '.join(self.feature_list))
+            top_k.insert(3, 'log', '' if self.summary_only else logsubfoldername+'/log.md')
+            with open(os.path.splitext(looplogpath)[0] + '_top_k.csv', 'a') as f:
+                fcntl.flock(f, fcntl.LOCK_EX)
+                top_k.to_csv(f, header=os.fstat(f.fileno()).st_size == 0, index=False)
+
+            # # Render looplog Markdown to HTML (import markdown first)
             # markdown.markdownFromFile(input=looplogpath,
             #                           output=os.path.join(config.PERSISTENCE_PATH, self.logFolder,'looplog.html'),
             #                           extensions=['markdown.extensions.tables']
@@ -0,0 +1,159 @@
+__author__ = 'College Persistence Team'
+
+import os
+import hashlib
+import tempfile
+import threading
+import numpy as np
+import pandas as pd
+from util import embedded_engine
+
+
+class FeatureCache(object):
+    '''
+    Content-addressed on-disk cache for the rows of individual features.
+
+    Entries are keyed by the fully generated SQL of a feature (bounds included), the schema
+    it runs against and a stamp of the data in that schema, so rerunning the ETL invalidates
+    every entry without anyone having to clear the folder. Each entry is one compressed .npz
+    file holding one array per column. Once the folder grows beyond max_bytes, the least
+    recently used entries are evicted.
+    '''
+
+    def __init__(self, cache_folder, max_bytes=2*1024**3, data_version=None):
+        '''
+        :param cache_folder: folder the cache files are written to, created if it does not exist
+        :param max_bytes: size limit of the folder; the least recently used files are evicted beyond it
+        :param data_version: optional fixed data version string; if None, a stamp is read from the database
+        '''
+
+        self.cache_folder = cache_folder
+        self.max_bytes = max_bytes
+        self.data_version = data_version
+        self.stamp = None
+
+        if not os.path.isdir(self.cache_folder):
+            os.makedirs(self.cache_folder)
+
+        # features may be loaded from several threads at once
+        self.lock = threading.Lock()
+
+        # counters, reported by summary()
+        self.hits = 0
+        self.misses = 0
+        self.seconds_saved = 0.0
+
+    def __getstate__(self):
+        # the cache is pickled with its dataloader (see Experiment.write_log), but locks cannot be
+        state = self.__dict__.copy()
+        del state['lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def stamp_from_db(self, connection, schema):
+        '''
+        Set the data version stamp that all following keys are built with.
+        Unless a fixed data_version was given, the stamp is derived from the table oids and
+        the insert/update/delete counters of all tables in the schema, which change whenever
+        the ETL drops, recreates or modifies a table. On the embedded engine, the stamp is derived from
+        the export (see EmbeddedConnection.data_version).
+        '''
+
+        if self.data_version != None:
+            self.stamp = '%s:%s' %(schema, self.data_version)
+            return self.stamp
+
+        if isinstance(connection, embedded_engine.EmbeddedConnection):
+            self.stamp = '%s:%s' %(schema, hashlib.sha1(connection.data_version(schema)).hexdigest())
+            return self.stamp
+
+        cur = connection.cursor()
+        cur.execute('''
+            select relid, n_tup_ins, n_tup_upd, n_tup_del
+            from pg_stat_user_tables
+            where schemaname = %s
+            order by relid''', (schema,))
+        tablestats = cur.fetchall()
+        cur.close()
+
+        self.stamp = '%s:%s' %(schema, hashlib.sha1(str(tablestats)).hexdigest())
+        return self.stamp
+
+    def key(self, query):
+        if self.stamp == None:
+            raise ValueError("FeatureCache has no data version stamp; call stamp_from_db() first.")
+        return hashlib.sha1(self.stamp + '\n' + ' '.join(query.split())).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.cache_folder, key + '.npz')
+
+    def get(self, key):
+        '''Return the cached rows for key as a dataframe, or None on a miss'''
+
+        path = self._path(key)
+        try:
+            stored = np.load(path, allow_pickle=True)
+        except IOError: # not cached (or evicted by another thread in the meantime)
+            with self.lock:
+                self.misses += 1
+            return None
+
+        with stored:
+            columns = stored['__columns__']
+            rows = pd.DataFrame(dict(('c%d' %i, stored['c%d' %i]) for i in range(len(columns))),
+                                index=pd.Index(stored['__index__'], name=stored['__index_name__'][0]))
+            rows = rows[['c%d' %i for i in range(len(columns))]]
+            rows.columns = list(columns)
+            seconds = float(stored['__seconds__'][0])
+
+        # mark as recently used for the LRU eviction
+        os.utime(path, None)
+
+        with self.lock:
+            self.hits += 1
+            self.seconds_saved += seconds
+        return rows
+
+    def put(self, key, rows, seconds):
+        '''
+        Store rows under key. seconds is how long the database took to produce them,
+        and is what a later hit counts as saved.
+        '''
+
+        arrays = dict(('c%d' %i, rows[c].values) for i,c in enumerate(rows.columns))
+        arrays['__columns__'] = np.array(list(rows.columns), dtype=object)
+        arrays['__index__'] = rows.index.values
+        arrays['__index_name__'] = np.array([rows.index.name], dtype=object)
+        arrays['__seconds__'] = np.array([seconds])
+
+        # write to a temp file first so that a crashed run never leaves a half-written entry
+        fd, tmppath = tempfile.mkstemp(suffix='.npz', dir=self.cache_folder)
+        os.close(fd)
+        np.savez_compressed(tmppath, **arrays)
+        os.rename(tmppath, self._path(key))
+
+        with self.lock:
+            self.evict()
+
+    def evict(self):
+        '''Delete least recently used entries until the folder fits into max_bytes'''
+
+        entries = []
+        for filename in os.listdir(self.cache_folder):
+            if filename.endswith('.npz') and not filename.startswith('tmp'):
+                stat = os.stat(os.path.join(self.cache_folder, filename))
+                entries.append((stat.st_mtime, stat.st_size, filename))
+
+        total = sum(e[1] for e in entries)
+        for mtime, size, filename in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(os.path.join(self.cache_folder, filename))
+            total -= size
+
+    def summary(self):
+        return 'Feature cache: %d hits, %d misses, %.1f seconds of database time saved' %(
+            self.hits, self.misses, self.seconds_saved)
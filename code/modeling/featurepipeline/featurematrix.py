@@ -0,0 +1,89 @@
+__author__ = 'College Persistence Team'
+
+import mmap
+from collections import OrderedDict
+import numpy as np
+import pandas as pd
+
+
+class FeatureMatrix(object):
+    '''
+    Read-only, column-indexed store of the rows of a dataloader split, from which experiments
+    take their subsets of columns.
+
+    The columns are kept in one numpy block per dtype (column-major, so every column is contiguous),
+    in the order of the original frame, so that the columns of one feature sit next to each other.
+    Categorical columns have no numpy dtype, and are kept as they are.
+    A map from column name to (block, position) locates them. frame() hands out columns as views
+    of these blocks wherever possible, instead of deep copying them for every experiment. The blocks
+    are marked read-only, so whoever needs to write into the rows has to copy them first (postprocessors
+    never do: they return new columns, see DataLoader.postprocessed_columns).
+
+    With shared, the blocks are allocated in anonymous shared memory, so that processes forked
+    afterwards (the experiment workers of loopmodels.py --workers) map the same pages instead of
+    copying them. Blocks of python objects hold pointers into the private heap, and are allocated as usual.
+    '''
+
+    def __init__(self, rows, shared=False):
+
+        self.index = rows.index
+        self.blocks = OrderedDict()
+        self.locations = {}
+        self.categoricals = {}
+
+        by_dtype = OrderedDict()
+        for column in rows.columns:
+            if str(rows[column].dtype) == 'category':
+                self.categoricals[column] = rows[column]
+                self.locations[column] = ('category', None)
+            else:
+                by_dtype.setdefault(rows[column].dtype, []).append(column)
+
+        for dtype, columns in by_dtype.items():
+            values = rows[columns].values
+            if shared and not values.dtype.hasobject:
+                block = np.ndarray(values.shape, dtype=values.dtype, order='F',
+                                   buffer=mmap.mmap(-1, max(values.nbytes, 1)))
+                block[:] = values
+            else:
+                block = np.asfortranarray(values)
+            block.flags.writeable = False
+            self.blocks[dtype] = block
+            for position, column in enumerate(columns):
+                self.locations[column] = (dtype, position)
+
+    def frame(self, columns):
+        '''
+        Returns a dataframe of columns over the rows of the matrix, grouped by dtype and otherwise in
+        the requested order. The columns of each block are a view of it if they are adjacent in the
+        block and requested in the same order, and a copy of only these columns otherwise. Columns of
+        several dtypes are put side by side with a single concat, which copies the requested columns
+        (but never the rest of the matrix).
+        '''
+
+        for column in columns:
+            if column not in self.locations:
+                raise ValueError("The feature matrix has no column %s" %(column))
+
+        parts = []
+        for dtype, block in self.blocks.items():
+            names = [c for c in columns if self.locations[c][0] == dtype]
+            if len(names) == 0:
+                continue
+            positions = [self.locations[c][1] for c in names]
+            if positions == range(positions[0], positions[0] + len(positions)):
+                values = block[:, positions[0]:positions[0] + len(positions)]
+            else:
+                values = block[:, positions]
+            parts.append(pd.DataFrame(values, index=self.index, columns=names, copy=False))
+        for column in [c for c in columns if c in self.categoricals]:
+            parts.append(self.categoricals[column].to_frame())
+
+        if len(parts) == 1:
+            return parts[0]
+        return pd.concat(parts, axis=1)
+
+    def nbytes(self):
+        '''Size of the blocks in bytes'''
+        return sum(block.nbytes for block in self.blocks.values()) + \
+            sum(c.cat.codes.values.nbytes for c in self.categoricals.values())
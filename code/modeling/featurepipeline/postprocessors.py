@@ -1,40 +1,100 @@
 import pandas as pd
+import numpy as np
 
-'''
-TODO: bunch of functions
-	  each works on a feature's column
-	  does some postprocessing in pandas
-	  returns entire dataframe with updated column
-	  the features get to decide which of the functions here they would like to invoke
-'''
-
-# def exampleprocessor(data,**kwargs):
-# 	'''
-# 	@param data: huge dataframe with all the data
-# 	@param kwargs: all kinds of more fun parameters you might need!
-# 	@return: modified version of data
-# 	'''
-# 	pass
-
-def getdummies(data, columns = [], **kwargs):
-	return pd.get_dummies(data, columns = columns,**kwargs)
-
-def fillNullWithMedian(data, columns):
-	data = data.fillna(data.median()[columns])
-	return data
-
-def dummyCodeNull(data, columns):
-
-	for c in columns:
-		if data[c].isnull().sum() > 0:
-			data[c + '_isnull'] = (data[c].isnull()).astype(int)
-	
-	data[columns] = data[columns].fillna(0)
-	return data
-
-def fillNullWithZero(data, columns):
-	data[columns] = data[columns].fillna(0)
-	return data
+class Postprocessor(object):
+	'''
+	Turns one column of the rows into the columns the models get. Features list the postprocessors of
+	their columns with keyword arguments, e.g. postprocessors = {pp.getdummies: {}}.
+	A postprocessor is fit on the train rows of the column, and then transforms the rows of any split
+	the same way: the train and test rows of a dataloader, or new rows to score with a trained model.
+	'''
+
+	def __init__(self, **kwargs):
+		self.kwargs = kwargs
+
+	def fit(self, column):
+		'''
+		@param column: series of the train rows of the column
+		@return: self
+		'''
+		return self
+
+	def transform(self, column):
+		'''
+		@param column: series of the rows of the column
+		@return: dataframe of the columns that replace it
+		'''
+		raise NotImplementedError
+
+class getdummies(Postprocessor):
+	''' One 0/1 column per category of the train rows; categories that only occur in other rows get none '''
+
+	def fit(self, column):
+		self.categories = sorted(column.dropna().unique())
+		return self
+
+	def transform(self, column):
+		kwargs = dict({'prefix': column.name}, **self.kwargs)
+		values = pd.Series(pd.Categorical(np.asarray(column), categories=self.categories), index=column.index)
+		return pd.get_dummies(values, **kwargs)
+
+class fillNullWithMedian(Postprocessor):
+	''' Fills the nulls with the median of the train rows '''
+
+	def fit(self, column):
+		self.median = column.median()
+		return self
+
+	def transform(self, column):
+		return column.fillna(self.median).to_frame()
+
+class dummyCodeNull(Postprocessor):
+	''' Fills the nulls with 0, and adds a column <column>_isnull flagging them if the train rows have any '''
+
+	def fit(self, column):
+		self.has_nulls = column.isnull().sum() > 0
+		return self
+
+	def transform(self, column):
+		rows = column.fillna(0).to_frame()
+		if self.has_nulls:
+			rows[column.name + '_isnull'] = (column.isnull()).astype(int)
+		return rows
+
+class fillNullWithZero(Postprocessor):
+	''' Fills the nulls with 0 '''
+
+	def transform(self, column):
+		return column.fillna(0).to_frame()
+
+def fit_postprocessors(column, postprocessors):
+	'''
+	@description: Fits the postprocessors of a column on its train rows, one after the other: each one is fit
+				  on the column as transformed by the ones before, as long as the column is not replaced.
+	@param column: series of the train rows of the column
+	@param postprocessors: dictionary of postprocessor -> keyword arguments, as the features list them
+	@return: list of the fitted postprocessors, and dataframe of the transformed train rows
+	'''
+
+	fitted = []
+	rows = column.to_frame()
+	for postprocessor, kwargs in postprocessors.items():
+		if column.name not in rows.columns:
+			break
+		fitted.append(postprocessor(**kwargs).fit(rows[column.name]))
+		rows = pd.concat([rows.drop(column.name, axis=1), fitted[-1].transform(rows[column.name])], axis=1)
+	return fitted, rows
+
+def apply_postprocessors(column, fitted):
+	'''
+	@description: Transforms the rows of a column with its fitted postprocessors (see fit_postprocessors)
+	@return: dataframe of the transformed rows
+	'''
+
+	rows = column.to_frame()
+	for postprocessor in fitted:
+		rows = pd.concat([rows.drop(column.name, axis=1), postprocessor.transform(rows[column.name])], axis=1)
+	return rows
 
 if __name__=='__main__':
 	pass
\ No newline at end of file
@@ -1,9 +1,25 @@
 import pandas as pd
 from abstractmodel import *
 import numpy as np
+import importlib
 from sklearn import metrics
-import matplotlib.pyplot as plt
-import seaborn as sns
+import curves
+
+
+def pyplot():
+    '''
+    matplotlib.pyplot, imported together with seaborn's plot style on the first plot. Runs with
+    summary_only never draw one, and importing them takes a noticeable part of their startup time.
+    '''
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    return plt
+
+
+def scikit_estimator(path):
+    '''The scikit estimator class at a dotted path such as 'sklearn.svm.SVC', imported on first use'''
+    module, name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module), name)
 
 
 class ScikitModel(AbstractModel):
@@ -16,6 +32,8 @@ class ScikitModel(AbstractModel):
 
         self.score_function
         AbstractModel.__init__(self)        
+        if isinstance(scikit_class, str):
+            scikit_class = scikit_estimator(scikit_class)
         self.scikit_class = scikit_class
         self.scikit_params = scikit_params
         self.scikit_model = self.scikit_class(**self.scikit_params)
@@ -40,7 +58,19 @@ class ScikitModel(AbstractModel):
     def predict(self,X_test):
         return self.scikit_model.predict(X_test)
 
-    ### Evaluation metrics
+    def scores(self, X):
+        '''
+        Scores the rows of X with a single inference pass. All evaluation metrics and plots below take
+        these arrays, so each split only needs to be scored once per experiment.
+        :return: array of the scores of both classes (one row per row of X, see score_function), and
+                 array of the hard predictions: the class with the higher score, which is what predict
+                 returns for all our models
+        '''
+        y_probs = self.score_function(X.values.astype(float, copy=False))  # to run the prediction, X needs to be cast to float
+        y_predicted = self.scikit_model.classes_[np.argmax(y_probs, axis=1)]
+        return y_probs, y_predicted
+
+    ### Evaluation metrics, from the labels and the scores or predictions of a split (see scores)
 
     def cm(self,y_test,y_predicted):
         # return confusion matrix
@@ -49,6 +79,7 @@ class ScikitModel(AbstractModel):
         return metrics.confusion_matrix(y_test, y_predicted)
 
     def plot_cm(self,cm):
+        plt = pyplot()
         # plot confusion matrix
         fig = plt.figure()
         plt.imshow(cm, interpolation = 'nearest', cmap = plt.cm.Blues)
@@ -66,13 +97,12 @@ class ScikitModel(AbstractModel):
     def clf_report(self, y_test, y_predicted):
         return metrics.classification_report(y_test, y_predicted)
 
-    def auc(self,y_test,X_test):
-        y_probs = self.score_function(X_test.astype(float))  # to run the prediction, the X_test needs to be cast to float
+    def auc(self, y_test, y_probs):
         return metrics.roc_auc_score(y_test, y_probs[:,1])
 
-    def aupr(self, y_test, X_test, pos_label):
+    def aupr(self, y_test, y_probs, pos_label):
 
-        y_score = self.score_function(X_test.astype(float))[:,pos_label]  # to run the prediction, the X_test needs to be cast to float
+        y_score = y_probs[:,pos_label]
 
         precision_curve, recall_curve, pr_thresholds = metrics.precision_recall_curve(y_test, y_score, pos_label=pos_label)
 
@@ -80,40 +110,25 @@ class ScikitModel(AbstractModel):
 
         return pr_auc 
 
-    def precision_top_k_percent(self, k, X_test, y_test, y_predicted, pos_label):
-
-        y_probs = self.score_function(X_test.astype(float))[:,pos_label]  # to run the prediction, the X_test needs to be cast to float
-        precision = metrics.precision_score(y_test, y_predicted)
+    def top_k_table(self, y_test, y_probs, pos_label, ks=curves.TOP_K):
+        '''Precision, recall and lift of the top k of the rows by their score for pos_label, for every
+           fraction k in ks (see curves.top_k_table)'''
 
         # if predicting the negative class, invert the True/False labels
-
+        y_test = np.asarray(y_test).astype(bool)
         if pos_label == 0:
             y_test = ~y_test
 
-        #cast y_test to float and also make it a matrix
-
-        y_test = y_test.astype(float).as_matrix()
-
-        # Compute the precision on the top k%.
-        #get the indices of the probabilities sorted in descending order
-        ord_prob = np.argsort(y_probs,)[::-1] 
-
-        # get the number of labels to look at based on k
-        r = int(k * len(y_test))
+        return curves.top_k_table(y_test, y_probs[:,pos_label], ks)
 
-        if r == 0:
-            pre_score_k = 0.0
-        else:
-            # sum the number of hits in the r first labels, sorted by predicted probability
-            pre_score_k = np.sum(y_test[ord_prob][:r]) / float(r)
+    def precision_top_k_percent(self, k, y_test, y_probs, pos_label):
+        return self.top_k_table(y_test, y_probs, pos_label, [k])['precision'].iloc[0]
 
-        return pre_score_k
 
-
-    def plot_roc(self,y_test,X_test):
+    def plot_roc(self, y_test, y_probs):
+        plt = pyplot()
         # plot ROC curve
 
-        y_probs = self.score_function(X_test.astype(float))  # to run the prediction, the X_test needs to be cast to float
         fpr, tpr, thresholds = metrics.roc_curve(y_test, y_probs[:,1])
         roc_auc = metrics.auc(fpr, tpr)
 
@@ -128,19 +143,12 @@ class ScikitModel(AbstractModel):
         plt.legend(loc="lower right")
         return fig
 
-    def plot_precision_recall(self, y_test, X_test, pos_label):
-        y_score = self.score_function(X_test.astype(float))[:,pos_label]  # to run the prediction, the X_test needs to be cast to float
-
-        precision_curve, recall_curve, pr_thresholds = metrics.precision_recall_curve(y_test, y_score, pos_label=pos_label)
-        precision_curve = precision_curve[:-1]
-        recall_curve = recall_curve[:-1]
-        pct_above_per_thresh = []
-        number_scored = len(y_score)
-        for value in pr_thresholds:
-          num_above_thresh = len(y_score[y_score>=value])
-          pct_above_thresh = num_above_thresh / float(number_scored)
-          pct_above_per_thresh.append(pct_above_thresh)
-        pct_above_per_thresh = np.array(pct_above_per_thresh)
+    def plot_precision_recall(self, y_test, y_probs, pos_label):
+        plt = pyplot()
+        curve = curves.precision_recall_population(np.asarray(y_test) == pos_label, y_probs[:,pos_label])
+        pct_above_per_thresh = curve['population'].values
+        precision_curve = curve['precision'].values
+        recall_curve = curve['recall'].values
 
         # Create plot
         fig = plt.figure()
@@ -1,5 +1,6 @@
 from modeling.featurepipeline.abstractfeature import *
 from modeling.featurepipeline.abstractboundedfeature import *
+from modeling.featurepipeline.abstractaggregatefeature import *
 from modeling.featurepipeline.abstractpandasfeature import *
 from modeling.featurepipeline.abstractboundedpandasfeature import *
 from modeling.featurepipeline.abstracttargetfeature import *
@@ -65,14 +66,18 @@ class finalUnweightedGPA(AbstractFeature):
     postprocessors = {pp.dummyCodeNull: {}}
     index_level = "studentid" 
 
+# the yearly GPAs with the number of years until graduation, which all GPA by year features are computed from
+GPA_YEAR_DIFF = {'gpa_year_diff': ('''
+    select gpa_by_year.studentid, unweighted_gpa, high_school_class - school_year as year_diff
+    from gpa_by_year
+    left join hs_enrollment
+    on gpa_by_year.studentid = hs_enrollment.studentid''', 'studentid')}
+
 class year12GPA(AbstractFeature): 
     name= "Student's year eleven Unweighted GPA"
     sql_query= '''SELECT studentid, year12_unweightedgpa from
     (select studentid, avg(unweighted_gpa) as year12_unweightedgpa, count(unweighted_gpa) as count_gpa from
-    (select gpa_by_year.studentid, unweighted_gpa, high_school_class - school_year as year_diff
-    from gpa_by_year
-    left join hs_enrollment
-    on gpa_by_year.studentid = hs_enrollment.studentid) as foo
+    gpa_year_diff as foo
     where foo.year_diff = 0
     group by studentid) as bar
     where count_gpa = 1
@@ -83,6 +88,7 @@ class year12GPA(AbstractFeature):
     # postprocessors = {pp.dummyCodeNull: {}}
     postprocessors = {}
     index_level = "studentid"  
+    shared_tables = GPA_YEAR_DIFF
 
 class year11GPA(AbstractFeature): 
     name= "Student's year eleven Unweighted GPA"
@@ -91,10 +97,7 @@ class year11GPA(AbstractFeature):
     # also makes sure that we're getting GPA from the correct year (in this case 1 away from graduation year)
     sql_query= '''SELECT studentid, year11_unweightedgpa from
     (select studentid, avg(unweighted_gpa) as year11_unweightedgpa, count(unweighted_gpa) as count_gpa from
-    (select gpa_by_year.studentid, unweighted_gpa, high_school_class - school_year as year_diff
-    from gpa_by_year
-    left join hs_enrollment
-    on gpa_by_year.studentid = hs_enrollment.studentid) as foo
+    gpa_year_diff as foo
     where foo.year_diff = 1
     group by studentid) as bar
     where count_gpa = 1
@@ -105,15 +108,13 @@ class year11GPA(AbstractFeature):
     # postprocessors = {pp.dummyCodeNull: {}}
     postprocessors = {}
     index_level = "studentid"     
+    shared_tables = GPA_YEAR_DIFF
 
 class year10GPA(AbstractFeature): 
     name= "Student's year ten Unweighted GPA"
     sql_query= '''SELECT studentid, year10_unweightedgpa from
     (select studentid, avg(unweighted_gpa) as year10_unweightedgpa, count(unweighted_gpa) as count_gpa from
-    (select gpa_by_year.studentid, unweighted_gpa, high_school_class - school_year as year_diff
-    from gpa_by_year
-    left join hs_enrollment
-    on gpa_by_year.studentid = hs_enrollment.studentid) as foo
+    gpa_year_diff as foo
     where foo.year_diff = 2
     group by studentid) as bar
     where count_gpa = 1
@@ -124,16 +125,14 @@ class year10GPA(AbstractFeature):
     # postprocessors = {pp.dummyCodeNull: {}}
     postprocessors = {}
     index_level = "studentid" 
+    shared_tables = GPA_YEAR_DIFF
 
 class year9GPA(AbstractFeature): 
     name= "Student's year nine Unweighted GPA"
 
     sql_query= '''SELECT studentid, year9_unweightedgpa from
 (select studentid, avg(unweighted_gpa) as year9_unweightedgpa, count(unweighted_gpa) as count_gpa from
-    (select gpa_by_year.studentid, unweighted_gpa, high_school_class - school_year as year_diff
-    from gpa_by_year
-    left join hs_enrollment
-    on gpa_by_year.studentid = hs_enrollment.studentid) as foo
+    gpa_year_diff as foo
     where foo.year_diff = 3
     group by studentid) as bar
     where count_gpa = 1
@@ -144,15 +143,13 @@ class year9GPA(AbstractFeature):
     # postprocessors = {pp.dummyCodeNull: {}}
     postprocessors = {}
     index_level = "studentid"              
+    shared_tables = GPA_YEAR_DIFF
 
 class avgYear11_12UnweightedGPA(AbstractFeature): 
     name= "Student's average unweighted GPA in years 11 and 12"
     sql_query= '''SELECT studentid, avg_y11_y12_unweightedgpa from
         (select studentid, avg(unweighted_gpa) as avg_y11_y12_unweightedgpa, count(unweighted_gpa) as count_gpa from
-            (select gpa_by_year.studentid, unweighted_gpa, high_school_class - school_year as year_diff
-            from gpa_by_year
-            left join hs_enrollment
-            on gpa_by_year.studentid = hs_enrollment.studentid) as foo
+            gpa_year_diff as foo
         where foo.year_diff <= 1
         group by studentid) as bar
     where count_gpa =2
@@ -163,15 +160,13 @@ class avgYear11_12UnweightedGPA(AbstractFeature):
     # postprocessors = {pp.dummyCodeNull: {}}
     postprocessors = {}
     index_level = "studentid" 
+    shared_tables = GPA_YEAR_DIFF
 
 class avgYear9_10UnweightedGPA(AbstractFeature): 
     name= "Student's average unweighted GPA in years 9 and 10"
     sql_query= '''SELECT studentid, avg_y9_y10_unweightedgpa from
         (select studentid, avg(unweighted_gpa) as avg_y9_y10_unweightedgpa, count(unweighted_gpa) as count_gpa from
-            (select gpa_by_year.studentid, unweighted_gpa, high_school_class - school_year as year_diff
-            from gpa_by_year
-            left join hs_enrollment
-            on gpa_by_year.studentid = hs_enrollment.studentid) as foo
+            gpa_year_diff as foo
         where foo.year_diff > 1 and foo.year_diff < 4
         group by studentid) as bar
     where count_gpa =2
@@ -182,25 +177,20 @@ class avgYear9_10UnweightedGPA(AbstractFeature):
     # postprocessors = {pp.dummyCodeNull: {}}
     postprocessors= {}
     index_level = "studentid"
+    shared_tables = GPA_YEAR_DIFF
 
 class ChangeInUnweightedGPA(AbstractFeature): 
     name= "Difference in avg unweighted gpa in years 9 and 10, and 11 and 12"
     sql_query= '''SELECT later.studentid, (later.avg_y11_y12_unweightedgpa - earlier.avg_y9_y10_unweightedgpa) as unweighted_gpa_diff FROM    
         (SELECT studentid, avg_y11_y12_unweightedgpa FROM
             (select studentid, avg(unweighted_gpa) as avg_y11_y12_unweightedgpa, count(unweighted_gpa) as count_gpa from
-                (select gpa_by_year.studentid, unweighted_gpa, high_school_class - school_year as year_diff
-                from gpa_by_year
-                left join hs_enrollment
-                on gpa_by_year.studentid = hs_enrollment.studentid) as foo
+                gpa_year_diff as foo
             where foo.year_diff <= 1
             group by studentid) as bar
         where count_gpa =2) as later
         left join (select studentid, avg_y9_y10_unweightedgpa from
             (select studentid, avg(unweighted_gpa) as avg_y9_y10_unweightedgpa, count(unweighted_gpa) as count_gpa from
-                (select gpa_by_year.studentid, unweighted_gpa, high_school_class - school_year as year_diff
-                from gpa_by_year
-                left join hs_enrollment
-                on gpa_by_year.studentid = hs_enrollment.studentid) as foo
+                gpa_year_diff as foo
             where foo.year_diff > 1 and foo.year_diff < 4
             group by studentid) as bar
         where count_gpa =2) as earlier
@@ -212,6 +202,7 @@ class ChangeInUnweightedGPA(AbstractFeature):
     # postprocessors = {pp.dummyCodeNull: {}}
     postprocessors = {}
     index_level = "studentid"           
+    shared_tables = GPA_YEAR_DIFF
 
 
 class HighSchoolMostRecentlyAttended(AbstractFeature): #TODO MAKE THIS FEATURE BOUNDABLE 
@@ -746,25 +737,39 @@ class NetworkKIPPNJ(AbstractTargetFeature):
 # =======================================
 
 
-# number of APs, number of honors, number of courses
-class numberAPsYear12(AbstractBoundedFeature):
-    name = 'number of AP courses in the last year of HS'
-    sql_query='''
-        WITH tmp as(
+# the AP and honors counts aggregate the same rows, so that the dataloader can fuse them into one scan of courses
+COURSES_SOURCE = '''
             SELECT
                 courses.studentid,
+                semester_taken,
                 grade_available,
                 course_number,
                 was_ap,
+                was_honors,
                 high_school_class-year_taken as yearsbeforegrad
             FROM courses
             LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, sum(was_ap::int) as numberapsyear12
-        FROM tmp
-        where yearsbeforegrad=0 {}
-        GROUP BY studentid
-    '''
+        '''
+
+# the rank features fuse into a scan of their own, so that the window function over all courses
+# only runs when one of them is selected
+COURSES_RANK_SOURCE = '''
+            SELECT
+                courses.studentid,
+                semester_taken,
+                grade_available,
+                high_school_class-year_taken as yearsbeforegrad,
+                percent_rank() OVER (PARTITION BY course_number ORDER BY percent_grade) AS percrank
+            FROM courses
+            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
+        '''
+
+# number of APs, number of honors, number of courses
+class numberAPsYear12(AbstractAggregateFeature):
+    name = "number of AP courses in the last year of HS"
+    source = COURSES_SOURCE
+    aggregate = "sum(was_ap::int){filter}"
+    condition = "yearsbeforegrad=0"
     index_col = "studentid"
     feature_col = "numberapsyear12"
     feature_type = "numerical"
@@ -772,24 +777,11 @@ class numberAPsYear12(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-class numberAPsYear11(AbstractBoundedFeature):
-    name = 'number of AP courses in the second to last year of HS'
-    sql_query='''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                grade_available,
-                course_number,
-                was_ap,
-                high_school_class-year_taken as yearsbeforegrad
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, sum(was_ap::int) as numberapsyear11
-        FROM tmp
-        where yearsbeforegrad=1 {}
-        GROUP BY studentid
-    '''
+class numberAPsYear11(AbstractAggregateFeature):
+    name = "number of AP courses in the second to last year of HS"
+    source = COURSES_SOURCE
+    aggregate = "sum(was_ap::int){filter}"
+    condition = "yearsbeforegrad=1"
     index_col = "studentid"
     feature_col = "numberapsyear11"
     feature_type = "numerical"
@@ -797,24 +789,11 @@ class numberAPsYear11(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-class numberAPsYear10(AbstractBoundedFeature):
-    name = 'number of AP courses in the third to last year of HS'
-    sql_query='''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                grade_available,
-                course_number,
-                was_ap,
-                high_school_class-year_taken as yearsbeforegrad
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, sum(was_ap::int) as numberapsyear10
-        FROM tmp
-        where yearsbeforegrad=2 {}
-        GROUP BY studentid
-    '''
+class numberAPsYear10(AbstractAggregateFeature):
+    name = "number of AP courses in the third to last year of HS"
+    source = COURSES_SOURCE
+    aggregate = "sum(was_ap::int){filter}"
+    condition = "yearsbeforegrad=2"
     index_col = "studentid"
     feature_col = "numberapsyear10"
     feature_type = "numerical"
@@ -822,24 +801,11 @@ class numberAPsYear10(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-class numberHonsYear12(AbstractBoundedFeature):
-    name = 'number of honor courses in the last year of HS'
-    sql_query='''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                grade_available,
-                course_number,
-                was_honors,
-                high_school_class-year_taken as yearsbeforegrad
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, sum(was_honors::int) as numberhonsyear12
-        FROM tmp
-        where yearsbeforegrad=0 {}
-        GROUP BY studentid
-    '''
+class numberHonsYear12(AbstractAggregateFeature):
+    name = "number of honor courses in the last year of HS"
+    source = COURSES_SOURCE
+    aggregate = "sum(was_honors::int){filter}"
+    condition = "yearsbeforegrad=0"
     index_col = "studentid"
     feature_col = "numberhonsyear12"
     feature_type = "numerical"
@@ -847,24 +813,11 @@ class numberHonsYear12(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-class numberHonsYear11(AbstractBoundedFeature):
-    name = 'number of honor courses in the second to last year of HS'
-    sql_query='''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                grade_available,
-                course_number,
-                was_honors,
-                high_school_class-year_taken as yearsbeforegrad
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, sum(was_honors::int) as numberhonsyear11
-        FROM tmp
-        where yearsbeforegrad=1 {}
-        GROUP BY studentid
-    '''
+class numberHonsYear11(AbstractAggregateFeature):
+    name = "number of honor courses in the second to last year of HS"
+    source = COURSES_SOURCE
+    aggregate = "sum(was_honors::int){filter}"
+    condition = "yearsbeforegrad=1"
     index_col = "studentid"
     feature_col = "numberhonsyear11"
     feature_type = "numerical"
@@ -872,24 +825,11 @@ class numberHonsYear11(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-class numberHonsYear10(AbstractBoundedFeature):
-    name = 'number of honor courses in the third to last year of HS'
-    sql_query='''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                grade_available,
-                course_number,
-                was_honors,
-                high_school_class-year_taken as yearsbeforegrad
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, sum(was_honors::int) as numberhonsyear10
-        FROM tmp
-        where yearsbeforegrad=2 {}
-        GROUP BY studentid
-    '''
+class numberHonsYear10(AbstractAggregateFeature):
+    name = "number of honor courses in the third to last year of HS"
+    source = COURSES_SOURCE
+    aggregate = "sum(was_honors::int){filter}"
+    condition = "yearsbeforegrad=2"
     index_col = "studentid"
     feature_col = "numberhonsyear10"
     feature_type = "numerical"
@@ -897,29 +837,11 @@ class numberHonsYear10(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-class maxRankYear12(AbstractBoundedFeature):
-
-    def __init__(self, lower_bound = None, upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-            
+class maxRankYear12(AbstractAggregateFeature):
     name = "maximum percentile rank of percent grade per student for the last year of HS"
-    sql_query = '''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                semester_taken,
-                grade_available,
-                course_number,
-                high_school_class-year_taken as yearsbeforegrad,
-                percent_rank() OVER (PARTITION BY course_number ORDER BY percent_grade) AS percrank
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, max(percrank) as maxrankyear12
-        FROM tmp
-        where yearsbeforegrad=0 and semester_taken!=3 {}
-        GROUP BY studentid
-    '''
+    source = COURSES_RANK_SOURCE
+    aggregate = "max(percrank){filter}"
+    condition = "yearsbeforegrad=0 and semester_taken!=3"
     index_col = "studentid"
     feature_col = "maxrankyear12"
     feature_type = "numerical"
@@ -927,30 +849,11 @@ class maxRankYear12(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-
-class minRankYear12(AbstractBoundedFeature):
-
-    def __init__(self, lower_bound = None, upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-            
+class minRankYear12(AbstractAggregateFeature):
     name = "minimum percentile rank of percent grade per student for the last year of HS"
-    sql_query = '''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                semester_taken,
-                grade_available,
-                course_number,
-                high_school_class-year_taken as yearsbeforegrad,
-                percent_rank() OVER (PARTITION BY course_number ORDER BY percent_grade) AS percrank
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, min(percrank) as minrankyear12
-        FROM tmp
-        where yearsbeforegrad=0 and semester_taken!=3 {}
-        GROUP BY studentid
-    '''
+    source = COURSES_RANK_SOURCE
+    aggregate = "min(percrank){filter}"
+    condition = "yearsbeforegrad=0 and semester_taken!=3"
     index_col = "studentid"
     feature_col = "minrankyear12"
     feature_type = "numerical"
@@ -958,29 +861,11 @@ class minRankYear12(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-class maxRankYear11(AbstractBoundedFeature):
-
-    def __init__(self, lower_bound = None, upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-            
+class maxRankYear11(AbstractAggregateFeature):
     name = "maximum percentile rank of percent grade per student for the second to last year of HS"
-    sql_query = '''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                semester_taken,
-                grade_available,
-                course_number,
-                high_school_class-year_taken as yearsbeforegrad,
-                percent_rank() OVER (PARTITION BY course_number ORDER BY percent_grade) AS percrank
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, max(percrank) as maxrankyear11
-        FROM tmp
-        where yearsbeforegrad=1 and semester_taken!=3  {}
-        GROUP BY studentid
-    '''
+    source = COURSES_RANK_SOURCE
+    aggregate = "max(percrank){filter}"
+    condition = "yearsbeforegrad=1 and semester_taken!=3"
     index_col = "studentid"
     feature_col = "maxrankyear11"
     feature_type = "numerical"
@@ -988,30 +873,11 @@ class maxRankYear11(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-
-class minRankYear11(AbstractBoundedFeature):
-
-    def __init__(self, lower_bound = None, upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-            
+class minRankYear11(AbstractAggregateFeature):
     name = "minimum percentile rank of percent grade per student for the second to last year of HS"
-    sql_query = '''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                semester_taken,
-                grade_available,
-                course_number,
-                high_school_class-year_taken as yearsbeforegrad,
-                percent_rank() OVER (PARTITION BY course_number ORDER BY percent_grade) AS percrank
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, min(percrank) as minrankyear11
-        FROM tmp
-        where yearsbeforegrad=1 and semester_taken!=3 {}
-        GROUP BY studentid
-    '''
+    source = COURSES_RANK_SOURCE
+    aggregate = "min(percrank){filter}"
+    condition = "yearsbeforegrad=1 and semester_taken!=3"
     index_col = "studentid"
     feature_col = "minrankyear11"
     feature_type = "numerical"
@@ -1019,29 +885,11 @@ class minRankYear11(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-class maxRankYear10(AbstractBoundedFeature):
-
-    def __init__(self, lower_bound = None, upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-            
+class maxRankYear10(AbstractAggregateFeature):
     name = "maximum percentile rank of percent grade per student for the third to last year of HS"
-    sql_query = '''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                semester_taken,
-                grade_available,
-                course_number,
-                high_school_class-year_taken as yearsbeforegrad,
-                percent_rank() OVER (PARTITION BY course_number ORDER BY percent_grade) AS percrank
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, max(percrank) as maxrankyear10
-        FROM tmp
-        where yearsbeforegrad=2 and semester_taken!=3 {}
-        GROUP BY studentid
-    '''
+    source = COURSES_RANK_SOURCE
+    aggregate = "max(percrank){filter}"
+    condition = "yearsbeforegrad=2 and semester_taken!=3"
     index_col = "studentid"
     feature_col = "maxrankyear10"
     feature_type = "numerical"
@@ -1049,30 +897,11 @@ class maxRankYear10(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-
-class minRankYear10(AbstractBoundedFeature):
-
-    def __init__(self, lower_bound = None, upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-            
+class minRankYear10(AbstractAggregateFeature):
     name = "minimum percentile rank of percent grade per student for the third to last year of HS"
-    sql_query = '''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                semester_taken,
-                grade_available,
-                course_number,
-                high_school_class-year_taken as yearsbeforegrad,
-                percent_rank() OVER (PARTITION BY course_number ORDER BY percent_grade) AS percrank
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, min(percrank) as minrankyear10
-        FROM tmp
-        where yearsbeforegrad=2 and semester_taken!=3 {}
-        GROUP BY studentid
-    '''
+    source = COURSES_RANK_SOURCE
+    aggregate = "min(percrank){filter}"
+    condition = "yearsbeforegrad=2 and semester_taken!=3"
     index_col = "studentid"
     feature_col = "minrankyear10"
     feature_type = "numerical"
@@ -1080,29 +909,11 @@ class minRankYear10(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-class avgRankYear12(AbstractBoundedFeature):
-
-    def __init__(self, lower_bound = None, upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-            
+class avgRankYear12(AbstractAggregateFeature):
     name = "average percent rank in percent grade per student for the last year of HS"
-    sql_query = '''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                semester_taken,
-                grade_available,
-                course_number,
-                high_school_class-year_taken as yearsbeforegrad,
-                percent_rank() OVER (PARTITION BY course_number ORDER BY percent_grade) AS percrank
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, avg(percrank) as avgrankyear12
-        FROM tmp
-        where yearsbeforegrad=0 and semester_taken!=3 {}
-        GROUP BY studentid
-    '''
+    source = COURSES_RANK_SOURCE
+    aggregate = "avg(percrank){filter}"
+    condition = "yearsbeforegrad=0 and semester_taken!=3"
     index_col = "studentid"
     feature_col = "avgrankyear12"
     feature_type = "numerical"
@@ -1110,29 +921,11 @@ class avgRankYear12(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-class avgRankYear11(AbstractBoundedFeature):
-
-    def __init__(self, lower_bound = None, upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-            
+class avgRankYear11(AbstractAggregateFeature):
     name = "average percent rank in percent grade per student for second to last year of HS"
-    sql_query = '''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                semester_taken,
-                grade_available,
-                course_number,
-                high_school_class-year_taken as yearsbeforegrad,
-                percent_rank() OVER (PARTITION BY course_number ORDER BY percent_grade) AS percrank
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, avg(percrank) as avgrankyear11
-        FROM tmp
-        where yearsbeforegrad=1 and semester_taken!=3 {}
-        GROUP BY studentid
-    '''
+    source = COURSES_RANK_SOURCE
+    aggregate = "avg(percrank){filter}"
+    condition = "yearsbeforegrad=1 and semester_taken!=3"
     index_col = "studentid"
     feature_col = "avgrankyear11"
     feature_type = "numerical"
@@ -1140,29 +933,11 @@ class avgRankYear11(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col = "grade_available"
 
-class avgRankYear10(AbstractBoundedFeature):
-
-    def __init__(self, lower_bound = None, upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-            
+class avgRankYear10(AbstractAggregateFeature):
     name = "average percent rank in percent grade per student for the third to last year of HS"
-    sql_query = '''
-        WITH tmp as(
-            SELECT
-                courses.studentid,
-                semester_taken,
-                grade_available,
-                course_number,
-                high_school_class-year_taken as yearsbeforegrad,
-                percent_rank() OVER (PARTITION BY course_number ORDER BY percent_grade) AS percrank
-            FROM courses
-            LEFT JOIN hs_enrollment ON courses.studentid=hs_enrollment.studentid
-        )
-        SELECT studentid as studentid, avg(percrank) as avgrankyear10
-        FROM tmp
-        where yearsbeforegrad=2 and semester_taken!=3 {}
-        GROUP BY studentid
-    '''
+    source = COURSES_RANK_SOURCE
+    aggregate = "avg(percrank){filter}"
+    condition = "yearsbeforegrad=2 and semester_taken!=3"
     index_col = "studentid"
     feature_col = "avgrankyear10"
     feature_type = "numerical"
@@ -1175,12 +950,12 @@ class avgRankYear10(AbstractBoundedFeature):
 #  Standardized Tests
 # =======================================
 
-class highestCompositeACT(AbstractBoundedFeature):
-    def __init__(self, lower_bound=None,upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-
+class highestCompositeACT(AbstractAggregateFeature):
     name = "highest act score achieved"
-    sql_query= "select studentid, max(score_composite) as max_composite_act_score from acttests where test_level = 'ACT' {} group by studentid"
+    source = "select studentid, date, score_composite, test_level from acttests"
+    aggregate = "max(score_composite){filter}"
+    condition = "test_level = 'ACT'"
+    cumulative = [('max', 'score_composite')]
     index_col="studentid"
     feature_col="max_composite_act_score"
     feature_type = "numerical"
@@ -1193,12 +968,13 @@ class highestCompositeACT(AbstractBoundedFeature):
 #  Contact Features
 # =======================================
 
-class totalNumberofContacts(AbstractBoundedFeature):
-    def __init__(self, lower_bound=None,upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
+CONTACTS_SOURCE = "select studentid, contact_date, contact_medium, was_successful, initiated_by_student, counselor_id from contacts"
 
+class totalNumberofContacts(AbstractAggregateFeature):
     name = "total number of counselor contact events"
-    sql_query= "select studentid , count(*) as num_contacts from contacts {} group by studentid"
+    source = CONTACTS_SOURCE
+    aggregate = "count(*){filter}"
+    cumulative = [('count', None)]
     index_col="studentid"
     feature_col="num_contacts"
     feature_type = "numerical"
@@ -1207,12 +983,12 @@ class totalNumberofContacts(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col ='contact_date'
 
-class numberContactsInitiatedByStudent(AbstractBoundedFeature):
-    def __init__(self, lower_bound=None,upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-
+class numberContactsInitiatedByStudent(AbstractAggregateFeature):
     name = "total number of contact events initiated by student"
-    sql_query= "select studentid , count(*) as student_initiated_contacts from contacts where initiated_by_student = True {} group by studentid"
+    source = CONTACTS_SOURCE
+    aggregate = "count(*){filter}"
+    condition = "initiated_by_student = True"
+    cumulative = [('count', None)]
     index_col="studentid"
     feature_col="student_initiated_contacts"
     feature_type = "numerical"
@@ -1221,12 +997,12 @@ class numberContactsInitiatedByStudent(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col ='contact_date'
 
-class numberUnsuccessfulContacts(AbstractBoundedFeature):
-    def __init__(self, lower_bound=None,upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-
+class numberUnsuccessfulContacts(AbstractAggregateFeature):
     name = "total number of unsuccessful contact events"
-    sql_query= "select studentid , count(*) as total_unsuccessful_contacts from contacts where was_successful = False {} group by studentid"
+    source = CONTACTS_SOURCE
+    aggregate = "count(*){filter}"
+    condition = "was_successful = False"
+    cumulative = [('count', None)]
     index_col="studentid"
     feature_col="total_unsuccessful_contacts"
     feature_type = "numerical"
@@ -1235,12 +1011,12 @@ class numberUnsuccessfulContacts(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col ='contact_date'
 
-class mediumOfLastSuccessfulContact(AbstractBoundedFeature):
-    def __init__(self, lower_bound=None,upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-
+class mediumOfLastSuccessfulContact(AbstractAggregateFeature):
     name = "contact medium of last successful contact"
-    sql_query= "select distinct on (studentid) studentid, contact_medium as last_contact_medium from contacts where was_successful = True {} order by studentid, contact_date desc"
+    source = CONTACTS_SOURCE
+    aggregate = "(array_agg(contact_medium order by contact_date desc){filter})[1]"
+    condition = "was_successful = True"
+    cumulative = [('last', 'contact_medium')]
     index_col="studentid"
     feature_col="last_contact_medium"
     feature_type = "numerical"
@@ -1248,12 +1024,11 @@ class mediumOfLastSuccessfulContact(AbstractBoundedFeature):
     index_level = "studentid"
     bound_col ='contact_date'
 
-class numberOfCounselors(AbstractBoundedFeature):
-    def __init__(self, lower_bound=None,upper_bound = None):
-        AbstractBoundedFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-
+class numberOfCounselors(AbstractAggregateFeature):
     name = "number of different people contacting a student"
-    sql_query= "select count(distinct(counselor_id)) as number_counselors, studentid from contacts {} group by studentid"
+    source = CONTACTS_SOURCE
+    aggregate = "count(distinct counselor_id){filter}"
+    cumulative = [('distinct', 'counselor_id')]
     index_col="studentid"
     feature_col="number_counselors"
     feature_type = "numerical"
@@ -1370,18 +1145,30 @@ class IsFirstEnrollment(AbstractFeature):
 # per school: avg. number of tardy events for one student
 
 
-class YearlyAvgAttendance(AbstractBoundedPandasFeature):
+ATTENDANCE_SOURCE = '''
+            select attendance.studentid,
+                   attendance_date,
+                   attendance_type,
+                   high_school_class-school_year as yearsbeforegrad
+            from attendance
+            left join hs_enrollment ON hs_enrollment.studentid = attendance.studentid
+        '''
+
+class YearlyAvgAttendance(AbstractAggregateFeature):
 
-    sql_query = 'this will be overwritten in a second - hackyhacky'
     index_col="studentid"
-    feature_col="count, yearsbeforegrad, attendance_type"
+    feature_col = 'this will be overwritten by the class name'
     feature_type = "numerical"
-    postprocessors = {}
     index_level = "studentid"
     bound_col ='attendance_date'
     name = "avgerage yearly absences per student"
     postprocessors = {pp.fillNullWithZero:
                     {}}
+    source = ATTENDANCE_SOURCE
+    # the average over the (year, attendance type) groups of their number of events is the
+    # number of events divided by the number of groups with events
+    aggregate = "cast(count(*){filter} as float) / count(distinct yearsbeforegrad || ':' || attendance_type){filter}"
+    cumulative = [('count', None), ('distinct', "yearsbeforegrad || ':' || attendance_type")]
 
     def __init__(self, lower_bound=None,upper_bound = None,
                 attendance_type_list = ['tardy','unexcused','suspended','excused','early_dismissal'],
@@ -1397,40 +1184,17 @@ class YearlyAvgAttendance(AbstractBoundedPandasFeature):
         self.attendance_type_list = attendance_type_list
         self.yearsbeforegrad_list = yearsbeforegrad_list
 
-        self.sql_query = '''
-            with tmp as (
-                select attendance.studentid,
-                       count(attendance_type),
-                       attendance_type,
-                       high_school_class-school_year as yearsbeforegrad
-                from attendance
-                left join hs_enrollment ON hs_enrollment.studentid = attendance.studentid
-                where attendance_type in (%s)
-                and high_school_class-school_year in (%s)
-                {}
-                group by attendance.studentid, yearsbeforegrad, attendance_type
-            )
-            select studentid, avg(count)
-            from tmp
-            group by studentid
-            '''%( ','.join("'{0}'".format(x) for x in self.attendance_type_list),
+        self.condition = 'attendance_type in (%s) and yearsbeforegrad in (%s)' %(
+                  ','.join("'{0}'".format(x) for x in self.attendance_type_list),
                   ','.join(map(str,self.yearsbeforegrad_list))
                  )
+        # the column keeps the case of the class name, see sql_column
+        self.feature_col = self.__class__.__name__
 
-        AbstractBoundedPandasFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
-        
-    def process(self):
+        AbstractAggregateFeature.__init__(self, lower_bound=lower_bound, upper_bound=upper_bound)
 
-        # rearrange values into columns
-        # self.rows = self.rows.set_index(['studentid','attendance_type'])
-        self.rows = self.rows.set_index(['studentid'])
-        # self.rows = self.rows.unstack(['attendance_type']).fillna(0)
-        self.rows = self.rows.fillna(0)
-        self.rows = self.rows.rename(columns={'avg':self.__class__.__name__})
-
-        # flatten and rename the hierarchical columns
-        # self.rows.columns = ['_'.join(map(str,col)).strip('_ ') for col in self.rows.columns.values]
-        self.rows = self.rows.reset_index()
+    def combine_cumulative(self, values):
+        return values[0].astype(float) / values[1]
 
 
 class TotalAttendance(AbstractBoundedPandasFeature):
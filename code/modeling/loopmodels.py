@@ -13,12 +13,35 @@ import yaml
 import itertools
 import pandas as pd
 import argparse
+import multiprocessing
 
 from config import PERSISTENCE_PATH
+from util.SQL_helpers import use_embedded_engine
 import modeling.models.all_models as am
-from modeling.featurepipeline.dataloader import DataLoader
+from modeling.featurepipeline.dataloader import DataLoader, SweepDataLoader
+from modeling.featurepipeline.featurecache import FeatureCache
 from modeling.featurepipeline.experiment import Experiment
 
+# the dataloader and config of the current window, for the experiment worker processes: set before the
+# pool is forked, so that the workers inherit them (and the dataloader's shared feature matrices)
+WINDOW = {}
+
+def run_experiment_job(job):
+	'''Runs one (model, parameters, feature list) experiment of the current window in a worker process'''
+
+	modelname, params, featurelist = job
+	dload, cfg = WINDOW['dload'], WINDOW['cfg']
+
+	m = getattr(am,modelname)(**params)
+	e = Experiment(model=m, feature_list=featurelist, 
+				   dloader=dload, id=None,nan_handling=cfg['nan_handling'],
+				   logFolder=cfg['logFolder'], looplog=cfg['looplog'],
+				   summary_only=cfg['summary_only'])
+	e.run_experiment()
+
+	# the summary row of the experiment, see tmp
+	return [e.auc, e.auc_train, featurelist]
+
 if __name__ == '__main__':
 
 	# set display
@@ -29,6 +52,8 @@ if __name__ == '__main__':
 					    help='Path to YAML config relative to project directory.',
 					    const='code/modeling/configs/default.yaml',nargs='?',
 					    default='code/modeling/configs/default.yaml')
+	parser.add_argument('--workers', type=int, default=1,
+						help='Number of processes that run the experiments of each window in parallel.')
 	args = parser.parse_args()
 	configFile =  args.configFile
 	print "Config file: ", configFile
@@ -48,24 +73,94 @@ if __name__ == '__main__':
 	if type(cfg['sample']) == type([]):
 		if None in cfg['sample']: cfg['sample'].remove(None)
 
+	# set up the on-disk feature cache if one is configured; it is shared by all the dataloaders below
+	if cfg.get('feature_cache') != None:
+		cache = FeatureCache(cache_folder=os.path.join(PERSISTENCE_PATH, cfg['feature_cache']['folder']),
+							 max_bytes=cfg['feature_cache'].get('max_size_mb', 2048)*1024**2,
+							 data_version=cfg['feature_cache'].get('data_version'))
+	else:
+		cache = None
+
+	# run all queries on the in-process engine over a columnar export of the database instead of Postgres
+	if cfg.get('embedded_engine') != None:
+		use_embedded_engine(os.path.join(PERSISTENCE_PATH, cfg['embedded_engine']))
+
+	# dataloader snapshots, one file per window: saved after loading each window from the database ('save'),
+	# or loaded instead of querying the database at all ('load')
+	snapshots = cfg.get('snapshots')
+	if snapshots != None:
+		if snapshots.get('mode') not in ['save', 'load']:
+			raise ValueError("snapshots: mode must be either 'save' or 'load'")
+		snapshot_folder = os.path.join(PERSISTENCE_PATH, snapshots['folder'])
+		if not os.path.isdir(snapshot_folder):
+			os.makedirs(snapshot_folder)
+
+	# one summary row per experiment, filled by both the sequential and the worker path
 	tmp = pd.DataFrame(columns=['AUC','AUC_train','features'])
 	# rowIdx = 0
 
-	# loop over the dates
+	# the (train_start, split_date, test_end) of every window
+	windows = []
 	for train_start in splitdates:
-
-
 		split_date = train_start + pd.DateOffset(months=cfg['train_period_months'])
 		test_end = split_date + pd.DateOffset(months=cfg['test_period_months'])
+		windows.append((str(train_start.date()), str(split_date.date()), str(test_end.date())))
+
+	# if configured, fetch the target for all windows at once and slice the windows out of it
+	sweep = None
+	if cfg.get('sweep_load') and (snapshots == None or snapshots['mode'] != 'load'):
+		sweep = SweepDataLoader(target=cfg['target'], feature_list=allfeatures,
+								restrictors=cfg['sample'], windows=windows,
+								schema='common', cache=cache,
+								workers=cfg.get('query_workers', 1),
+								fetch=cfg.get('fetch', 'read_sql'),
+								static_features=cfg.get('static_features', False),
+								profile=cfg.get('profile_queries', False),
+								asof=cfg.get('asof_features', False),
+								compact=cfg.get('compact_dtypes', False))
 
-		# get the data for this period
-		dload = DataLoader(target=cfg['target'], feature_list=allfeatures,
-						  restrictors=cfg['sample'],
-						  split_date=str(split_date.date()),
-						  train_start=str(train_start.date()),
-						  test_end=str(test_end.date()),
-						  schema='common')
+	# loop over the dates
+	for train_start, split_date, test_end in windows:
 
+		if snapshots != None:
+			snapshot_path = os.path.join(snapshot_folder, 'dataloader_%s_%s_%s.npz' %(train_start, split_date, test_end))
+
+		# get the data for this period
+		if snapshots != None and snapshots['mode'] == 'load':
+			dload = DataLoader(target=cfg['target'], feature_list=allfeatures,
+							  restrictors=cfg['sample'],
+							  split_date=split_date,
+							  train_start=train_start,
+							  test_end=test_end,
+							  schema='common',
+							  snapshot=snapshot_path)
+		elif cfg.get('sweep_load'):
+			dload = sweep.window(train_start=train_start, split_date=split_date, test_end=test_end)
+		else:
+			dload = DataLoader(target=cfg['target'], feature_list=allfeatures,
+							  restrictors=cfg['sample'],
+							  split_date=split_date,
+							  train_start=train_start,
+							  test_end=test_end,
+							  schema='common',
+							  cache=cache,
+							  workers=cfg.get('query_workers', 1),
+							  fetch=cfg.get('fetch', 'read_sql'),
+							  static_features=cfg.get('static_features', False),
+							  profile=cfg.get('profile_queries', False),
+							  explain=cfg.get('explain_megaquery', False),
+							  broadcast=cfg.get('broadcast_features', False),
+							  compact=cfg.get('compact_dtypes', False))
+
+		if cache != None:
+			print cache.summary()
+
+		if snapshots != None and snapshots['mode'] == 'save':
+			dload.save_snapshot(snapshot_path)
+
+
+		# with several workers, the experiments of the window are collected first, and then run by a process pool
+		jobs = []
 
 		# loop over models
 		for model in cfg['models']:
@@ -131,6 +226,10 @@ if __name__ == '__main__':
 
 							print "Features: \n\t%s"%'\n\t'.join(featurelist)
 
+							if args.workers > 1:
+								jobs.append((modelname, thispdict, featurelist))
+								continue
+
 							m = getattr(am,modelname)(**thispdict)
 							e = Experiment(model=m, feature_list=featurelist, 
 										   dloader=dload, id=None,nan_handling=cfg['nan_handling'],
@@ -138,6 +237,7 @@ if __name__ == '__main__':
 										   summary_only=cfg['summary_only'])
 
 							e.run_experiment()
+							tmp.loc[len(tmp)] = [e.auc, e.auc_train, featurelist]
 
 							# tmp[(tuple(featurelist)] = (e.auc, e.auc_train)
 							# tmp.loc[rowIdx] = [e.auc,e.auc_train,featurelist]
@@ -159,4 +259,25 @@ if __name__ == '__main__':
 							del e
 							del m
 						
-						# tmp.to_csv(PERSISTENCE_PATH+'/modeling_logs/auc_tracker.csv',index=False,header=True)	
+						# tmp.to_csv(PERSISTENCE_PATH+'/modeling_logs/auc_tracker.csv',index=False,header=True)
+
+		if len(jobs) > 0:
+			print "Running %d experiments in %d worker processes" %(len(jobs), args.workers)
+			dload.share_matrices()
+			# fit and apply the postprocessors of all columns once, instead of once in every worker
+			pps = dict((c, p) for c, p in dload.get_postprocessors(allfeatures).items() if len(p) > 0)
+			dload.postprocessed_columns(pps, 'train')
+			dload.postprocessed_columns(pps, 'test')
+			WINDOW['dload'] = dload
+			WINDOW['cfg'] = cfg
+			pool = multiprocessing.Pool(args.workers)
+			try:
+				for row in pool.map(run_experiment_job, jobs, chunksize=1):
+					tmp.loc[len(tmp)] = row
+			finally:
+				pool.close()
+				pool.join()
+
+	# the connections the sweep kept open for all windows
+	if sweep != None:
+		sweep.close_pool()
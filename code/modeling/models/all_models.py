@@ -1,15 +1,16 @@
 __author__ = 'Team'
 
-from sklearn.linear_model import LogisticRegression as scikitLR
-from sklearn.linear_model import SGDClassifier as scikitSGD
-from sklearn.ensemble import RandomForestClassifier as scikitRF
-from sklearn.ensemble import ExtraTreesClassifier as scikitET
-from sklearn.ensemble import AdaBoostClassifier as scikitAB
-from sklearn.tree import DecisionTreeClassifier as scikitDTC
-from sklearn.svm import SVC as scikitSVC
-from sklearn.ensemble import GradientBoostingClassifier as scikitGBC
-from sklearn.naive_bayes import GaussianNB as scikitGNB
-from sklearn.neighbors import KNeighborsClassifier as scikitKNN
+# scikit estimators by dotted path: ScikitModel imports each one only when a model that uses it is created
+scikitLR = 'sklearn.linear_model.LogisticRegression'
+scikitSGD = 'sklearn.linear_model.SGDClassifier'
+scikitRF = 'sklearn.ensemble.RandomForestClassifier'
+scikitET = 'sklearn.ensemble.ExtraTreesClassifier'
+scikitAB = 'sklearn.ensemble.AdaBoostClassifier'
+scikitDTC = 'sklearn.tree.DecisionTreeClassifier'
+scikitSVC = 'sklearn.svm.SVC'
+scikitGBC = 'sklearn.ensemble.GradientBoostingClassifier'
+scikitGNB = 'sklearn.naive_bayes.GaussianNB'
+scikitKNN = 'sklearn.neighbors.KNeighborsClassifier'
 
 from modeling.featurepipeline.scikitmodel import *
 
@@ -80,7 +81,7 @@ class AdaBoost(ScikitModel):
 
 	def __init__(self, **params):
 
-		params['base_estimator'] = scikitDTC(max_depth=1)
+		params['base_estimator'] = scikit_estimator(scikitDTC)(max_depth=1)
 		ScikitModel.__init__(self,scikit_class=scikitAB,**params)
 
 	def coefs(self):
@@ -0,0 +1,19 @@
+'''
+Tests of the modeling pipeline that run without a database: synthetic rows stand in for query results,
+or a small columnar export is queried on the embedded engine (see tests/export.py; skipped without duckdb).
+Run them from the code folder with
+	python -m unittest discover -s tests -t .
+'''
+
+import sys
+import types
+
+# run_project.sh writes util/cred.py from config.sh; the tests never connect, so any credentials do
+try:
+	from util import cred
+except ImportError:
+	import util
+	cred = types.ModuleType('util.cred')
+	cred.host = cred.user = cred.pw = cred.dbname = 'test'
+	sys.modules['util.cred'] = cred
+	util.cred = cred
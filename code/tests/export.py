@@ -0,0 +1,66 @@
+'''
+A small columnar export of the database (see etl/uploaders/export_columnar.py), for the tests that run
+the pipeline on the embedded engine of util/embedded_engine.py. These are skipped without duckdb.
+'''
+
+import os
+import json
+import datetime
+import pandas as pd
+
+from etl.uploaders.export_columnar import write_parquet
+from util.embedded_engine import MANIFEST, table_path
+
+try:
+	import duckdb
+except ImportError:
+	duckdb = None
+
+d = datetime.date
+
+# schema -> table -> (columns as (name, DuckDB type), rows as read_sql_copy gives them)
+TABLES = {'common': {
+	'students': ([('studentid', 'INTEGER'), ('date_of_birth', 'DATE'), ('is_female', 'BOOLEAN'), ('ethnicity', 'VARCHAR')],
+				 [(1, d(1992, 3, 1), True, 'hispanic'), (2, d(1992, 11, 20), False, 'black'), (3, d(1993, 6, 30), None, 'hispanic'),
+				  (4, d(1993, 1, 15), True, None), (5, d(1994, 8, 9), False, 'white'), (6, None, True, 'black')]),
+	'enrollments': ([('enrollid', 'INTEGER'), ('studentid', 'INTEGER'), ('collegeid', 'INTEGER'), ('start_date', 'DATE'),
+					 ('degree_subject', 'VARCHAR')],
+					[(10, 1, 100, d(2010, 8, 25), 'Biology'), (11, 1, 101, d(2012, 1, 10), 'History'),
+					 (12, 2, 100, d(2011, 8, 28), None), (13, 3, 102, d(2012, 8, 20), 'Nursing'),
+					 (14, 4, 101, d(2013, 1, 7), 'Biology'), (15, 5, 100, d(2013, 8, 26), 'History'),
+					 (16, 6, 102, d(2014, 8, 25), 'Art'), (17, 2, 102, d(2014, 1, 12), 'Nursing')]),
+	'enrollment_dummies': ([('enrollid', 'INTEGER'), ('studentid', 'INTEGER'), ('collegeid', 'INTEGER'), ('persist_1_halfyear', 'BOOLEAN')],
+						   [(10, 1, 100, True), (11, 1, 101, False), (12, 2, 100, True), (13, 3, 102, None),
+							(14, 4, 101, True), (15, 5, 100, False), (16, 6, 102, True), (17, 2, 102, True)]),
+	'hs_enrollment': ([('studentid', 'INTEGER'), ('high_school_class', 'INTEGER'), ('schoolid', 'INTEGER'), ('end_date', 'DATE')],
+					  [(1, 2010, 1, d(2009, 6, 1)), (1, 2010, 2, d(2010, 6, 10)), (2, 2011, 1, d(2011, 6, 12)),
+					   (3, 2012, 2, d(2012, 6, 8)), (4, 2012, 1, d(2012, 6, 8)), (5, 2013, 2, d(2013, 6, 7)),
+					   (6, None, 1, d(2014, 6, 6))]),
+	'schools': ([('schoolid', 'INTEGER'), ('name', 'VARCHAR')],
+				[(1, 'Noble Street'), (2, 'Rauner')]),
+	'contacts': ([('studentid', 'INTEGER'), ('contact_date', 'DATE'), ('contact_medium', 'VARCHAR'), ('was_successful', 'BOOLEAN'),
+				  ('initiated_by_student', 'BOOLEAN'), ('counselor_id', 'INTEGER')],
+				 [(1, d(2010, 9, 1), 'Phone', True, False, 7), (1, d(2011, 2, 3), 'Email', False, True, 8),
+				  (1, d(2012, 9, 5), 'Phone', True, None, 7), (2, d(2011, 10, 2), 'Text', None, True, 8),
+				  (2, d(2013, 3, 4), 'Phone', True, False, None), (3, d(2012, 11, 30), 'Email', False, False, 9),
+				  (4, d(2013, 4, 1), 'Phone', True, True, 7), (5, d(2013, 10, 10), 'Text', True, False, 9),
+				  (5, d(2014, 2, 2), 'Text', False, True, 8), (6, d(2014, 12, 1), 'Email', True, False, 7)]),
+}}
+
+
+def write_export(folder, tables=TABLES):
+	'''Write tables to folder like export_columnar.main writes the tables of the database'''
+
+	engine = duckdb.connect()
+	manifest = {'exported_at': '2016-08-01 12:00:00', 'schemas': {}}
+	for schema in tables:
+		manifest['schemas'][schema] = {}
+		os.makedirs(os.path.join(folder, schema))
+		for table, (columns, rows) in tables[schema].items():
+			frame = pd.DataFrame(rows, columns=[name for name, duckdb_type in columns])
+			write_parquet(engine, frame, columns, table_path(folder, schema, table))
+			manifest['schemas'][schema][table] = {'rows': len(rows), 'columns': columns}
+	engine.close()
+
+	with open(os.path.join(folder, MANIFEST), 'w') as f:
+		json.dump(manifest, f, indent=2)
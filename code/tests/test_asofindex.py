@@ -0,0 +1,80 @@
+import sqlite3
+import datetime
+import unittest
+import numpy as np
+import pandas as pd
+
+from modeling.featurepipeline.asofindex import AsOfIndex
+
+
+class AsOfIndexTest(unittest.TestCase):
+	'''The lookups of an AsOfIndex against the grouped queries over the events they stand in for'''
+
+	def setUp(self):
+		random = np.random.RandomState(1)
+		start = datetime.date(2012, 1, 1)
+
+		events = []
+		for student in range(1, 41):
+			# one event per student and day, so that the last event before a date is well defined
+			for day in random.choice(900, random.randint(0, 12), replace=False):
+				value = random.randint(0, 5) if random.rand() > 0.2 else None
+				events.append((student, start + datetime.timedelta(days=int(day)), value))
+		# events without a date are never before any date
+		events.append((1, None, 7))
+		self.events = pd.DataFrame(events, columns=['studentid', 'contactdate', 'c0'])
+		self.events['c1'] = self.events['c0']
+		self.events['c2'] = self.events['c0']
+		self.events['c3'] = self.events['c0']
+
+		self.db = sqlite3.connect(':memory:')
+		self.db.execute('create table events (studentid integer, contactdate text, value integer)')
+		self.db.executemany('insert into events values (?, ?, ?)',
+							[(s, d.isoformat() if d != None else None, v) for s, d, v in events])
+
+		self.index = AsOfIndex(self.events, 'studentid', 'contactdate',
+							   [('count', None), ('distinct', 'value'), ('max', 'value'), ('last', 'value')])
+		self.dates = [datetime.date(2011, 6, 1), start, datetime.date(2012, 1, 2), datetime.date(2012, 8, 15),
+					  datetime.date(2013, 3, 1), datetime.date(2014, 6, 19), datetime.date(2016, 1, 1)]
+
+	def tearDown(self):
+		self.db.close()
+
+	def query(self, sql, as_of):
+		rows = self.db.execute(sql, (as_of.isoformat(),)).fetchall()
+		return dict((r[0], r[1]) for r in rows)
+
+	def lookup(self, as_of, column):
+		rows = self.index.lookup(as_of)
+		return dict((i, None if pd.isnull(v) else v) for i, v in zip(rows.index, rows[column]))
+
+	def test_count(self):
+		for as_of in self.dates:
+			expected = self.query('select studentid, count(*) from events where contactdate < ? group by studentid', as_of)
+			self.assertEqual(self.lookup(as_of, 'c0'), expected)
+
+	def test_distinct(self):
+		for as_of in self.dates:
+			expected = self.query('''select studentid, count(distinct value) from events where contactdate < ?
+									 group by studentid''', as_of)
+			self.assertEqual(self.lookup(as_of, 'c1'), expected)
+
+	def test_max(self):
+		for as_of in self.dates:
+			expected = self.query('select studentid, max(value) from events where contactdate < ? group by studentid', as_of)
+			self.assertEqual(self.lookup(as_of, 'c2'), expected)
+
+	def test_last(self):
+		for as_of in self.dates:
+			expected = self.query('''
+				select studentid, value from events as e
+				where contactdate = (select max(contactdate) from events
+									 where studentid = e.studentid and contactdate < ?)''', as_of)
+			self.assertEqual(self.lookup(as_of, 'c3'), expected)
+
+	def test_unknown_kind(self):
+		self.assertRaises(ValueError, AsOfIndex, self.events, 'studentid', 'contactdate', [('sum', 'value')])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import numpy as np
+import pandas as pd
+
+from modeling.featurepipeline import curves
+
+
+def argsort_precision_top_k_percent(k, y_test, y_probs, pos_label):
+	'''ScikitModel.precision_top_k_percent before top_k_table: one full argsort per k'''
+
+	if pos_label == 0:
+		y_test = ~y_test
+	y_test = y_test.astype(float).values
+
+	ord_prob = np.argsort(y_probs,)[::-1]
+	r = int(k * len(y_test))
+	if r == 0:
+		return 0.0
+	return np.sum(y_test[ord_prob][:r]) / float(r)
+
+
+class TopKTableTest(unittest.TestCase):
+
+	def setUp(self):
+		random = np.random.RandomState(0)
+		self.y_test = pd.Series(random.rand(1000) < 0.3)
+		# distinct scores, so that the order of ties cannot differ
+		self.y_probs = random.permutation(1000) / 1000.0
+		self.ks = [0.0, 0.001, 0.05, 0.1, 0.15, 0.333, 0.5, 1.0]
+
+	def test_precision_like_argsort(self):
+		for pos_label in [0, 1]:
+			y_true = ~self.y_test if pos_label == 0 else self.y_test
+			scores = 1 - self.y_probs if pos_label == 0 else self.y_probs
+			table = curves.top_k_table(y_true, scores, self.ks)
+
+			for k in self.ks:
+				expected = argsort_precision_top_k_percent(k, self.y_test, scores, pos_label)
+				self.assertAlmostEqual(table.loc[k, 'precision'], expected)
+
+	def test_recall_and_lift(self):
+		table = curves.top_k_table(self.y_test, self.y_probs, self.ks)
+		order = np.argsort(-self.y_probs)
+		positives = self.y_test.sum()
+
+		for k in self.ks:
+			r = int(k * len(self.y_test))
+			hits = self.y_test.values[order][:r].sum()
+			self.assertEqual(table.loc[k, 'n'], r)
+			self.assertAlmostEqual(table.loc[k, 'recall'], hits / float(positives))
+			self.assertAlmostEqual(table.loc[k, 'lift'], table.loc[k, 'precision'] / (positives / 1000.0))
+
+	def test_fractions_out_of_range(self):
+		self.assertRaises(ValueError, curves.top_k_table, self.y_test, self.y_probs, [1.5])
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,162 @@
+import shutil
+import datetime
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from util.embedded_engine import translate, EmbeddedConnection
+from util.SQL_helpers import create_temp_tables, read_sql_copy
+from modeling.features import all_features as af
+from modeling.featurepipeline.abstractaggregatefeature import fused_aggregate_query
+from tests.export import TABLES, write_export, duckdb
+
+
+def table(name):
+	'''A table of the test export as a dataframe'''
+	columns, rows = TABLES['common'][name]
+	return pd.DataFrame(rows, columns=[c for c, t in columns])
+
+
+class TranslateTest(unittest.TestCase):
+	'''The dialect shims on the SQL that the features generate'''
+
+	def test_age_of_dates(self):
+		query, params = translate(af.StudentAgeAtEnrollment().generate_query())
+		self.assertIn('extract(year from age(cast(enrollments.start_date as timestamp), cast(students.date_of_birth as timestamp)))',
+					  ' '.join(query.split()))
+
+	def test_quoted_extract(self):
+		query, params = translate(af.SpringEnrollment().generate_query())
+		self.assertIn('extract(month from start_date) in (12,1,2,3,4)', ' '.join(query.split()))
+
+	def test_distinct_on(self):
+		# as a subquery of the megaquery: the order by ends with the parenthesis of the subquery
+		query, params = translate('select t.enrollid, f0.name from eligible as t left join (%s) as f0 on t.studentid = f0.studentid;'
+								  %(af.HighSchoolMostRecentlyAttended().generate_query()))
+		self.assertEqual(' '.join(query.split()),
+			'select t.enrollid, f0.name from eligible as t left join (select studentid, name from (select studentid, name, '
+			'row_number() over (partition by studentid order by studentid, end_date desc) as distinct_on_row '
+			'from hs_enrollment left join schools on hs_enrollment.schoolid = schools.schoolid) as distinct_on '
+			'where distinct_on_row = 1 ) as f0 on t.studentid = f0.studentid;')
+
+	def test_float(self):
+		query, params = translate(af.YearlyAvgAttendance(upper_bound='2013-06-01').generate_query())
+		self.assertIn('cast(count(*) as double)', query)
+		self.assertNotIn('float', query)
+
+	def test_parameters_and_no_ops(self):
+		self.assertEqual(translate("select * from t where a = %s and b like 'x%%'", ('y',)),
+						 ("select * from t where a = ? and b like 'x%'", ['y']))
+		self.assertEqual(translate('create index on eligible_x (enrollid)'), (None, None))
+		self.assertEqual(translate('analyze eligible_x'), (None, None))
+
+
+@unittest.skipIf(duckdb == None, 'the embedded engine needs duckdb')
+class EmbeddedEngineTest(unittest.TestCase):
+	'''The generated feature SQL on DuckDB, against the same computation in pandas'''
+
+	@classmethod
+	def setUpClass(cls):
+		cls.folder = tempfile.mkdtemp()
+		write_export(cls.folder)
+
+	@classmethod
+	def tearDownClass(cls):
+		shutil.rmtree(cls.folder)
+
+	def setUp(self):
+		self.connection = EmbeddedConnection(self.folder)
+		self.connection.cursor().execute('set search_path to common')
+
+	def tearDown(self):
+		self.connection.close()
+
+	def read(self, feature):
+		rows = pd.read_sql(feature.generate_query(), self.connection)
+		return rows.set_index(feature.index_col)[feature.feature_col]
+
+	def test_age_of_dates(self):
+		ages = self.read(af.StudentAgeAtEnrollment())
+
+		rows = table('enrollments').merge(table('students'), on='studentid').set_index('enrollid')
+		for enrollid, row in rows.iterrows():
+			start, birth = row['start_date'], row['date_of_birth']
+			if birth == None:
+				self.assertTrue(pd.isnull(ages[enrollid]))
+			else:
+				self.assertEqual(ages[enrollid], start.year - birth.year - ((start.month, start.day) < (birth.month, birth.day)))
+
+	def test_quoted_extract(self):
+		spring = self.read(af.SpringEnrollment())
+
+		for enrollid, start in table('enrollments').set_index('enrollid')['start_date'].items():
+			self.assertEqual(spring[enrollid], start.month in [12, 1, 2, 3, 4])
+
+	def test_distinct_on(self):
+		schools = self.read(af.HighSchoolMostRecentlyAttended())
+
+		rows = table('hs_enrollment').merge(table('schools'), on='schoolid')
+		latest = rows.sort_values('end_date').groupby('studentid')['name'].last()
+		self.assertEqual(schools.sort_index().to_dict(), latest.to_dict())
+
+	def test_fused_aggregates(self):
+		features = [af.totalNumberofContacts(upper_bound='2013-06-01'), af.numberContactsInitiatedByStudent(upper_bound='2013-06-01'),
+					af.numberUnsuccessfulContacts(upper_bound='2013-06-01'), af.numberOfCounselors(upper_bound='2013-06-01')]
+		rows = pd.read_sql(fused_aggregate_query(features), self.connection).set_index('studentid')
+
+		contacts = table('contacts')
+		contacts = contacts[contacts['contact_date'] < pd.Timestamp('2013-06-01').date()]
+		by_student = contacts.groupby('studentid')
+		expected = pd.DataFrame({'num_contacts': by_student.size(),
+								 'student_initiated_contacts': by_student['initiated_by_student'].apply(lambda x: (x == True).sum()),
+								 'total_unsuccessful_contacts': by_student['was_successful'].apply(lambda x: (x == False).sum()),
+								 'number_counselors': by_student['counselor_id'].nunique()})
+		# a feature whose condition no row of a student meets is null, like the feature on its own
+		expected['student_initiated_contacts'] = expected['student_initiated_contacts'].replace(0, np.nan)
+		expected['total_unsuccessful_contacts'] = expected['total_unsuccessful_contacts'].replace(0, np.nan)
+
+		for column in expected.columns:
+			self.assertEqual(rows[column].astype(float).sort_index().fillna(-1).tolist(),
+							 expected[column].astype(float).sort_index().fillna(-1).tolist(), column)
+
+	def test_read_sql_copy(self):
+		rows = read_sql_copy('select studentid, is_female, date_of_birth from students order by studentid;', self.connection)
+
+		self.assertEqual([type(c) for c in rows.columns], [str, str, str])
+		self.assertEqual(rows['studentid'].tolist(), [1, 2, 3, 4, 5, 6])
+		self.assertEqual(rows['is_female'].tolist()[:4], [True, False, None, True])
+		self.assertEqual(pd.to_datetime(rows['date_of_birth'])[0], pd.Timestamp('1992-03-01'))
+
+	def test_temp_tables(self):
+		tables = {'eligible_test': ("select enrollid, studentid from enrollments where start_date < '2012-01-01'", ['enrollid'])}
+		create_temp_tables(self.connection, tables)
+		create_temp_tables(self.connection, tables)
+
+		self.assertEqual(self.connection.temp_tables, set(['eligible_test']))
+		cur = self.connection.cursor()
+		cur.execute('select count(*) from eligible_test')
+		self.assertEqual(cur.fetchone()[0], 2)
+
+	def test_export_types(self):
+		cur = self.connection.cursor()
+		for name, (columns, rows) in TABLES['common'].items():
+			cur.execute("pragma table_info('common.%s')" %(name))
+			self.assertEqual([(c[1], c[2]) for c in cur.fetchall()], columns)
+
+		# nulls of every type survive the export
+		cur.execute('select studentid, is_female, date_of_birth from students where studentid in (3, 6) order by studentid')
+		self.assertEqual(cur.fetchall(), [(3, None, datetime.date(1993, 6, 30)), (6, True, None)])
+
+	def test_search_path(self):
+		self.assertRaises(ValueError, self.connection.cursor().execute, 'set search_path to model')
+
+	def test_data_version(self):
+		version = self.connection.data_version('common')
+		self.assertIn('2016-08-01 12:00:00', version)
+		self.assertIn("'students', 6)", version)
+		self.assertNotEqual(version, self.connection.data_version('features'))
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+import warnings
+import mock
+import numpy as np
+
+from modeling.featurepipeline.dataloader import DataLoader
+from modeling.featurepipeline.experiment import Experiment
+from tests.test_snapshot import fake_load_rows
+
+
+def fake_load_rows_with_gender(self, split):
+	'''fake_load_rows, plus a boolean feature right before the target: the subset of both is a view of the bool block'''
+
+	fake_load_rows(self, split)
+	for s in split:
+		getattr(self, s + '_rows').insert(0, 'is_female', [True, False, False, True])
+
+
+class ExperimentRowsTest(unittest.TestCase):
+	'''The rows of an experiment are its own once the postprocessors ran, whether any of them applies or not'''
+
+	def setUp(self):
+		with mock.patch.object(DataLoader, 'load_rows', fake_load_rows_with_gender):
+			self.dloader = DataLoader(['PersistOneSemester'], ['HSClass', 'StudentGender', 'ContactMediumPercentages'], None,
+									  split_date='2014-07-01', train_start='2011-07-01', test_end='2015-07-01')
+
+	def experiment(self, feature_list):
+		experiment = Experiment(None, feature_list, self.dloader, nan_handling='lax')
+		experiment.apply_postprocessors()
+		return experiment
+
+	def assert_writeable(self, experiment):
+		for rows in [experiment.train_rows, experiment.test_rows]:
+			rows.loc[rows.index[0], 'persist_1_halfyear'] = False
+			rows.loc[rows.index[0], 'is_female'] = False
+
+		# the rows of the dataloader, which every other experiment subsets, are left alone
+		for split in ['train', 'test']:
+			matrix = self.dloader.matrices[split].frame(['is_female', 'persist_1_halfyear'])
+			self.assertEqual(matrix.iloc[0].tolist(), [True, True])
+
+	def test_without_postprocessors(self):
+		# the columns of the experiment are a view of one block of the feature matrix
+		self.assertFalse(self.dloader.subset_data(['StudentGender'], 'train').values.flags.writeable)
+		experiment = self.experiment(['StudentGender'])
+
+		self.assertEqual(list(experiment.train_rows.columns), ['is_female', 'persist_1_halfyear'])
+		self.assert_writeable(experiment)
+
+	def test_with_postprocessors(self):
+		experiment = self.experiment(['HSClass', 'StudentGender', 'ContactMediumPercentages'])
+
+		# fillNullWithZero filled the pandas feature, so only the row without high_school_class is dropped
+		self.assertFalse(np.isnan(experiment.train_rows['phone']).any())
+		with warnings.catch_warnings():
+			warnings.simplefilter('ignore')
+			experiment.handle_NAs()
+		self.assertEqual(experiment.train_rows_dropped, 1)
+		self.assert_writeable(experiment)
+
+
+if __name__ == '__main__':
+	unittest.main()
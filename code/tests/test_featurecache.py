@@ -0,0 +1,82 @@
+import os
+import time
+import pickle
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pandas as pd
+
+from modeling.featurepipeline.featurecache import FeatureCache
+
+
+class FeatureCacheTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.rows = pd.DataFrame({'avg_gpa': [3.5, np.nan, 2.0], 'school': ['a', None, 'c'], 'ap': [1, 0, 4]},
+								 index=pd.Index([11, 12, 13], name='studentid'), columns=['avg_gpa', 'school', 'ap'])
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def cache(self, **kwargs):
+		cache = FeatureCache(self.folder, data_version='v1', **kwargs)
+		cache.stamp_from_db(None, 'common')
+		return cache
+
+	def test_round_trip(self):
+		cache = self.cache()
+		key = cache.key('select studentid, avg(gpa) as avg_gpa from grades group by studentid')
+
+		self.assertIs(cache.get(key), None)
+		cache.put(key, self.rows, 2.5)
+		rows = cache.get(key)
+
+		pd.util.testing.assert_frame_equal(rows, self.rows)
+		self.assertEqual((cache.hits, cache.misses, cache.seconds_saved), (1, 1, 2.5))
+
+	def test_keys(self):
+		cache = self.cache()
+		query = 'select studentid, avg(gpa) as avg_gpa\nfrom grades group by studentid'
+
+		# whitespace does not matter, but the schema and the data version do
+		self.assertEqual(cache.key(query), cache.key(' '.join(query.split())))
+		other = FeatureCache(self.folder, data_version='v2')
+		other.stamp_from_db(None, 'common')
+		self.assertNotEqual(cache.key(query), other.key(query))
+		other.stamp_from_db(None, 'model')
+		self.assertNotEqual(cache.key(query), other.key(query))
+
+		self.assertRaises(ValueError, FeatureCache(self.folder).key, query)
+
+	def test_eviction(self):
+		cache = self.cache()
+		cache.put('first', self.rows, 1.0)
+		cache.put('second', self.rows, 1.0)
+		size = os.path.getsize(os.path.join(self.folder, 'first.npz'))
+
+		# the first entry was used last, so the second one goes once there is only room for two
+		past = time.time() - 60
+		os.utime(os.path.join(self.folder, 'second.npz'), (past, past))
+		os.utime(os.path.join(self.folder, 'first.npz'), (past, past))
+		cache.get('first')
+		cache.max_bytes = 2 * size + size // 2
+		cache.put('third', self.rows, 1.0)
+
+		self.assertEqual(sorted(os.listdir(self.folder)), ['first.npz', 'third.npz'])
+		self.assertIs(cache.get('second'), None)
+
+	def test_pickle(self):
+		cache = self.cache()
+		cache.put('first', self.rows, 1.0)
+		cache.get('first')
+
+		restored = pickle.loads(pickle.dumps(cache))
+		self.assertEqual((restored.stamp, restored.hits), (cache.stamp, 1))
+		pd.util.testing.assert_frame_equal(restored.get('first'), self.rows)
+		self.assertEqual(restored.hits, 2)
+
+
+if __name__ == '__main__':
+	unittest.main()
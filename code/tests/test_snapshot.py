@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+import mock
+import numpy as np
+import pandas as pd
+
+from modeling.featurepipeline.dataloader import DataLoader, get_feature_object
+
+
+def synthetic_rows(split):
+	'''Rows like the megaquery and the pandas features give, with a column of every dtype a snapshot keeps'''
+
+	offset = 0 if split == 'train' else 100
+	rows = pd.DataFrame({'persist_1_halfyear': [True, False, True, True],
+						 'high_school_class': [2012.0, np.nan, 2013.0, 2012.0],
+						 'ethnicity': pd.Categorical(['a', 'b', None, 'a']),
+						 'collegeid': ['x', None, 'y', 'x'],
+						 'phone': [50.0, 0.0, np.nan, 100.0],
+						 'email': [50.0, 100.0, np.nan, 0.0]},
+						index=pd.Index(np.arange(4) + offset, name='enrollid'),
+						columns=['persist_1_halfyear', 'high_school_class', 'ethnicity', 'collegeid', 'phone', 'email'])
+	return rows
+
+
+def fake_load_rows(self, split):
+	'''DataLoader.load_rows without a database'''
+
+	for s in split:
+		setattr(self, s + '_rows', synthetic_rows(s))
+		setattr(self, s + '_megaquery', 'select enrollid from enrollments -- %s' %(s))
+		pfeatures = list(get_feature_object(x, s) for x in self.pandas_features)
+		for p_feature in pfeatures:
+			p_feature.feature_col = ['phone', 'email']
+		setattr(self, 'pandas_%sfeatures' %(s), pfeatures)
+	self.query_costs = [{'split': 'train', 'name': 'target', 'seconds': 1.5}]
+
+
+class SnapshotTest(unittest.TestCase):
+
+	def setUp(self):
+		self.folder = tempfile.mkdtemp()
+		self.path = os.path.join(self.folder, 'window.npz')
+		self.window = dict(split_date='2014-07-01', train_start='2011-07-01', test_end='2015-07-01')
+
+	def tearDown(self):
+		shutil.rmtree(self.folder)
+
+	def dataloader(self, features=['HSClass', 'StudentEthnicity', 'ContactMediumPercentages'], **kwargs):
+		window = dict(self.window, **kwargs)
+		return DataLoader(['PersistOneSemester'], features, None, **window)
+
+	def save(self):
+		with mock.patch.object(DataLoader, 'load_rows', fake_load_rows):
+			saved = self.dataloader()
+		saved.save_snapshot(self.path)
+		return saved
+
+	def test_save_and_load(self):
+		saved = self.save()
+		loaded = self.dataloader(snapshot=self.path)
+
+		for s in ['train', 'test']:
+			pd.util.testing.assert_frame_equal(getattr(loaded, s + '_rows'), getattr(saved, s + '_rows'))
+			self.assertEqual(getattr(loaded, s + '_megaquery'), getattr(saved, s + '_megaquery'))
+			self.assertEqual([p.feature_col for p in getattr(loaded, 'pandas_%sfeatures' %(s))], [['phone', 'email']])
+		self.assertEqual(loaded.query_costs, saved.query_costs)
+
+		# the loaded rows are subset like the ones from the database
+		train = loaded.subset_data(['HSClass', 'ContactMediumPercentages'], 'train')
+		self.assertEqual(sorted(train.columns), ['email', 'high_school_class', 'persist_1_halfyear', 'phone'])
+
+	def test_other_window(self):
+		self.save()
+		self.assertRaises(ValueError, self.dataloader, snapshot=self.path, test_end='2016-07-01')
+
+	def test_missing_feature(self):
+		self.save()
+		self.assertRaises(ValueError, self.dataloader, features=['HSClass', 'StudentGender'], snapshot=self.path)
+
+	def test_changed_query(self):
+		self.save()
+		m = __import__('modeling.features.all_features', fromlist=['HSClass'])
+		with mock.patch.object(m.HSClass, 'sql_query', 'select studentid, high_school_class from hs_enrollment where true'):
+			with warnings.catch_warnings(record=True) as caught:
+				warnings.simplefilter('always')
+				self.dataloader(snapshot=self.path)
+		self.assertEqual(len(caught), 1)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -0,0 +1,64 @@
+import datetime
+import unittest
+import mock
+import numpy as np
+import pandas as pd
+
+from util.SQL_helpers import read_sql_copy
+
+
+class FakeCursor(object):
+	'''psycopg2-like cursor that describes the query with description and COPYs csv'''
+
+	def __init__(self, description, csv):
+		self.description = description
+		self.csv = csv
+		self.copied = None
+
+	def execute(self, query, params=None):
+		pass
+
+	def copy_expert(self, sql, buf):
+		self.copied = sql
+		buf.write(self.csv)
+
+	def close(self):
+		pass
+
+
+class ReadSqlCopyTest(unittest.TestCase):
+
+	def read(self, description, csv):
+		cursor = FakeCursor(description, csv)
+		connection = mock.Mock()
+		connection.cursor.return_value = cursor
+		return read_sql_copy('select * from t;', connection), cursor
+
+	def test_null_marker(self):
+		rows, cursor = self.read([('name', 25)], 'name\n\n\\N\nx\n')
+
+		self.assertIn("NULL '\\N'", cursor.copied)
+		self.assertEqual(rows['name'].tolist(), ['', None, 'x'])
+
+	def test_types_like_read_sql(self):
+		description = [('id', 23), ('gpa', 1700), ('flag', 16), ('maybe', 16), ('count', 20),
+					   ('day', 1082), ('at', 1114), ('code', 1043)]
+		csv = ('id,gpa,flag,maybe,count,day,at,code\n'
+			   '1,3.5,t,f,\\N,2014-09-01,2014-09-01 10:00:00,007\n'
+			   '2,\\N,f,\\N,4,\\N,\\N,\\N\n')
+		rows, cursor = self.read(description, csv)
+
+		self.assertEqual(rows['id'].dtype, np.int64)
+		self.assertEqual(rows['gpa'].dtype, np.float64)
+		self.assertTrue(np.isnan(rows['gpa'][1]))
+		self.assertEqual(rows['flag'].dtype, np.bool_)
+		self.assertEqual(rows['maybe'].tolist(), [False, None])
+		self.assertEqual(rows['count'].dtype, np.float64)
+		self.assertEqual(rows['day'].tolist(), [datetime.date(2014, 9, 1), None])
+		self.assertEqual(rows['at'][0], pd.Timestamp('2014-09-01 10:00:00'))
+		self.assertTrue(pd.isnull(rows['at'][1]))
+		self.assertEqual(rows['code'].tolist(), ['007', None])
+
+
+if __name__ == '__main__':
+	unittest.main()
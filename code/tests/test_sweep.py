@@ -0,0 +1,60 @@
+import shutil
+import tempfile
+import unittest
+import pandas as pd
+
+from util.SQL_helpers import use_embedded_engine
+from modeling.featurepipeline.dataloader import DataLoader, SweepDataLoader
+from tests.export import write_export, duckdb
+
+
+@unittest.skipIf(duckdb == None, 'the embedded engine needs duckdb')
+class SweepTest(unittest.TestCase):
+	'''The windows of a sweep, against a DataLoader of their own, on the embedded engine'''
+
+	features = ['StudentGender', 'StudentAgeAtEnrollment', 'totalNumberofContacts', 'ContactMediumPercentages']
+	windows = [('2010-07-01', '2012-07-01', '2014-07-01'), ('2011-07-01', '2013-07-01', '2015-07-01'),
+			   ('2010-07-01', '2013-01-01', '2014-01-01')]
+
+	@classmethod
+	def setUpClass(cls):
+		cls.folder = tempfile.mkdtemp()
+		write_export(cls.folder)
+		use_embedded_engine(cls.folder)
+
+	@classmethod
+	def tearDownClass(cls):
+		use_embedded_engine(None)
+		shutil.rmtree(cls.folder)
+
+	def assert_rows_equal(self, rows, expected):
+		rows = rows.sort_index()[sorted(rows.columns)]
+		expected = expected.sort_index()[sorted(expected.columns)]
+		# the sweep queries its features over all windows, so a column with a missing value in any of them is
+		# float (or object), where the query of the window alone gives int (or bool)
+		pd.util.testing.assert_frame_equal(rows, expected, check_dtype=False)
+
+	def assert_windows(self, **kwargs):
+		sweep = SweepDataLoader(['PersistOneSemester'], self.features, None, windows=self.windows, **kwargs)
+
+		for train_start, split_date, test_end in self.windows:
+			window = sweep.window(train_start, split_date, test_end)
+			alone = DataLoader(['PersistOneSemester'], self.features, None,
+							   split_date=split_date, train_start=train_start, test_end=test_end)
+
+			self.assertTrue(len(alone.train_rows) > 0)
+			self.assert_rows_equal(window.train_rows, alone.train_rows)
+			self.assert_rows_equal(window.test_rows, alone.test_rows)
+			# the columns of the pandas feature are the same, in the rows and in the feature
+			self.assertEqual([p.feature_col for p in window.pandas_trainfeatures],
+							 [p.feature_col for p in alone.pandas_trainfeatures])
+
+	def test_windows(self):
+		self.assert_windows()
+
+	def test_windows_asof(self):
+		self.assert_windows(asof=True)
+
+
+if __name__ == '__main__':
+	unittest.main()
@@ -1,10 +1,27 @@
 ## sets up a context-managed database connection
 
 import psycopg2
+import psycopg2.pool
 import contextlib
 from sqlalchemy import create_engine
 from util import cred
+from cStringIO import StringIO
 import pandas as pd
+from util import embedded_engine
+
+# folder of the columnar export that connections go to instead of Postgres, see use_embedded_engine
+EMBEDDED_FOLDER = None
+
+
+def use_embedded_engine(folder):
+	'''
+	@description: Makes connect_to_db and connection_pool hand out connections to an in-process
+				  analytical engine over the columnar export in folder (see util/embedded_engine.py
+				  and etl/uploaders/export_columnar.py) instead of connecting to Postgres.
+				  The credentials passed to them are ignored from then on. None switches back to Postgres.
+	'''
+	global EMBEDDED_FOLDER
+	EMBEDDED_FOLDER = folder
 
 
 # set up a context manager for the database
@@ -13,6 +30,11 @@ import pandas as pd
 @contextlib.contextmanager
 def connect_to_db(host, username, pword, dbname):
 
+	if EMBEDDED_FOLDER != None:
+		with embedded_engine.connect_embedded(EMBEDDED_FOLDER) as conn:
+			yield conn
+		return
+
 	try:
 		conn = psycopg2.connect(host = host, user = username,
 								password = pword, dbname = dbname)
@@ -27,6 +49,104 @@ def connect_to_db(host, username, pword, dbname):
 		conn.close()
 
 
+def open_connection_pool(host, username, pword, dbname, size):
+	'''
+	@description: Pool of size database connections that can be shared between threads. Take a
+				  connection with pool.getconn() and hand it back with pool.putconn(conn); close
+				  all of them with pool.closeall(). The connections stay open until then, so temp
+				  tables created on a connection are still there the next time it is handed out.
+	'''
+
+	if EMBEDDED_FOLDER != None:
+		return embedded_engine.EmbeddedPool(EMBEDDED_FOLDER, size)
+	# psycopg2 closes connections handed back beyond minconn, so keep all of them
+	return psycopg2.pool.ThreadedConnectionPool(size, size, host = host, user = username,
+												password = pword, dbname = dbname)
+
+
+@contextlib.contextmanager
+def connection_pool(host, username, pword, dbname, size):
+	'''
+	@description: Context-managed open_connection_pool; all connections are closed when the context is left.
+	'''
+
+	pool = open_connection_pool(host, username, pword, dbname, size)
+	try:
+		yield pool
+	finally:
+		pool.closeall()
+
+
+
+
+# Postgres type oids (psycopg2 type codes) of the columns read_sql_copy converts, see convert_copy_column
+BOOLEAN_OIDS = [16]
+INTEGER_OIDS = [20, 21, 23]
+FLOAT_OIDS = [700, 701, 1700]
+DATE_OIDS = [1082]
+TIMESTAMP_OIDS = [1114, 1184]
+
+def read_sql_copy(query, connection, column_types={}):
+	'''
+	@description: Faster alternative to pd.read_sql for large results. Streams the result of the query
+				  through COPY (...) TO STDOUT as CSV and parses it with pandas' C parser, instead of
+				  building one python tuple per row first. The columns get the same values and dtypes
+				  as with pd.read_sql: NULL is written as \\N (so that empty strings stay strings), and
+				  every column is converted by its type in the description of the query.
+	@param query: select statement; a trailing semicolon is dropped
+	@param connection: psycopg2 connection
+	@param column_types: dictionary of column name -> feature type ('boolean', 'numerical',
+						 'categorical' or 'date'); only used by the embedded engine, which
+						 keeps categorical columns as object columns
+	@return: dataframe with one column per selected column
+	'''
+
+	if isinstance(connection, embedded_engine.EmbeddedConnection):
+		# the embedded engine hands over its columnar result directly
+		return connection.read_frame(query, column_types)
+
+	query = query.strip().rstrip(';')
+	cur = connection.cursor()
+	# COPY does not describe its result, so get the column types from an empty run of the query
+	cur.execute('select * from (%s) as q limit 0' %(query))
+	columns = [(c[0], c[1]) for c in cur.description]
+
+	buf = StringIO()
+	cur.copy_expert("COPY (%s) TO STDOUT WITH (FORMAT csv, HEADER, NULL '\\N')" %(query), buf)
+	cur.close()
+	buf.seek(0)
+
+	# a blank line is an empty string in a result of one column
+	df = pd.read_csv(buf, dtype=object, keep_default_na=False, na_values=['\\N'], skip_blank_lines=False)
+	for name, type_code in columns:
+		df[name] = convert_copy_column(df[name], type_code)
+
+	return df
+
+
+def convert_copy_column(values, type_code):
+	'''
+	@description: Converts a column of strings read by read_sql_copy to the values pd.read_sql gives
+				  for its Postgres type: numbers become int64 (float64 if there are nulls) or float64,
+				  booleans bool (True/False/None objects if there are nulls), dates datetime.date
+				  objects and timestamps datetime64. Other columns stay strings, with None for nulls.
+	'''
+
+	if type_code in INTEGER_OIDS:
+		return pd.to_numeric(values)
+	if type_code in FLOAT_OIDS:
+		return values.astype(float)
+	if type_code in TIMESTAMP_OIDS:
+		return pd.to_datetime(values)
+
+	nulls = values.isnull()
+	if type_code in BOOLEAN_OIDS:
+		values = values.map({'t': True, 'f': False})
+	elif type_code in DATE_OIDS:
+		values = pd.to_datetime(values).dt.date
+	if nulls.any():
+		return values.astype(object).where(~nulls, None)
+	return values
 
 
 def tableExists(cursor, tablename='schools', tableschema='college_persistence'):
@@ -173,4 +293,36 @@ def addDataColumnToTable(df, columns_added, constraints_added, target_table, joi
 
 
 
+def create_temp_tables(connection, tables):
+	'''
+	@description: Materializes select statements as temp tables of the session of connection,
+				  each with an index per id column and fresh planner statistics. Tables that already
+				  exist in the session are left alone, so each one is computed once per session.
+	@param tables: dictionary of table name -> (select statement, column to index or list of columns to index)
+	'''
 
+	if len(tables) == 0:
+		return
+
+	cur = connection.cursor()
+	for name in sorted(tables):
+		query, index_cols = tables[name]
+		if isinstance(connection, embedded_engine.EmbeddedConnection):
+			# the embedded engine keeps track of its temp tables, and needs no indexes or statistics on them
+			if connection.create_temp_table(name, query):
+				print 'Materializing shared table %s' %(name)
+			continue
+		if isinstance(index_cols, str):
+			index_cols = [index_cols]
+		cur.execute('select exists (select 1 from pg_class where relname = %s and relnamespace = pg_my_temp_schema())', (name,))
+		if cur.fetchone()[0]:
+			continue
+		print 'Materializing shared table %s' %(name)
+		cur.execute('create temp table %s as %s' %(name, query))
+		for index_col in index_cols:
+			cur.execute('create index on %s (%s)' %(name, index_col))
+		cur.execute('analyze %s' %(name))
+	cur.close()
+
+	# commit so that the tables outlive the transaction, e.g. when a pooled connection is rolled back
+	connection.commit()
@@ -0,0 +1,281 @@
+''' In-process analytical engine (DuckDB) over the columnar export of the database written by
+etl/uploaders/export_columnar.py, so that the modeling pipeline can run without Postgres.
+
+EmbeddedConnection and its cursors stand in for psycopg2 connections and cursors: they support
+what the pipeline uses of them (execute with %s parameters, fetchone/fetchall, description, commit,
+pd.read_sql and read_sql_copy) and translate the Postgres dialect of the generated SQL on the fly.
+DuckDB is an optional dependency; it is only imported once the engine is used.
+'''
+
+import os
+import re
+import json
+import contextlib
+import threading
+
+MANIFEST = 'manifest.json'
+
+# the connections of an EmbeddedPool share one catalog; they change it (the views of set_search_path) one at a time
+CATALOG_LOCK = threading.Lock()
+
+# Postgres statements that the embedded engine does not need: it keeps no indexes or planner statistics
+NO_OPS = re.compile(r'^\s*(create index|analyze)\b', re.IGNORECASE)
+
+# "set search_path to common": DuckDB has no search path, see EmbeddedConnection.set_search_path
+SEARCH_PATH = re.compile(r"^\s*set search_path to (\w+)\s*;?\s*$", re.IGNORECASE)
+
+# regex -> replacement, applied to every statement
+DIALECT_SHIMS = [
+	# DuckDB only explains the plan, without running the query
+	(re.compile(r"EXPLAIN \(ANALYZE, BUFFERS\)", re.IGNORECASE), "EXPLAIN"),
+	# float is a double precision number in Postgres, but a single precision one in DuckDB
+	(re.compile(r"\bas float\)", re.IGNORECASE), "as double)"),
+	(re.compile(r"::float\b", re.IGNORECASE), "::double"),
+	# extract('month' from x) -> extract(month from x)
+	(re.compile(r"\bextract\(\s*'(\w+)'\s+from\b", re.IGNORECASE), r"extract(\1 from"),
+	# age(a, b) of two dates is an interval in both, but DuckDB only defines it on timestamps
+	(re.compile(r"\bage\(([\w\.]+),\s*([\w\.]+)\)", re.IGNORECASE), r"age(cast(\1 as timestamp), cast(\2 as timestamp))"),
+	# DuckDB keeps any row of every group of distinct on (...), not the first one in the order of the order by
+	(re.compile(r"select distinct on \(([^)]*)\)(.*?)\bfrom\b(.*?)\border by\b([^;)]*)", re.IGNORECASE | re.DOTALL), lambda m: first_rows(*m.groups())),
+]
+
+
+def first_rows(keys, columns, source, order):
+	'''
+	select distinct on (keys) columns from source order by order, as the first row in that order of every value
+	of keys by row_number(). Every selected column has to be a column or have an alias.
+	'''
+
+	names = [re.split(r'\s+as\s+|\.', c.strip(), flags=re.IGNORECASE)[-1] for c in columns.split(',')]
+	return ('select %s from (select %s, row_number() over (partition by %s order by %s) as distinct_on_row from %s) as distinct_on '
+			'where distinct_on_row = 1 ' %(', '.join(names), columns.strip(), keys, order.strip(), source.strip()))
+
+
+def translate(query, params=None):
+	'''
+	Translate a Postgres statement into the DuckDB dialect.
+	:return: the statement and its parameters, or (None, None) if it is a no-op for the embedded engine
+	'''
+
+	if NO_OPS.match(query):
+		return None, None
+
+	for pattern, replacement in DIALECT_SHIMS:
+		query = pattern.sub(replacement, query)
+
+	# psycopg2 style parameters
+	if params != None:
+		query = query.replace('%s', '?').replace('%%', '%')
+		params = list(params)
+
+	return query, params
+
+
+def str_names(description):
+	'''description with the column names as utf-8 encoded str, like psycopg2 gives them on Python 2'''
+
+	if description == None:
+		return None
+	return [(c[0].encode('utf-8'),) + tuple(c[1:]) for c in description]
+
+
+def read_manifest(folder):
+	'''The manifest of an export: {'exported_at': ..., 'schemas': {schema: {table: {'rows': ..., 'columns': [[name, type], ...]}}}}'''
+
+	path = os.path.join(folder, MANIFEST)
+	if not os.path.isfile(path):
+		raise ValueError("%s is not an export of the database; run etl/uploaders/export_columnar.py first" %(folder))
+	with open(path, 'r') as f:
+		return json.load(f)
+
+
+def table_path(folder, schema, table):
+	return os.path.join(folder, schema, table + '.parquet')
+
+
+def open_database(folder):
+	'''A new in-memory DuckDB database with one view per exported table, under its original schema.
+	   The views cast the columns to their types in the manifest: Parquet files of DuckDB 0.2.9 store dates as timestamps.'''
+
+	import duckdb # optional dependency, only needed for the embedded engine
+
+	database = duckdb.connect()
+	for schema, tables in read_manifest(folder)['schemas'].items():
+		database.execute('create schema if not exists %s' %(schema))
+		for table in sorted(tables):
+			columns = ', '.join('cast("%s" as %s) as "%s"' %(name, duckdb_type, name) for name, duckdb_type in tables[table]['columns'])
+			database.execute("create view %s.%s as select %s from read_parquet('%s')" %(
+							 schema, table, columns, table_path(folder, schema, table)))
+	return database
+
+
+class EmbeddedConnection(object):
+	'''psycopg2-like connection to an in-process DuckDB database over the export in folder'''
+
+	def __init__(self, folder, database=None):
+		self.folder = folder
+		self.database = database if database != None else open_database(folder)
+		self.search_path = None
+		# names of the temp tables of this connection, see create_temp_table
+		self.temp_tables = set()
+
+	def cursor(self):
+		return EmbeddedCursor(self)
+
+	def set_search_path(self, schema):
+		'''Stand-in for "set search_path to schema": makes the tables of schema readable without
+		   their schema, as views in the default schema of DuckDB'''
+
+		tables = read_manifest(self.folder)['schemas'].get(schema)
+		if tables == None:
+			raise ValueError("The export %s has no schema %s" %(self.folder, schema))
+		if self.search_path == schema:
+			return
+
+		with CATALOG_LOCK:
+			for table in sorted(tables):
+				self.database.execute('create or replace view main.%s as select * from %s.%s' %(table, schema, table))
+		self.search_path = schema
+
+	def create_temp_table(self, name, query):
+		'''
+		Materialize query as the temp table name of this connection, unless it exists already
+		(for SQL_helpers.create_temp_tables, instead of its lookup in pg_class).
+		:return: whether the table was created
+		'''
+
+		if name in self.temp_tables:
+			return False
+		self.cursor().execute('create temp table %s as %s' %(name, query))
+		self.temp_tables.add(name)
+		return True
+
+	def data_version(self, schema):
+		'''The version of the data in schema, for the stamp of FeatureCache (which reads pg_stat_user_tables
+		   on Postgres): the export time and the row counts of the exported tables of schema'''
+
+		manifest = read_manifest(self.folder)
+		tables = manifest['schemas'].get(schema, {})
+		return str([manifest['exported_at']] + [(table, tables[table]['rows']) for table in sorted(tables)])
+
+	def read_frame(self, query, column_types={}):
+		'''The result of query as a dataframe, with the values and dtypes that read_sql_copy gives on Postgres
+		   (see SQL_helpers.convert_copy_column); the columns of column_types that are categorical are object columns'''
+
+		query, params = translate(query.strip().rstrip(';'))
+		result = self.database.execute(query)
+		description = str_names(result.description)
+		# the columns of df() are in no particular order on Python 2
+		rows = result.df()
+		rows.columns = [c.encode('utf-8') for c in rows.columns]
+		rows = rows[[c[0] for c in description]]
+
+		for name, type_code in [(c[0], c[1]) for c in description]:
+			nulls = rows[name].isnull()
+			if type_code == 'Date':
+				rows[name] = rows[name].dt.date
+			if type_code in ['bool', 'Date', 'STRING'] and nulls.any():
+				rows[name] = rows[name].astype(object).where(~nulls, None)
+		for c,t in column_types.items():
+			if t == 'categorical' and c in rows.columns:
+				rows[c] = rows[c].astype(object)
+		return rows
+
+	# DuckDB commits every statement on its own
+	def commit(self):
+		pass
+
+	def rollback(self):
+		pass
+
+	def close(self):
+		self.database.close()
+
+
+class EmbeddedCursor(object):
+	'''psycopg2-like cursor of an EmbeddedConnection'''
+
+	def __init__(self, connection):
+		self.connection = connection
+		self.description = None
+		self.rows = None
+
+	def execute(self, query, params=None):
+
+		self.description = None
+		self.rows = None
+
+		search_path = SEARCH_PATH.match(query)
+		if search_path:
+			self.connection.set_search_path(search_path.group(1))
+			return
+
+		query, params = translate(query, params)
+		if query == None:
+			return
+
+		if params != None:
+			result = self.connection.database.execute(query, params)
+		else:
+			result = self.connection.database.execute(query)
+		self.description = str_names(result.description)
+		if self.description != None:
+			self.rows = result.fetchall()
+
+	def fetchone(self):
+		return self.rows.pop(0) if self.rows else None
+
+	def fetchall(self):
+		rows, self.rows = self.rows, []
+		return rows
+
+	def close(self):
+		self.rows = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *args):
+		self.close()
+
+
+class EmbeddedPool(object):
+	'''Stand-in for psycopg2's ThreadedConnectionPool: every connection is a DuckDB cursor
+	   (a connection of its own) on one shared database. Connections that are handed back are
+	   kept for the next getconn, with their temp tables, until closeall'''
+
+	def __init__(self, folder, maxconn):
+		self.folder = folder
+		self.maxconn = maxconn
+		self.database = open_database(folder)
+		self.lock = threading.Lock()
+		self.free = []
+		self.connections = []
+
+	def getconn(self):
+		with self.lock:
+			if len(self.free) > 0:
+				return self.free.pop()
+			conn = EmbeddedConnection(self.folder, self.database.cursor())
+			self.connections.append(conn)
+			return conn
+
+	def putconn(self, conn):
+		with self.lock:
+			self.free.append(conn)
+
+	def closeall(self):
+		for conn in self.connections:
+			conn.close()
+		self.database.close()
+
+
+@contextlib.contextmanager
+def connect_embedded(folder):
+	'''Context-managed EmbeddedConnection, like SQL_helpers.connect_to_db'''
+
+	conn = EmbeddedConnection(folder)
+	try:
+		yield conn
+	finally:
+		conn.close()
@@ -80,7 +80,7 @@ if __name__ == '__main__':
 		e.model.fit(X_train=df[predictor_cols],
 					y_train=df[e.target_col])
 		actualAUC = e.model.auc(y_test=e.test_rows[e.target_col],
-						X_test = e.test_rows[predictor_cols])
+						y_probs = e.model.scores(e.test_rows[predictor_cols])[0])
 
 		# run the bootstrap
 		aucs = np.zeros(cfg['n_boot'])
@@ -92,7 +92,7 @@ if __name__ == '__main__':
 						y_train=thisdf[e.target_col])
 			# get AUC
 			thisAUC = e.model.auc(y_test=e.test_rows[e.target_col],
-						X_test = e.test_rows[predictor_cols])
+						y_probs = e.model.scores(e.test_rows[predictor_cols])[0])
 			aucs[idx] = thisAUC
 
 		aucs.sort()
@@ -10,6 +10,7 @@ import markdown
 from sklearn import metrics
 import numpy as np
 from visualizations.parameters_vs_time import tableau20
+from modeling.featurepipeline.curves import precision_recall_population
 
 def write_log(logpath, starttime, endtime, dloader, target_col, model, looplog, feature_list,
 			  train_rows_num, test_rows_num, cm, cm_plt, roc_plt, clf_report, coefs, auc, pr1_plt, pr0_plt,
@@ -260,18 +261,10 @@ def plot_roc(y_test,y_probs,ax):
     # return fig
 
 def plot_precision_recall(y_test, pos_label,y_probs,ax1, ax2):
-    y_score = y_probs[:,pos_label]  # to run the prediction, the X_test needs to be cast to float
-
-    precision_curve, recall_curve, pr_thresholds = metrics.precision_recall_curve(y_test, y_score, pos_label=pos_label)
-    precision_curve = precision_curve[:-1]
-    recall_curve = recall_curve[:-1]
-    pct_above_per_thresh = []
-    number_scored = len(y_score)
-    for value in pr_thresholds:
-      num_above_thresh = len(y_score[y_score>=value])
-      pct_above_thresh = num_above_thresh / float(number_scored)
-      pct_above_per_thresh.append(pct_above_thresh)
-    pct_above_per_thresh = np.array(pct_above_per_thresh)
+    curve = precision_recall_population(np.asarray(y_test) == pos_label, y_probs[:,pos_label])
+    pct_above_per_thresh = curve['population'].values
+    precision_curve = curve['precision'].values
+    recall_curve = curve['recall'].values
 
     # Create plot
     # fig = plt.figure()
@@ -32,6 +32,7 @@ import visualizations.cohort_log as cl
 from config import PERSISTENCE_PATH
 from modeling.featurepipeline.dataloader import DataLoader
 from modeling.featurepipeline.experiment import Experiment
+import modeling.featurepipeline.postprocessors as pp
 
 #### Input File ###############################################
 configFile = 'code/visualizations/configs/cohorts.yaml'
@@ -90,8 +91,8 @@ if __name__=='__main__':
 			# remember the columns we have right now
 			old_cols = df.columns.tolist()
 			
-			for postprocessor, kwargs in pps[key].items():
-				df = postprocessor(df, columns = [key], **kwargs)
+			# fit on (and transform) the rows of the column
+			df = pd.concat([df.drop(key, axis=1), pp.fit_postprocessors(df[key], pps[key])[1]], axis=1)
 			
 			# the postprocessors might have added columns; remember them
 			added_cols = set(df.columns.tolist()) - set(old_cols)
@@ -22,6 +22,7 @@ from config import PERSISTENCE_PATH
 from modeling.featurepipeline.dataloader import DataLoader
 from modeling.featurepipeline.experiment import Experiment
 from visualizations.parameters_vs_time import tableau20, make_log_folder, auc_plot
+import modeling.featurepipeline.postprocessors as pp
 
 sns.set(font_scale=1.5)
 
@@ -87,8 +88,8 @@ if __name__ == '__main__':
 			# remember the columns we have right now
 			old_cols = thisdf.columns.tolist()
 			
-			for postprocessor, kwargs in pps[key].items():
-				thisdf = postprocessor(thisdf, columns = [key], **kwargs)
+			# fit on (and transform) the rows of the column
+			thisdf = pd.concat([thisdf.drop(key, axis=1), pp.fit_postprocessors(thisdf[key], pps[key])[1]], axis=1)
 			
 			# the postprocessors might have added columns; remember them
 			added_cols = set(thisdf.columns.tolist()) - set(old_cols)
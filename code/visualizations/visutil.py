@@ -10,6 +10,7 @@ import os
 from config import PERSISTENCE_PATH
 from modeling.featurepipeline.dataloader import DataLoader
 from modeling.featurepipeline.experiment import Experiment
+import modeling.featurepipeline.postprocessors as pp
 
 
 def get_df(configFile='code/visualizations/configs/util.yaml'):
@@ -57,8 +58,8 @@ def get_df(configFile='code/visualizations/configs/util.yaml'):
 		# remember the columns we have right now
 		old_cols = thisdf.columns.tolist()
 		
-		for postprocessor, kwargs in pps[key].items():
-			thisdf = postprocessor(thisdf, columns = [key], **kwargs)
+		# fit on (and transform) the rows of the column
+		thisdf = pd.concat([thisdf.drop(key, axis=1), pp.fit_postprocessors(thisdf[key], pps[key])[1]], axis=1)
 		
 		# the postprocessors might have added columns; remember them
 		added_cols = set(thisdf.columns.tolist()) - set(old_cols)